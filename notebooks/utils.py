@@ -3,6 +3,8 @@ from sqlalchemy import text, inspect, MetaData
 import pandas as pd
 import networkx as nx
 
+from pyopensus.utils import network_utils
+
 # -- test
 def query_metadata(engine):
     inspector = inspect(engine)
@@ -140,15 +142,8 @@ def edgelist_c2c(engine, start_date, final_date, diag_level, mode='people'):
             edgelist:
                 pandas.DataFrame.
     '''
-    df = select_period_aih(engine, start_date, final_date, diag_level=diag_level)
-    if mode == 'people':
-        edgelist = df.groupby(["MUNIC_RES", "MUNIC_MOV"])["DIAG_CATEG"].value_counts().reset_index()
-        edgelist = pd.pivot_table(edgelist, index=["MUNIC_RES", "MUNIC_MOV"], columns="DIAG_CATEG", values="count").fillna(0)
-    elif mode == 'money':
-        edgelist = df.groupby(["MUNIC_RES", "MUNIC_MOV", "DIAG_CATEG"])["VAL_TOT"].sum().reset_index()
-        edgelist = pd.pivot_table(edgelist, index=["MUNIC_RES", "MUNIC_MOV"], columns="DIAG_CATEG", values="VAL_TOT").fillna(0)
-    edgelist["SOMA"] = edgelist.apply(sum, axis=1)
-    return edgelist
+    edges = network_utils.aggregate_edges(engine, start_date, final_date, network='c2c', diag_level=diag_level, mode=mode)
+    return network_utils.pivot_edges(edges, network_utils.EDGE_NODES['c2c'])
 
 def edgelist_services_c2c(engine, start_date, final_date):
     '''
@@ -170,15 +165,8 @@ def edgelist_c2h(engine, start_date, final_date, diag_level, mode='people'):
     '''
         ...
     '''
-    df = select_period_aih(engine, start_date, final_date, diag_level=diag_level)
-    if mode == 'people':
-        edgelist = df.groupby(["MUNIC_RES", "CNES"])["DIAG_CATEG"].value_counts().reset_index()
-        edgelist = pd.pivot_table(edgelist, index=["MUNIC_RES", "CNES"], columns="DIAG_CATEG", values="count").fillna(0)
-    elif mode == 'money':
-        edgelist = df.groupby(["MUNIC_RES", "CNES", "DIAG_CATEG"])["VAL_TOT"].sum().reset_index()
-        edgelist = pd.pivot_table(edgelist, index=["MUNIC_RES", "CNES"], columns="DIAG_CATEG", values="VAL_TOT").fillna(0)
-    edgelist["SOMA"] = edgelist.apply(sum, axis=1)
-    return edgelist
+    edges = network_utils.aggregate_edges(engine, start_date, final_date, network='c2h', diag_level=diag_level, mode=mode)
+    return network_utils.pivot_edges(edges, network_utils.EDGE_NODES['c2h'])
 
 def edgelist_services_c2h(engine, start_date, final_date):
     '''
@@ -192,10 +180,14 @@ def edgelist_services_c2h(engine, start_date, final_date):
 
 # -- Hospital2Diseases Networks (H2D)
 def edgelist_h2d(engine, start_date, final_date):
-    df = select_period_aih(engine, start_date, final_date, diag_level=3)
-    edgelist = df.groupby(["CNES"])["DIAG_CATEG"].value_counts().reset_index().rename({"count": "TOTAL"}, axis=1)
-    edgelist_ = df.groupby(["CNES", "DIAG_CATEG"])["VAL_TOT"].sum().reset_index().rename({"VAL_TOT": "VALOR_TOTAL"}, axis=1)
-    edgelist = edgelist.merge(edgelist_, on=["CNES", "DIAG_CATEG"], how="inner")
+    # -- number and total value of the admissions of each hospital and diagnosis
+    edges = { mode : network_utils.aggregate_edges(engine, start_date, final_date, network='h2d', diag_level=3, mode=mode)
+              for mode in ['people', 'money'] }
+    edgelist = edges['people'].rename({"WEIGHT": "TOTAL"}, axis=1).merge(
+        edges['money'].rename({"WEIGHT": "VALOR_TOTAL"}, axis=1), on=["CNES", "DIAG_CATEG"], how="left")
+    edgelist = edgelist.dropna(subset=["DIAG_CATEG"]).fillna({"VALOR_TOTAL": 0})
+    edgelist = edgelist.sort_values(["CNES", "TOTAL"], ascending=[True, False], kind="stable").reset_index(drop=True)
+    edgelist["TOTAL"] = edgelist["TOTAL"].astype(int)
     return edgelist
 
 # -- Hospital2HealthServices (H2HS)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import queue
+import ftplib
+import threading
+from pathlib import Path
+from collections import namedtuple
+
+from pyopensus.opensus.opensus import Opensus
+from pyopensus.opensus.manifest import DownloadManifest
+import pyopensus.utils.utils as utils
+
+DATASUS_HOST = 'ftp.datasus.gov.br'
+
+# -- unit of work for the pool: one DATASUS file. 'filename' is the name published in the
+# -- server (e.g. the parts 'PASP2401a', 'PASP2401b' of split files), when known from the index.
+DownloadJob = namedtuple('DownloadJob', ['origin', 'preffix', 'uf', 'year', 'month', 'filename'], defaults=[None])
+
+class DownloadPool:
+    '''
+        Bounded pool of independent FTP sessions to download many DATASUS files at once.
+
+        Each worker thread owns its own Opensus session (and therefore its own control
+        connection), so transfers run in parallel instead of queueing on a single
+        'baseftp'. The number of simultaneous connections to the same host is also
+        limited across pools through a per-host semaphore, to avoid being refused by
+        the DATASUS server.
+
+        Args:
+        -----
+            dest:
+                String. Output folder.
+            n_workers:
+                Integer. Number of FTP sessions running at once.
+            max_per_host:
+                Integer. Maximum number of simultaneous connections to the same host
+                (shared by all pools of the process).
+            max_retries:
+                Integer. Number of attempts for each file before marking it as failed.
+            to_dbf:
+                Bool. Whether downloaded .DBC files must be converted to DBF.
+            verbose:
+                Bool. Print the aggregated progress after each file.
+            progress_callback:
+                Callable or None. Called as 'progress_callback(job, status, stats)' after
+                each file, where 'stats' is the dictionary returned by 'progress()'.
+    '''
+    _host_slots = {}
+    _host_lock = threading.Lock()
+
+    def __init__(self, dest, n_workers=4, max_per_host=8, max_retries=3, to_dbf=False, verbose=False, progress_callback=None):
+        self.dest = dest
+        self.n_workers = n_workers
+        self.max_per_host = max_per_host
+        self.max_retries = max_retries
+        self.to_dbf = to_dbf
+        self.verbose = verbose
+        self.progress_callback = progress_callback
+
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    # ------------------ planning ------------------
+
+    @staticmethod
+    def plan(origin, ufs, years, preffixes, index=None):
+        '''
+            Build the list of jobs for every combination of preffix, UF, year and the
+            months published for each year. If a remote index is given, jobs for files
+            not published in the server are left out and split files give one job per
+            part published. Combinations pointing to the same
+            file (e.g. the UFs of SINAN, whose files are national) give a single job.
+
+            Args:
+            -----
+                origin:
+                    String. Source of the requested data.
+                ufs:
+                    List of Strings. UF strings for brazilian states.
+                years:
+                    List of Integers.
+                preffixes:
+                    List of Strings. Ignored for SIM and SINASC (use [None]).
+                index:
+                    pyopensus.opensus.remote_index.RemoteIndex or None. Index of the source.
+        '''
+        jobs, planned = [], set()
+        for preffix in preffixes:
+            for uf in ufs:
+                for year in years:
+                    for month in utils.available_months(origin, year):
+                        if index is None:
+                            filenames = [None]
+                        else:
+                            filenames = [ Path(entry['name']).stem for entry in index.lookup(preffix, uf, year, month) ]
+                        for filename in filenames:
+                            job = DownloadJob(origin.lower(), preffix, uf, int(year), month, filename)
+                            if DownloadPool.filename(job) in planned:
+                                continue
+                            planned.add(DownloadPool.filename(job))
+                            jobs.append(job)
+        return jobs
+
+    # ------------------ execution ------------------
+
+    def run(self, jobs):
+        '''
+            Download all the jobs and block until the queue is drained.
+
+            Return:
+            -------
+                stats:
+                    Dictionary. Aggregated counters (see 'progress()') plus the lists of
+                    'missing' (not found in the server) and 'failed' jobs.
+        '''
+        self._reset_stats()
+        # -- create folders beforehand so that workers do not race on them.
+        for folder in ["DBC", "DBF"]:
+            os.makedirs(os.path.join(self.dest, folder), exist_ok=True)
+
+        for job in jobs:
+            self._jobs.put(job)
+        self._stats['total'] = len(jobs)
+
+        workers = [ threading.Thread(target=self._worker, daemon=True) for n in range(min(self.n_workers, len(jobs))) ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        DownloadManifest.load(self.dest).flush()
+        return self.progress()
+
+    def progress(self):
+        '''
+            Snapshot of the aggregated progress of the pool.
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+            stats['missing'] = list(self._stats['missing'])
+            stats['failed'] = list(self._stats['failed'])
+        elapsed = time.time() - stats['start']
+        stats['elapsed'] = elapsed
+        stats['rate'] = stats['bytes']/elapsed if elapsed > 0 else 0.
+        return stats
+
+    def _reset_stats(self):
+        self._stats = {'total': 0, 'done': 0, 'bytes': 0, 'missing': [], 'failed': [], 'start': time.time()}
+
+    def _host_slot(self, host):
+        with DownloadPool._host_lock:
+            if host not in DownloadPool._host_slots:
+                DownloadPool._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return DownloadPool._host_slots[host]
+
+    def _worker(self):
+        session = None
+        slot = None
+        try:
+            while True:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+
+                status, nbytes = 'failed', 0
+                for attempt in range(self.max_retries):
+                    try:
+                        if session is None:
+                            slot = self._host_slot(DATASUS_HOST)
+                            slot.acquire()
+                            session = Opensus()
+                        nbytes = self._retrieve(session, job)
+                        status = 'done'
+                        break
+                    except ftplib.error_perm:
+                        # -- file not published in the server: no point in retrying.
+                        status = 'missing'
+                        break
+                    except utils.FTP_ERRORS:
+                        # -- drop the session and start a new one in the next attempt.
+                        session, slot = self._close_session(session, slot)
+                    except Exception:
+                        # -- not a transfer error (e.g. conversion of the file): record it and go on.
+                        status = 'failed'
+                        break
+                self._record(job, status, nbytes)
+        finally:
+            self._close_session(session, slot)
+
+    @staticmethod
+    def filename(job):
+        '''
+            Name (without extension) of the file downloaded by 'job'.
+        '''
+        if job.filename is not None:
+            return job.filename
+        return utils.build_filename(job.origin, job.preffix, job.uf, job.year, job.month)
+
+    def _retrieve(self, session, job):
+        filename = DownloadPool.filename(job)
+        preffix_folder = job.preffix if job.origin=='cnes' else None
+        # -- bytes transferred (0 when the local copy is up to date)
+        return session.retrieve_file(self.dest, job.origin, filename, preffix_folder=preffix_folder, to_dbf=self.to_dbf)
+
+    def _close_session(self, session, slot):
+        if session is not None:
+            try:
+                session.baseftp.quit()
+            except ftplib.all_errors:
+                session.baseftp.close()
+        if slot is not None:
+            slot.release()
+        return None, None
+
+    def _record(self, job, status, nbytes):
+        with self._lock:
+            self._stats['done'] += 1
+            self._stats['bytes'] += nbytes
+            if status in ['missing', 'failed']:
+                self._stats[status].append(job)
+        stats = self.progress()
+
+        if self.verbose:
+            filename = DownloadPool.filename(job)
+            print(f"[{stats['done']}/{stats['total']}] {filename}.dbc: {status} "
+                  f"({stats['bytes']/1024**2:.1f} MB, {stats['rate']/1024**2:.2f} MB/s)")
+        if self.progress_callback is not None:
+            self.progress_callback(job, status, stats)
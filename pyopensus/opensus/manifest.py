@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+
+def file_checksum(path, blocksize=1024*1024):
+    '''
+        MD5 checksum (hex string) of a local file.
+    '''
+    md5 = hashlib.md5()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(blocksize), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+class DownloadManifest:
+    '''
+        Local record of the files downloaded from the DATASUS FTP.
+
+        Each entry is keyed by the remote path of the file and stores the size and the
+        'MDTM' timestamp reported by the server at download time, together with the
+        checksum of the local copy. Before a new transfer, the current remote size and
+        timestamp are compared with the entry, so that files already in 'dest/DBC' are
+        only fetched again when DATASUS republishes them.
+
+        The manifest is kept as a JSON file inside the output folder. Use
+        'DownloadManifest.load(dest)' to get the instance shared by all sessions of the
+        process writing to the same folder.
+
+        Changes are kept in memory and the file is rewritten once 'flush_every' changes are
+        pending or 'flush_interval' seconds have passed since the last write, so that large
+        downloads do not rewrite it after every file. Pending changes are written by 'flush'
+        (or 'close', or on exit of the 'with' block and of the process). Entries lost in a
+        crash only cause the files to be checked (and downloaded) again.
+
+        Args:
+        -----
+            path:
+                String. Path to the JSON file of the manifest.
+            flush_every:
+                Integer. Maximum number of changes kept in memory.
+            flush_interval:
+                Float. Maximum time, in seconds, between writes of pending changes.
+    '''
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path, flush_every=200, flush_interval=10.):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._entries = {}
+        self._pending = 0
+        self._flushed_at = time.time()
+        if os.path.isfile(self.path):
+            with open(self.path, 'r') as fp:
+                self._entries = json.load(fp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def load(cls, dest, filename='manifest.json'):
+        '''
+            Return the manifest of the output folder 'dest', shared within the process.
+        '''
+        path = os.path.abspath(os.path.join(dest, filename))
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+                atexit.register(cls._instances[path].flush)
+            return cls._instances[path]
+
+    def get(self, remote_path):
+        with self._lock:
+            return self._entries.get(remote_path)
+
+    def is_current(self, remote_path, remote_size, remote_mdtm, local_path, verify=False):
+        '''
+            Whether the local copy of 'remote_path' matches what the server publishes now.
+
+            Args:
+            -----
+                remote_path:
+                    String. Absolute path of the file in the FTP server.
+                remote_size:
+                    Integer or None. Size reported by the server ('SIZE').
+                remote_mdtm:
+                    String or None. Modification time reported by the server ('MDTM').
+                local_path:
+                    String. Path of the local copy.
+                verify:
+                    Bool. Whether to recompute the checksum of the local copy.
+        '''
+        entry = self.get(remote_path)
+        if entry is None or entry.get('status') != 'complete':
+            return False
+        if remote_size is None or entry['size'] != remote_size:
+            return False
+        if remote_mdtm is not None and entry['mdtm'] != remote_mdtm:
+            return False
+        if not os.path.isfile(local_path) or os.path.getsize(local_path) != entry['size']:
+            return False
+        if verify and file_checksum(local_path) != entry['md5']:
+            return False
+        return True
+
+    def mark_partial(self, remote_path, remote_size, remote_mdtm, local_path):
+        '''
+            Record that a transfer of 'remote_path' started (used to discard partial files
+            of a version that was republished in the meantime).
+        '''
+        self._set(remote_path, {'size': remote_size, 'mdtm': remote_mdtm, 'md5': None,
+                                'local': os.path.abspath(local_path), 'status': 'partial'})
+
+    def mark_complete(self, remote_path, remote_size, remote_mdtm, local_path):
+        '''
+            Record a finished download, computing the checksum of the local copy.
+        '''
+        self._set(remote_path, {'size': remote_size, 'mdtm': remote_mdtm, 'md5': file_checksum(local_path),
+                                'local': os.path.abspath(local_path), 'status': 'complete'})
+
+    def flush(self):
+        '''
+            Write the pending changes to the JSON file.
+        '''
+        with self._write_lock:
+            with self._lock:
+                if self._pending == 0:
+                    return
+                entries = dict(self._entries)
+                self._pending = 0
+                self._flushed_at = time.time()
+            # -- atomic write: the manifest is never left half written.
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as fp:
+                json.dump(entries, fp, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def close(self):
+        self.flush()
+
+    def _set(self, remote_path, entry):
+        with self._lock:
+            self._entries[remote_path] = entry
+            self._pending += 1
+            due = self._pending >= self.flush_every or (time.time() - self._flushed_at) >= self.flush_interval
+        if due:
+            self.flush()
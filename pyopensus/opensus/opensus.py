@@ -5,8 +5,9 @@ import ftplib
 import datetime as dt
 from ftplib import FTP 
 
-from simpledbf import Dbf5
 from pyopensus.utils.DBFIX import DBFIX
+from pyopensus.opensus.manifest import DownloadManifest
+from pyopensus.opensus.remote_index import RemoteIndex, list_directory
 import pyopensus.utils.utils as utils
 
 class Opensus:
@@ -35,11 +36,21 @@ class Opensus:
         self.base_error = ftplib.all_errors[1]
         
     def reconnect_if_needed(self):
+        '''
+            Check the control connection and open a new one if it is broken.
+
+            Return:
+            -------
+                baseftp:
+                    ftplib.FTP. Working connection (used to resume interrupted downloads).
+        '''
         try:
             self.baseftp.pwd()
-        except self.base_error as err:
+        except ftplib.all_errors as err:
+            self.baseftp.close()
             self.baseftp = FTP(self._host)
             self.baseftp.login()
+        return self.baseftp
 
     def preffix_dictionary(self, origin : str):
         '''
@@ -87,7 +98,61 @@ class Opensus:
                 self.baseftp.cwd(self.sys_included[origin.lower()])
                 self.baseftp.retrlines('LIST')
 
-    def retrieve_file(self, dest:str, origin:str, filename:str, preffix_folder=None, to_dbf=False, to_parquet=False, verbose=False):
+    def list_files(self, origin:str, preffix_folder=None):
+        '''
+            List the files of a source directory with a single 'MLSD' (or 'NLST') command.
+
+            Args:
+            -----
+                origin:
+                    String. Source of the data (see Opensus.get_sources()).
+                preffix_folder:
+                    String or None. Subfolder of the source (e.g. the CNES preffixes).
+
+            Return:
+            -------
+                entries:
+                    Dictionary. Maps each file name to its facts ('type', 'size', 'modify').
+        '''
+        self.reconnect_if_needed()
+        if origin.lower() not in self.sys_included.keys():
+            raise Exception('System source not supported.')
+
+        path = self.sys_included[origin.lower()]
+        if preffix_folder is not None:
+            path = f"{path.rstrip('/')}/{preffix_folder}"
+        return list_directory(self.baseftp, path)
+
+    def index(self, origin:str, cache_dir=None, ttl=86400, refresh=False):
+        '''
+            Cached index of the files published for a source (see RemoteIndex).
+
+            Args:
+            -----
+                origin:
+                    String. Source of the data (see Opensus.get_sources()).
+                cache_dir:
+                    String or None. Folder where the index is stored. Default is '~/.cache/pyopensus'.
+                ttl:
+                    Integer. Time, in seconds, before the stored index is built again.
+                refresh:
+                    Bool. Whether to rebuild the index regardless of its age.
+        '''
+        if origin.lower() not in self.sys_included.keys():
+            raise Exception('System source not supported.')
+        if cache_dir is None:
+            cache_dir = Path.home().joinpath('.cache', 'pyopensus')
+
+        index = RemoteIndex(origin, os.path.join(cache_dir, f'index_{origin.lower()}.json'), ttl=ttl)
+        if refresh or index.expired:
+            self.reconnect_if_needed()
+            subfolders = None
+            if origin.lower()=='cnes':
+                subfolders = list(utils.preffix_dictionary()['cnes'].keys())
+            index.build(self.baseftp, self.sys_included[origin.lower()], subfolders=subfolders)
+        return index
+
+    def retrieve_file(self, dest:str, origin:str, filename:str, preffix_folder=None, to_dbf=False, to_parquet=False, verbose=False, use_manifest=True, to_dataset=None, typed=False, sort=False):
         '''
             Download data based on the filename and origin from one of the allowed sources.
 
@@ -107,13 +172,30 @@ class Opensus:
                 to_dbf:
                     Bool. Whether downloaded .DBC file must be converted to DBF.
                 to_parquet:
-                    Bool. Active only when 'to_dbf=True'. Whether downloaded .DBF file must be converted to PARQUET.
+                    Bool. Whether downloaded .DBC file must be converted to PARQUET. The conversion streams
+                    the decompressed records in chunks, without writing a DBF file (unless 'to_dbf=True').
                 verbose:
                     Bool. Verbose.
+                use_manifest:
+                    Bool {default = True}. Skip the transfer when the file in 'dest/DBC' matches the size
+                    and modification time currently reported by the server (see DownloadManifest).
+                to_dataset:
+                    None or String. Root folder of a hive-partitioned PARQUET dataset
+                    (system/prefix/uf/year/month) where the converted file is stored, instead of
+                    the flat 'dest/PARQUET' folder (see pyopensus.utils.dataset).
+                typed:
+                    Bool {default = False}. Write the PARQUET file with the typed schema of the data
+                    models of the file preffix: native dates and dictionary-encoded codes (see
+                    pyopensus.storage.model_schema). Preffixes without data model are kept as decoded.
+                sort:
+                    Bool {default = False}. Sort the records of the PARQUET file by the period column
+                    of the source (DT_INTER, DTOBITO or COMPET), so that the row group statistics can be
+                    used to skip periods. The whole file is held in memory while it is sorted.
 
             Return:
             -------
-                None.
+                nbytes:
+                    Integer. Number of bytes transferred (0 if the local copy was up to date).
         '''
         self.reconnect_if_needed()
         # -- check whether the source is supported.
@@ -139,27 +221,39 @@ class Opensus:
         if verbose:
             print(f'Download do arquivo {filename_dbc} ...', end='')
             
-        # -- FTP download.
-        with open(os.path.join(dest, "DBC", filename_dbc), 'wb') as fp:
-            self.baseftp.retrbinary(f'RETR {filename_dbc}', fp.write)
+        # -- FTP download (resumed from the partial file if the connection drops).
+        manifest = DownloadManifest.load(dest) if use_manifest else None
+        self.baseftp, nbytes = utils.ftp_download(self.baseftp, filename_dbc, os.path.join(dest, "DBC", filename_dbc), reconnect=self.reconnect_if_needed, manifest=manifest)
                 
         # -- conversion of DBC file to a DBF file.
+        path_to_dbc = os.path.join(dest, "DBC", filename_dbc)
         if to_dbf:
-            path_to_dbc = os.path.join(dest, "DBC", filename_dbc)
             path_to_dbf = os.path.join(dest, "DBF", filename_dbf)
             utils.dbc2dbf(path_to_dbc, path_to_dbf)
 
-            # -- conversion of DBF file to a PARQUET file (memory-efficient format).
-            if to_parquet:
-                temp_df = Dbf5(os.path.join(dest, "DBF", filename_dbf), codec='latin').to_dataframe()
-                temp_df.to_parquet(os.path.join(dest, "PARQUET", filename_+'.parquet'))
+        # -- conversion of DBC file to a PARQUET file (memory-efficient format), chunk by chunk.
+        normalizer, sort_by = None, None
+        if typed and (to_dataset is not None or to_parquet):
+            from pyopensus.storage.model_schema import ModelSchema
+            normalizer = ModelSchema.for_file(origin, filename_)
+        if sort and (to_dataset is not None or to_parquet):
+            from pyopensus.utils.parquet import SORT_COLUMNS
+            sort_by = SORT_COLUMNS.get(origin.lower())
+
+        if to_dataset is not None:
+            from pyopensus.utils.dataset import dbc_to_dataset
+            dbc_to_dataset(path_to_dbc, to_dataset, origin, normalizer=normalizer, sort_by=sort_by)
+        elif to_parquet:
+            from pyopensus.utils.parquet import dbc_to_parquet
+            dbc_to_parquet(path_to_dbc, os.path.join(dest, "PARQUET", filename_+'.parquet'), normalizer=normalizer, sort_by=sort_by)
 
         if verbose:
             print(' Feito.')
+        return nbytes
 
     
     # -- global function to handle calls
-    def retrieve_year(self, dest:str, origin:str, uf:str, year:int, preffix="RD", to_dbf=False, verbose=False):
+    def retrieve_year(self, dest:str, origin:str, uf:str, year:int, preffix="RD", to_dbf=False, verbose=False, n_workers=1, use_manifest=True):
         '''
             Download data for a given year from one of the allowed sources.
 
@@ -181,11 +275,20 @@ class Opensus:
                     Bool. Whether downloaded .DBC file must be converted to DBF.
                 verbose:
                     Bool. Verbose.
+                n_workers:
+                    Integer {default = 1}. If larger than one, the monthly files are downloaded
+                    in parallel by a pool of independent FTP sessions (see Opensus.retrieve_parallel).
+                use_manifest:
+                    Bool {default = True}. Skip files whose local copy is up to date with the server.
 
             Return:
             -------
                 None.
         '''
+        if n_workers > 1:
+            self.retrieve_parallel(dest, origin, [uf], [year], preffixes=[preffix], n_workers=n_workers, to_dbf=to_dbf, verbose=verbose)
+            return
+
         self.reconnect_if_needed()
 
         # -- check whether the source is supported.
@@ -201,15 +304,65 @@ class Opensus:
             os.mkdir(os.path.join(dest, "DBF"))
 
         # -- specify calls
+        manifest = DownloadManifest.load(dest) if use_manifest else None
         if origin.lower()=='siasus' or origin.lower()=='sihsus':
-            utils.retrieve_siasih(self.baseftp, dest, uf, year, preffix, to_dbf, verbose)
+            utils.retrieve_siasih(self.baseftp, dest, uf, year, preffix, to_dbf, verbose, reconnect=self.reconnect_if_needed, manifest=manifest)
         elif origin.lower()=='sinasc' or origin.lower()=='sim':
             print('...')
-            utils.retrieve_vital(self.baseftp, dest, origin.lower(), uf, year, to_dbf, verbose)
+            utils.retrieve_vital(self.baseftp, dest, origin.lower(), uf, year, to_dbf, verbose, reconnect=self.reconnect_if_needed, manifest=manifest)
         elif origin.lower()=='cnes':
-            utils.retrieve_cnes(self.baseftp, dest, uf, year, preffix, to_dbf, verbose)
+            utils.retrieve_cnes(self.baseftp, dest, uf, year, preffix, to_dbf, verbose, reconnect=self.reconnect_if_needed, manifest=manifest)
         elif origin.lower()=='sinan':
-            utils.retrieve_sinan(self.baseftp, dest, year, preffix, to_dbf, verbose)
+            utils.retrieve_sinan(self.baseftp, dest, year, preffix, to_dbf, verbose, reconnect=self.reconnect_if_needed, manifest=manifest)
         else:
             pass
-            
+        if manifest is not None:
+            manifest.flush()
+
+    def retrieve_parallel(self, dest:str, origin:str, ufs:list, years:list, preffixes=None, n_workers=4, max_per_host=8, to_dbf=False, verbose=False, use_index=True):
+        '''
+            Download every (preffix, uf, year, month) file of a source using a bounded pool
+            of independent FTP sessions.
+
+            Args:
+            -----
+                dest:
+                    String. Output folder.
+                origin:
+                    String. Source of the requested data.
+                ufs:
+                    List of Strings. UF strings for brazilian states.
+                years:
+                    List of Integers. Years referring to the requested data.
+                preffixes:
+                    List of Strings or None. Preffixes of the data for the source. Not used
+                    for SIM and SINASC.
+                n_workers:
+                    Integer. Number of FTP sessions running at once.
+                max_per_host:
+                    Integer. Maximum number of simultaneous connections to the DATASUS host.
+                to_dbf:
+                    Bool. Whether downloaded .DBC files must be converted to DBF.
+                verbose:
+                    Bool. Print the aggregated progress after each file.
+                use_index:
+                    Bool {default = True}. Plan only the files listed in the cached remote index of
+                    the source (see Opensus.index), instead of trying every month.
+
+            Return:
+            -------
+                stats:
+                    Dictionary. Aggregated counters of the download, including the lists of
+                    missing and failed jobs.
+        '''
+        from pyopensus.opensus.download_pool import DownloadPool
+
+        if origin.lower() not in self.sys_included.keys():
+            raise Exception('System source not supported.')
+        if preffixes is None:
+            preffixes = [None]
+
+        index = self.index(origin) if use_index else None
+        jobs = DownloadPool.plan(origin, ufs, years, preffixes, index=index)
+        pool = DownloadPool(dest, n_workers=n_workers, max_per_host=max_per_host, to_dbf=to_dbf, verbose=verbose)
+        return pool.run(jobs)
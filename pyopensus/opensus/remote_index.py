@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import ftplib
+from pathlib import Path
+
+import pyopensus.utils.utils as utils
+
+def list_directory(baseftp, path):
+    '''
+        List the entries of a FTP directory with a single command.
+
+        'MLSD' is used when the server supports it, returning the type, size and
+        modification time of each entry. Otherwise, it falls back to 'NLST', which
+        only provides the names.
+
+        Return:
+        -------
+            entries:
+                Dictionary. Maps the name of each entry to its facts ('type', 'size', 'modify').
+    '''
+    try:
+        entries = {}
+        for name, facts in baseftp.mlsd(path, facts=['type', 'size', 'modify']):
+            if facts.get('type') in ['cdir', 'pdir']:
+                continue
+            size = facts.get('size')
+            entries[name] = {'type': facts.get('type'), 'size': int(size) if size is not None else None,
+                             'modify': facts.get('modify')}
+        return entries
+    except ftplib.error_perm:
+        names = baseftp.nlst(path)
+        return { Path(name).name : {'type': None, 'size': None, 'modify': None} for name in names }
+
+class RemoteIndex:
+    '''
+        Cached index of the files published by DATASUS for one of the sources of 'Opensus.sys_included'.
+
+        The index is built from one listing ('MLSD', or 'NLST' as fallback) per directory of
+        the source and is kept on disk as JSON. It is reused while younger than 'ttl' seconds,
+        so that job planners can check which (preffix, uf, year, month) files exist, and how
+        big they are, without issuing 'RETR' commands that fail.
+
+        Args:
+        -----
+            origin:
+                String. Source of the data (key of 'Opensus.sys_included').
+            path:
+                String. Path to the JSON file storing the index.
+            ttl:
+                Integer. Time, in seconds, for which the stored index is considered valid.
+    '''
+    def __init__(self, origin, path, ttl=86400):
+        self.origin = origin.lower()
+        self.path = path
+        self.ttl = ttl
+        self.created_at = 0.
+        self._files = {}
+
+        if os.path.isfile(self.path):
+            with open(self.path, 'r') as fp:
+                content = json.load(fp)
+            self.created_at = content['created_at']
+            self._files = content['files']
+
+    @property
+    def expired(self):
+        return (time.time() - self.created_at) > self.ttl
+
+    def build(self, baseftp, directory, subfolders=None):
+        '''
+            List the source directory (and its 'subfolders', e.g. the CNES preffixes) and
+            store the result on disk.
+        '''
+        folders = [None] if subfolders is None else subfolders
+        files = {}
+        for folder in folders:
+            path = directory if folder is None else f"{directory.rstrip('/')}/{folder}"
+            try:
+                entries = list_directory(baseftp, path)
+            except ftplib.error_perm:
+                continue
+            for name, facts in entries.items():
+                if facts['type'] == 'dir':
+                    continue
+                facts['folder'] = folder
+                facts['name'] = name
+                files[Path(name).stem.upper()] = facts
+
+        self._files = files
+        self.created_at = time.time()
+        self.save()
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump({'origin': self.origin, 'created_at': self.created_at, 'files': self._files}, fp)
+        os.replace(tmp_path, self.path)
+
+    # ------------------ lookup ------------------
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, filename):
+        return Path(filename).stem.upper() in self._files
+
+    def info(self, filename):
+        '''
+            Facts of a file (name, folder, size and modification time), or None if it is not published.
+        '''
+        return self._files.get(Path(filename).stem.upper())
+
+    def size(self, filename):
+        entry = self.info(filename)
+        return None if entry is None else entry['size']
+
+    def lookup(self, preffix, uf, year, month=None):
+        '''
+            Files published for a given (preffix, uf, year, month). The result is a list because
+            large SIASUS files are split into parts (e.g. 'PASP2401a', 'PASP2401b').
+        '''
+        stem = utils.build_filename(self.origin, preffix, uf, year, month).upper()
+        return [ entry for key, entry in self._files.items() if key==stem or (key[:-1]==stem and key[-1].isalpha()) ]
+
+    def exists(self, preffix, uf, year, month=None):
+        return len(self.lookup(preffix, uf, year, month)) > 0
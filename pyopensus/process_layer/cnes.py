@@ -3,6 +3,8 @@ import pandas as pd
 import numpy as np
 from pyopensus.opensus.opensus import Opensus
 from pyopensus.storage.warehouse_sus import WarehouseCNES
+from pyopensus.opensus.manifest import file_checksum
+from pyopensus.storage.pipeline import ingest_files
 import pyopensus.utils.utils as utils
 
 class ProcessCNES:
@@ -52,20 +54,19 @@ class ProcessCNES:
                     fname = f"{preffix}{uf}{yy}{mm}" 
                     #self.opensus.retrieve_file(self.dest, self.origin, fname, preffix_folder=preffix, to_dbf=True, to_parquet=True, verbose=True)    
                     try:
-                        self.opensus.retrieve_file(self.dest, self.origin, fname, preffix_folder=preffix, to_dbf=True, to_parquet=True, verbose=True)                    
+                        self.opensus.retrieve_file(self.dest, self.origin, fname, preffix_folder=preffix, to_dbf=keep_dbf, to_parquet=True, verbose=True)                    
                     except:
                         continue
 
-                    # -- delete dbf and/or parquet if signaled.
-                    if self.dest.joinpath("DBF", f"{fname}.dbf").is_file() and not keep_dbf:
-                        self.dest.joinpath("DBF", f"{fname}.dbf").unlink()
                     # -- delete PARQUET file
                     if self.dest.joinpath("PARQUET", f"{fname}.parquet").is_file() and not keep_parquet:
                         self.dest.joinpath("PARQUET", f"{fname}.parquet").unlink()
 
-    def insert_data(self, warehouse_location, warehouse_name, preffixes=None, verbose=True):
+    def insert_data(self, warehouse_location, warehouse_name, preffixes=None, verbose=True, n_workers=1):
         '''
-
+            Insert the PARQUET files of 'dest' into the CNES warehouse. The files are read by
+            'n_workers' processes and inserted by a single writer, one transaction per file
+            registered in the ingest ledger (files already loaded are skipped).
         '''
         engine_url = f"sqlite:///{warehouse_location.joinpath(warehouse_name)}"
         warehouse = WarehouseCNES(engine_url)
@@ -81,25 +82,40 @@ class ProcessCNES:
                 raise Exception("Some or all of preffixes parsed are not included in the official document.")
 
         list_of_files = sorted([ filename for filename in self.dest.joinpath("PARQUET").glob("*.parquet") ])
+        tasks = []
         for filename in list_of_files:
-            stem = filename.stem
-            preffix = stem[:2]
-            print(stem)
-            
-            df = pd.read_parquet(filename)
-            # -- any transformation to the data
-            df["COMPET"] = pd.to_datetime(df["COMPETEN"].apply(lambda x: f"{x[:4]}-{x[4:]}-01"), format="%Y-%m-%d", errors="coerce")
             # -- find the table(s) associated with the current preffix
-            tables = self.preffix_to_table[preffix]
-            for table_name in tables:
-                model_column = expected_cols_models[table_name]
-                for col in model_column:
-                    if col not in df.columns:
-                        df[col] = [ np.nan for n in range(df.shape[0]) ]
+            tables = self.preffix_to_table[filename.stem[:2]]
+            columns = [ col for table_name in tables for col in expected_cols_models[table_name] ]
+            tasks.append({'source': filename.stem, 'tables': tables, 'checksum': file_checksum(filename),
+                          'args': (str(filename), columns)})
+
+        def write(df, task, conn):
+            # -- records of all tables and the ledger entries are committed together
+            for table_name in task['tables']:
+                warehouse.bulk_insert(table_name, df, on_conflict='ignore', verbose=verbose, conn=conn)
+            return df.shape[0]
 
-                # -- insert the data into the table
-                warehouse.insert(table_name, df, batchsize=200, verbose=verbose)
-        
+        # -- indexes are rebuilt once, after all files are loaded
+        loaded_tables = sorted(set([ table_name for preffix in preffixes for table_name in self.preffix_to_table[preffix] ]))
+        with warehouse.use_profile('ingest'), warehouse.deferred_indexes(loaded_tables):
+            summary = ingest_files(warehouse, tasks, prepare_cnes_file, write, n_workers=n_workers, verbose=verbose)
+        return summary
 
 
-        
\ No newline at end of file
+def prepare_cnes_file(filename, columns):
+    '''
+        Read a CNES PARQUET file, derive 'COMPET' and add the missing 'columns' expected by
+        its tables. Runs in the worker processes of 'ProcessCNES.insert_data'.
+    '''
+    df = pd.read_parquet(filename)
+    # -- any transformation to the data
+    if "COMPET" in df.columns:
+        # -- already derived by the typed PARQUET schema
+        df["COMPET"] = utils.parse_dates(df["COMPET"])
+    else:
+        df["COMPET"] = pd.to_datetime(df["COMPETEN"].apply(lambda x: f"{x[:4]}-{x[4:]}-01"), format="%Y-%m-%d", errors="coerce")
+    for col in columns:
+        if col not in df.columns:
+            df[col] = [ np.nan for n in range(df.shape[0]) ]
+    return df
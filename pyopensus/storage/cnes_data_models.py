@@ -6,7 +6,7 @@
     Email: your.email@example.com
 '''
 import datetime as dt
-from sqlalchemy import Column, Table, MetaData
+from sqlalchemy import Column, Table, MetaData, Index
 from sqlalchemy import DateTime, Integer, Numeric, String, Float, Sequence, ForeignKey, CheckConstraint
 from sqlalchemy.exc import InternalError, IntegrityError
 
@@ -75,6 +75,9 @@ class Estabelecimentos:
             Column('QTLEITP3', Numeric(4), nullable=True),
             Column('LEITHOSP', String(1), nullable=True),
             Column('MOTDESAB', String(2), nullable=True),
+            # -- secondary indexes
+            Index('ix_estabelecimentos_mes_compet', 'COMPET'),
+            Index('ix_estabelecimentos_mes_cnes_compet', 'CNES', 'COMPET'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
@@ -107,6 +110,9 @@ class Equipamentos:
             Column('QT_USO', String(4), nullable=True),
             Column('IND_SUS', String(1), nullable=True),
             Column('IND_NSUS', String(1), nullable=True),
+            # -- secondary indexes
+            Index('ix_equipamentos_mes_compet', 'COMPET'),
+            Index('ix_equipamentos_mes_cnes_compet', 'CNES', 'COMPET'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
@@ -137,6 +143,9 @@ class Leitos:
             Column('QT_EXIST', Numeric, nullable=True),
             Column('QT_CONTR', Numeric, nullable=True),
             Column('QT_SUS', Numeric, nullable=True),
+            # -- secondary indexes
+            Index('ix_leitos_mes_compet', 'COMPET'),
+            Index('ix_leitos_mes_cnes_compet', 'CNES', 'COMPET'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
@@ -178,6 +187,9 @@ class Profissionais:
             Column('PROFNSUS', String(1), nullable=True),
             Column('HORAHOSP', String(3), nullable=True),
             Column('HORA_AMB', String(3), nullable=True),
+            # -- secondary indexes
+            Index('ix_profissionais_mes_compet', 'COMPET'),
+            Index('ix_profissionais_mes_cnes_compet', 'CNES', 'COMPET'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
@@ -211,6 +223,9 @@ class ServicoEspecializados:
             Column('AMB_HOSP', String(4), nullable=True),
             Column('CONTSRVU', String(1), nullable=True),
             Column('CNESTERC', String(7), nullable=True),
+            # -- secondary indexes
+            Index('ix_servicos_especializados_mes_compet', 'COMPET'),
+            Index('ix_servicos_especializados_mes_cnes_compet', 'CNES', 'COMPET'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
@@ -308,6 +323,9 @@ class Equipes:
             Column('AREA_EQP', String(10), nullable=True),
             Column('ID_SEGM', String(8), nullable=True),
             Column('TIPOSEGM', String(1), nullable=True),
+            # -- secondary indexes
+            Index('ix_equipes_mes_compet', 'COMPET'),
+            Index('ix_equipes_mes_cnes_compet', 'CNES', 'COMPET'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
@@ -0,0 +1,63 @@
+'''
+    Define the data models of the ingest ledger, which source files were loaded
+    into each table of a warehouse, and of the number of records of each table.
+'''
+
+import datetime as dt
+from sqlalchemy import Column, Table, MetaData
+from sqlalchemy import DateTime, Integer, String
+
+
+class IngestLedger:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.table_name = 'ingest_ledger'
+        self._dummy_ = ['SOURCE', 'TABLE_NAME', 'CHECKSUM', 'NROWS', 'STATUS', 'STARTED', 'FINISHED']
+
+        self.model = Table(
+            self.table_name, self.metadata,
+            Column('SOURCE', String, primary_key=True),
+            Column('TABLE_NAME', String, primary_key=True),
+            Column('CHECKSUM', String(32), nullable=True), # -- MD5 of the source file
+            Column('NROWS', Integer, nullable=True),
+            Column('STATUS', String(10), nullable=False), # -- 'completed' or 'failed'
+            Column('STARTED', DateTime, nullable=True),
+            Column('FINISHED', DateTime, nullable=True),
+        )
+
+        self.mapping = { n:n for n in self._dummy_ }
+
+    def define(self):
+        '''
+            Return dictionary elements containing the data model and 
+            the data mapping, respectively.
+        '''
+        table_elem = { self.table_name : self.model }
+        mapping_elem = { self.table_name : self.mapping }
+        return table_elem, mapping_elem
+
+
+class RecordCounts:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.table_name = 'record_counts'
+        self._dummy_ = ['TABLE_NAME', 'NROWS', 'UPDATED']
+
+        # -- kept up to date by the insertions and deletions of the warehouse
+        self.model = Table(
+            self.table_name, self.metadata,
+            Column('TABLE_NAME', String, primary_key=True),
+            Column('NROWS', Integer, nullable=False),
+            Column('UPDATED', DateTime, nullable=True),
+        )
+
+        self.mapping = { n:n for n in self._dummy_ }
+
+    def define(self):
+        '''
+            Return dictionary elements containing the data model and 
+            the data mapping, respectively.
+        '''
+        table_elem = { self.table_name : self.model }
+        mapping_elem = { self.table_name : self.mapping }
+        return table_elem, mapping_elem
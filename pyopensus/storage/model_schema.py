@@ -0,0 +1,160 @@
+'''
+    Typed PARQUET schemas derived from the data models.
+
+    DATASUS files store codes and dates as text (e.g. 'DT_INTER' as 'YYYYMMDD' in SIHSUS
+    and 'DTOBITO' as 'DDMMYYYY' in SIM). The columns declared in the data models of each
+    preffix are converted while the PARQUET files are written:
+
+        - DateTime columns become 'date32';
+        - short String columns (up to 10 characters: municipality, CNES, ICD, procedure
+          codes, ...) become dictionary-encoded strings, which keeps leading zeros;
+        - Numeric columns become 'float64' (with decimal places) or 'int64';
+        - other columns are kept as decoded from the DBF header.
+
+    Loaders reading these files get native dates and categoricals and do not need to
+    parse them again (see 'pyopensus.utils.utils.parse_dates').
+'''
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlalchemy import MetaData
+from sqlalchemy import DateTime, Integer, Numeric, String, Float
+
+import pyopensus.utils.utils as utils
+from pyopensus.storage.sih_data_models import AIH, ServicosAIH, Rejeitadas
+from pyopensus.storage.sim_data_models import SIM
+from pyopensus.storage.cnes_data_models import BaseCnes, Estabelecimentos, Equipamentos, Leitos, Equipes, Profissionais, ServicoEspecializados
+
+# -- data models of the records of each (source, preffix)
+PREFFIX_MODELS = {
+    ('sihsus', 'RD'): [AIH],
+    ('sihsus', 'SP'): [ServicosAIH],
+    ('sihsus', 'RJ'): [Rejeitadas],
+    ('sim', 'DO'): [SIM],
+    ('cnes', 'ST'): [BaseCnes, Estabelecimentos],
+    ('cnes', 'PF'): [Profissionais],
+    ('cnes', 'SR'): [ServicoEspecializados],
+    ('cnes', 'EQ'): [Equipamentos],
+    ('cnes', 'EP'): [Equipes],
+    ('cnes', 'LT'): [Leitos],
+}
+
+# -- format of the dates stored as text in each source
+DATE_FORMATS = { 'sihsus': '%Y%m%d', 'sim': '%d%m%Y', 'cnes': '%Y%m%d' }
+
+# -- text columns up to this length are dictionary-encoded
+MAX_CODE_LENGTH = 10
+
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+_NUMBER = r'^\s*-?[0-9]*\.?[0-9]+\s*$'
+
+
+class ModelSchema:
+    '''
+        Per-preffix typed schema applied to the record batches written into PARQUET.
+
+        It can be given as 'normalizer' to the converters of 'pyopensus.utils.parquet'
+        and 'pyopensus.utils.dataset': 'arrow_schema' fixes the output schema from the
+        header of the DBF file and 'normalize' converts each record batch.
+
+        Args:
+        -----
+            origin:
+                String. Source of the data ('sihsus', 'sim' or 'cnes').
+            preffix:
+                String. Preffix of the files (e.g. 'RD', 'DO', 'ST').
+    '''
+    def __init__(self, origin, preffix):
+        self.origin = origin.lower()
+        self.preffix = preffix.upper()
+        if (self.origin, self.preffix) not in PREFFIX_MODELS:
+            raise Exception(f"No data model defined for preffix {self.preffix} of {self.origin}.")
+        self.date_format = DATE_FORMATS[self.origin]
+
+        # -- target type of each column declared in the data models
+        self.types = {}
+        metadata = MetaData()
+        for data_model in PREFFIX_MODELS[(self.origin, self.preffix)]:
+            for column in data_model(metadata).model.columns:
+                if column.name not in self.types:
+                    self.types[column.name] = _arrow_type(column)
+
+    @classmethod
+    def for_file(cls, origin, filename):
+        '''
+            Schema of a DATASUS file, or None when its preffix has no data model.
+        '''
+        preffix = utils.parse_filename(origin, filename)['preffix']
+        if (origin.lower(), preffix.upper()) not in PREFFIX_MODELS:
+            return None
+        return cls(origin, preffix)
+
+    def arrow_schema(self, schema):
+        '''
+            Output schema for the input 'schema' (from the DBF header).
+        '''
+        fields = []
+        for field in schema:
+            fields.append(pa.field(field.name, self.types.get(field.name, field.type)))
+        if self._derive_compet(schema.names):
+            fields.append(pa.field('COMPET', pa.date32()))
+        return pa.schema(fields)
+
+    def normalize(self, batch):
+        '''
+            Convert the columns of a 'pyarrow.RecordBatch' to the types of the data models.
+        '''
+        arrays, names = [], []
+        for name, array in zip(batch.schema.names, batch.columns):
+            target = self.types.get(name)
+            if target is not None and array.type != target:
+                array = self._convert(array, target)
+            arrays.append(array)
+            names.append(name)
+
+        if self._derive_compet(names):
+            # -- CNES: month of the record ('COMPETEN' as 'YYYYMM') as the first day of the month
+            competen = batch.column(names.index('COMPETEN'))
+            arrays.append(self._convert(pc.binary_join_element_wise(pc.cast(competen, pa.string()), '01', ''),
+                                        pa.date32(), '%Y%m%d'))
+            names.append('COMPET')
+        return pa.RecordBatch.from_arrays(arrays, names=names)
+
+    def _derive_compet(self, names):
+        return self.origin == 'cnes' and 'COMPET' in self.types and 'COMPETEN' in names and 'COMPET' not in names
+
+    def _convert(self, array, target, date_format=None):
+        if target == pa.date32():
+            if pa.types.is_timestamp(array.type):
+                return pc.cast(array, target)
+            text = pc.utf8_trim_whitespace(pc.cast(array, pa.string()))
+            stamps = pc.strptime(text, format=date_format or self.date_format, unit='s', error_is_null=True)
+            return pc.cast(stamps, target)
+        if target == DICTIONARY:
+            return pc.dictionary_encode(pc.cast(array, pa.string()))
+        if pa.types.is_string(array.type) and (pa.types.is_integer(target) or pa.types.is_floating(target)):
+            # -- text that is not a number becomes null
+            valid = pc.match_substring_regex(array, _NUMBER)
+            array = pc.if_else(valid, pc.utf8_trim_whitespace(array), pa.scalar(None, pa.string()))
+            if pa.types.is_integer(target):
+                return pc.cast(pc.cast(array, pa.float64()), target, safe=False)
+        return pc.cast(array, target, safe=False)
+
+
+def _arrow_type(column):
+    '''
+        Arrow type of a column of a data model.
+    '''
+    if isinstance(column.type, DateTime):
+        return pa.date32()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, Numeric):
+        return pa.float64() if column.type.scale else pa.int64()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, String):
+        if column.primary_key or column.type.length is None or column.type.length > MAX_CODE_LENGTH:
+            return pa.string()
+        return DICTIONARY
+    return pa.string()
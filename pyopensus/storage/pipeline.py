@@ -0,0 +1,115 @@
+'''
+    Pipelined ingestion of source files into a warehouse.
+
+    Reading and transforming the files ('prepare') runs in a pool of processes, while a
+    single writer thread takes the prepared records from a bounded queue and inserts them
+    into the warehouse ('write'), one file per transaction (see 'WarehouseBase.ingest_file').
+    SQLite accepts a single writer at a time, so the throughput is limited by the database
+    writes and not by the parsing of the files. The bounded queue keeps at most 'queue_size'
+    prepared files (plus one per worker) in memory.
+'''
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+def ingest_files(warehouse, tasks, prepare, write, n_workers=None, queue_size=2, force=False, verbose=False):
+    '''
+        Prepare the files of 'tasks' in parallel and write them, in order, with a single writer.
+
+        Args:
+        -----
+            warehouse:
+                pyopensus.storage.warehouse_base.WarehouseBase. Warehouse receiving the records.
+            tasks:
+                List of Dictionaries. Each one with the keys 'source' (name of the file in the
+                ingest ledger), 'tables' (List of Strings, tables fed by the file), 'checksum'
+                (String or None) and 'args' (Tuple, arguments of 'prepare').
+            prepare:
+                Function. Called as 'prepare(*task['args'])' in a worker process, so it must be
+                defined at module (or class) level. Returns the prepared records (e.g. a DataFrame).
+            write:
+                Function. Called as 'write(prepared, task, conn)' in the writer thread, with the
+                connection of the file transaction. Returns the number of records written.
+            n_workers:
+                None or Integer. Number of processes preparing files (default the number of CPUs).
+                With 1 (or 0), the files are prepared in the calling thread, still overlapped with
+                the writes.
+            queue_size:
+                Integer. Maximum number of prepared files waiting for the writer.
+            force:
+                Bool. Load the files even if the ledger registers them as loaded.
+
+        Return:
+        -------
+            summary:
+                pandas.DataFrame. For each task, 'SOURCE', 'STATUS' ('completed', 'skipped' or
+                'failed'), 'NROWS' and 'ERROR'.
+    '''
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    results = {}
+    prepared_queue = queue.Queue(maxsize=queue_size)
+
+    def writer():
+        while True:
+            item = prepared_queue.get()
+            if item is None:
+                break
+            position, task, prepared, error = item
+            if error is None:
+                try:
+                    with warehouse.ingest_file(task['source'], task['tables'], task['checksum']) as load:
+                        load['nrows'] = write(prepared, task, load['conn'])
+                    results[position] = ('completed', load['nrows'], None)
+                except Exception as err:
+                    error = err
+            if error is not None:
+                results[position] = ('failed', None, repr(error))
+            if verbose:
+                print(f"{task['source']}: {results[position][0]}.")
+
+    def put(position, task, job):
+        # -- blocks while the writer is behind (bounded queue)
+        try:
+            prepared = job() if callable(job) else job.result()
+            prepared_queue.put((position, task, prepared, None))
+        except Exception as err:
+            prepared_queue.put((position, task, None, err))
+
+    # -- the workers are started before the writer thread, so they are not forked with it running
+    pool = None
+    if n_workers > 1:
+        pool = ProcessPoolExecutor(n_workers)
+        pool.submit(os.getpid).result()
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    try:
+        pending = deque()
+        for position, task in enumerate(tasks):
+            if not force and warehouse.is_loaded(task['source'], task['tables'], task['checksum']):
+                results[position] = ('skipped', None, None)
+                if verbose:
+                    print(f"{task['source']}: skipped.")
+                continue
+            if pool is None:
+                put(position, task, lambda task=task: prepare(*task['args']))
+                continue
+            pending.append((position, task, pool.submit(prepare, *task['args'])))
+            if len(pending) >= n_workers:
+                put(*pending.popleft())
+        while len(pending) > 0:
+            put(*pending.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        prepared_queue.put(None)
+        thread.join()
+
+    # -- results are kept per task, as different files may share the same name (source)
+    summary = [ [task['source'], *results.get(position, ('failed', None, 'not processed'))] for position, task in enumerate(tasks) ]
+    return pd.DataFrame(summary, columns=['SOURCE', 'STATUS', 'NROWS', 'ERROR'])
@@ -7,7 +7,7 @@
 '''
 
 import datetime as dt
-from sqlalchemy import Column, Table, MetaData
+from sqlalchemy import Column, Table, MetaData, Index
 from sqlalchemy import DateTime, Integer, Numeric, String, Float, Sequence, ForeignKey, CheckConstraint
 from sqlalchemy.exc import InternalError, IntegrityError
 
@@ -141,7 +141,13 @@ class AIH:
             #Column('ETNIA', String(4), nullable=True),
             #Column('SEQUENCIA', Numeric(9), nullable=True),
             #Column('REMESSA', String(21), nullable=True),
-            Column('FONTE', String, nullable=True)
+            Column('FONTE', String, nullable=True),
+            # -- secondary indexes
+            Index('ix_aih_reduzida_dt_inter', 'DT_INTER'),
+            Index('ix_aih_reduzida_fonte', 'FONTE'),
+            Index('ix_aih_reduzida_munic_res_dt_inter', 'MUNIC_RES', 'DT_INTER'),
+            Index('ix_aih_reduzida_munic_mov_dt_inter', 'MUNIC_MOV', 'DT_INTER'),
+            Index('ix_aih_reduzida_cnes_dt_inter', 'CNES', 'DT_INTER'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
@@ -217,7 +223,11 @@ class ServicosAIH:
             #Column('SP_CIDSEC', String(4), nullable=True),
             Column('SP_QT_PROC', Numeric(4), nullable=True),
             Column('SP_U_AIH', String(1), nullable=True),
-            Column('FONTE', String, nullable=True)
+            Column('FONTE', String, nullable=True),
+            # -- secondary indexes
+            Index('ix_servicos_profissionais_sp_naih', 'SP_NAIH'),
+            Index('ix_servicos_profissionais_sp_cnes', 'SP_CNES'),
+            Index('ix_servicos_profissionais_fonte', 'FONTE'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
@@ -366,6 +376,11 @@ class Rejeitadas:
             #Column('SEQUENCIA', Numeric(9), nullable=True),
             #Column('REMESSA', String(21), nullable=True)
             #Column('FONTE', String, nullable=True)
+            # -- secondary indexes
+            Index('ix_aih_rejeitada_n_aih', 'N_AIH'),
+            Index('ix_aih_rejeitada_dt_inter', 'DT_INTER'),
+            Index('ix_aih_rejeitada_munic_res', 'MUNIC_RES'),
+            Index('ix_aih_rejeitada_munic_mov', 'MUNIC_MOV'),
         )
 
         self.mapping = {n: n for n in self._dummy_}
@@ -7,7 +7,7 @@
 '''
 
 import datetime as dt
-from sqlalchemy import Column, Table, MetaData
+from sqlalchemy import Column, Table, MetaData, Index
 from sqlalchemy import DateTime, Integer, Numeric, String, Float, Sequence, ForeignKey, CheckConstraint
 from sqlalchemy.exc import InternalError, IntegrityError
 
@@ -64,6 +64,11 @@ class SIM:
             Column("CIRCOBITO", String(1), nullable=True),
             Column("ACIDTRAB", String(1), nullable=True),
             Column('FONTE_DADOS', String(8), nullable=True),
+            # -- secondary indexes
+            Index('ix_sim_dtobito', 'DTOBITO'),
+            Index('ix_sim_codmunocor', 'CODMUNOCOR'),
+            Index('ix_sim_fonte_dados', 'FONTE_DADOS'),
+            Index('ix_sim_codmunres_dtobito', 'CODMUNRES', 'DTOBITO'),
         )
 
         self.mapping = { n:n for n in self._dummy_ }
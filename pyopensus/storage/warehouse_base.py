@@ -9,14 +9,124 @@
 import numpy as np
 import pandas as pd
 import datetime as dt
+import os
+import threading
+import weakref
+from contextlib import contextmanager
 from simpledbf import Dbf5
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, make_url
 from sqlalchemy import Column, Table, MetaData
-from sqlalchemy import select, insert, update, delete
-from sqlalchemy import inspect, text
-from sqlalchemy import DateTime, Integer, Numeric, String, Sequence, ForeignKey, CheckConstraint
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy import inspect, text, bindparam
+from sqlalchemy import DateTime, Integer, Numeric, String, Float, Sequence, ForeignKey, CheckConstraint
 from sqlalchemy.exc import InternalError, IntegrityError
+from sqlalchemy.dialects import sqlite, postgresql
+
+from pyopensus.utils.utils import UF_CODES
+
+# -- PRAGMAs applied to every connection of a SQLite warehouse, for each profile.
+# -- 'ingest' trades durability for speed during bulk loads: with 'synchronous=OFF' a crash
+# -- of the machine (not of the process) may lose the last transactions, which can be loaded again.
+SQLITE_PROFILES = {
+    'ingest': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -1048576, # -- in KiB (1 GiB)
+        'temp_store': 'MEMORY',
+        'mmap_size': 1073741824,
+    },
+    'read': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -262144,
+        'temp_store': 'MEMORY',
+        'mmap_size': 1073741824,
+    },
+}
+
+# -- comparison operators accepted in the filters of 'iter_query'
+_FILTER_OPS = {
+    '==': lambda col, value: col == value,
+    '!=': lambda col, value: col != value,
+    '<': lambda col, value: col < value,
+    '<=': lambda col, value: col <= value,
+    '>': lambda col, value: col > value,
+    '>=': lambda col, value: col >= value,
+    'in': lambda col, value: col.in_(list(value)),
+    'not in': lambda col, value: col.not_in(list(value)),
+}
+
+# -- engines shared by the warehouses of the same database (see 'shared_engine') and the
+# -- tables already created through each of them
+_engines = {}
+_initialized = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+def _apply_profile(connection):
+    # -- the PRAGMAs of the profile of the connection (execution option 'sqlite_profile') are
+    # -- set when the pooled DBAPI connection was last used with another profile
+    profile = connection.get_execution_options().get('sqlite_profile')
+    record_info = connection.connection.info
+    if profile is None or record_info.get('profile') == profile:
+        return
+    cursor = connection.connection.dbapi_connection.cursor()
+    for name, value in SQLITE_PROFILES[profile].items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+    record_info['profile'] = profile
+
+def shared_engine(engine_url, profile='read'):
+    '''
+        Pooled engine of the database at 'engine_url', shared by all the warehouses (and
+        handlers) of this database in the process, so that connections, PRAGMAs and the
+        tables already created are reused instead of being set up by each instance.
+
+        In-memory SQLite databases are private to their engine and are never shared.
+
+        Args:
+        -----
+            engine_url:
+                String. URL of the database.
+            profile:
+                String. Default connection profile of a new engine (see 'SQLITE_PROFILES').
+                The warehouses choose their own profile for each connection (see 'set_profile').
+
+        Return:
+        -------
+            engine:
+                sqlalchemy.engine.Engine.
+    '''
+    url = make_url(engine_url)
+    key = url.render_as_string(hide_password=False)
+    in_memory = url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+    with _engines_lock:
+        if not in_memory and key in _engines:
+            return _engines[key]
+        engine = create_engine(url, future=True)
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'engine_connect', _apply_profile)
+            engine = engine.execution_options(sqlite_profile=profile)
+        if not in_memory:
+            _engines[key] = engine
+        return engine
+
+def dispose_engines():
+    '''
+        Close the pooled connections of the shared engines and forget them (e.g. before
+        the files of the databases are removed or moved).
+    '''
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+def ledger_source(source):
+    '''
+        Key of a source file in the ingest ledger: the name of the file, without folder and
+        extension, in upper case (e.g. 'RDCE2401' for 'data/rdce2401.dbc').
+    '''
+    return os.path.splitext(os.path.basename(str(source)))[0].upper()
 
 # -- utility class
 class smart_dict(dict):
@@ -24,6 +134,40 @@ class smart_dict(dict):
         if pd.notna(x):
             return x
         return None
+
+def _typed_frame(rows, table_columns):
+    '''
+        DataFrame of the rows of a query, typed after the columns of the data model.
+    '''
+    df = pd.DataFrame.from_records(rows, columns=[ col.name for col in table_columns ])
+    for col in table_columns:
+        if isinstance(col.type, DateTime):
+            df[col.name] = pd.to_datetime(df[col.name], errors='coerce')
+        elif isinstance(col.type, Numeric):
+            values = pd.to_numeric(df[col.name], errors='coerce').astype('float64')
+            df[col.name] = values if col.type.scale or isinstance(col.type, Float) else values.astype('Int64')
+        elif isinstance(col.type, Integer):
+            df[col.name] = pd.to_numeric(df[col.name], errors='coerce').astype('Int64')
+        elif isinstance(col.type, String):
+            df[col.name] = df[col.name].astype('string')
+    return df
+
+def frame_to_records(data_df):
+    '''
+        Records (list of dictionaries) of a dataframe with NaN, NaT and NA replaced by None.
+
+        Missing values are replaced column by column, instead of testing each value.
+    '''
+    columns = []
+    for col in data_df.columns:
+        values = data_df[col].astype(object).to_numpy()
+        missing = pd.isna(values)
+        if missing.any():
+            values = values.copy()
+            values[missing] = None
+        columns.append(values)
+    names = list(data_df.columns)
+    return [ dict(zip(names, row)) for row in zip(*columns) ]
     
 class WarehouseBase:
     '''
@@ -50,7 +194,7 @@ class WarehouseBase:
                 data source and the schema used in the data models. 
     '''
     def __init__(self, engine_url):
-        self._engine = create_engine(engine_url, future=True)
+        self._engine = self._create_engine(engine_url)
         self._metadata = MetaData()
         self._tables = {}
         self._mappings = {}
@@ -95,12 +239,194 @@ class WarehouseBase:
     def metadata(self, v):
         raise Exception()
     
+    # ------------------ engine and connection profiles ------------------
+
+    def _create_engine(self, engine_url, profile='read'):
+        '''
+            Engine of the warehouse, shared with the other warehouses of the same database
+            (see 'shared_engine'). For SQLite, the PRAGMAs of the profile of the warehouse
+            (see 'SQLITE_PROFILES') are applied to each connection as it is opened.
+        '''
+        # -- connection of the current 'transaction' and profile of 'use_profile', per thread
+        self._local = threading.local()
+        self._profile = profile
+        self._profile_engines = {}
+        return shared_engine(engine_url, profile=profile)
+
+    @property
+    def _engine(self):
+        '''
+            Shared engine with the profile of the warehouse in the current thread. The
+            profile travels with the connections as an execution option, so warehouses and
+            threads using the same database do not change each other's profile.
+        '''
+        engine = self._shared_engine
+        if engine.dialect.name != 'sqlite':
+            return engine
+        profile = self.profile
+        if profile not in self._profile_engines:
+            self._profile_engines[profile] = engine.execution_options(sqlite_profile=profile)
+        return self._profile_engines[profile]
+
+    @_engine.setter
+    def _engine(self, engine):
+        self._shared_engine = engine
+        self._profile_engines = {}
+
+    @property
+    def profile(self):
+        return getattr(self._local, 'profile', None) or self._profile
+
+    def set_profile(self, profile):
+        '''
+            Switch the connection profile ('ingest' or 'read') of a SQLite warehouse.
+
+            Only the connections opened afterwards by this warehouse use the new profile
+            (the PRAGMAs are set as each connection is opened). Other warehouses of the same
+            database keep their own profile. It has no effect on other databases.
+        '''
+        if profile not in SQLITE_PROFILES:
+            raise Exception(f"Profile '{profile}' not supported.")
+        self._profile = profile
+
+    @contextmanager
+    def use_profile(self, profile):
+        '''
+            Context in which the warehouse uses 'profile' in the current thread. Other threads
+            using the same warehouse keep their profile.
+
+                with warehouse.use_profile('ingest'):
+                    ... bulk loads ...
+        '''
+        if profile not in SQLITE_PROFILES:
+            raise Exception(f"Profile '{profile}' not supported.")
+        previous = getattr(self._local, 'profile', None)
+        self._local.profile = profile
+        try:
+            yield self
+        finally:
+            self._local.profile = previous
+
     # ------------------ lazy connection with the database ------------------
 
     def db_init(self):
-        self._metadata.create_all(self._engine)
+        '''
+            Create the tables (and secondary indexes) of the data models that do not exist
+            yet. The check is done once per table for the shared engine, so new warehouses
+            and handlers of an initialized database do not inspect it again.
+        '''
+        with _engines_lock:
+            created = _initialized.setdefault(self._shared_engine, set())
+            table_names = [ name for name in self._tables if name not in created ]
+        if len(table_names) > 0:
+            tables = [ self._tables[name] for name in table_names ]
+            self._metadata.create_all(self._engine, tables=tables)
+            # -- indexes added to the data models after the tables were created
+            self.create_indexes(table_names)
+            with _engines_lock:
+                created.update(table_names)
         return self._engine
 
+    # ------------------ connections and transactions ------------------
+
+    def _current_connection(self):
+        local = getattr(self, '_local', None)
+        return getattr(local, 'conn', None)
+
+    @contextmanager
+    def transaction(self):
+        '''
+            Context in which the operations of the warehouse, in this thread, run on a single
+            connection and transaction, committed on exit or rolled back on error. Nested
+            calls join the outer transaction.
+
+                with warehouse.transaction() as conn:
+                    warehouse.delete_many('aih_reduzida', filters=[('FONTE', '==', 'CE2401')])
+                    warehouse.bulk_insert('aih_reduzida', df)
+                    warehouse.number_of_records('aih_reduzida')
+
+            Return:
+            -------
+                conn:
+                    sqlalchemy.engine.Connection. Connection of the transaction.
+        '''
+        current = self._current_connection()
+        if current is not None:
+            yield current
+            return
+        with self._engine.begin() as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+
+    @contextmanager
+    def _connection(self, conn=None):
+        '''
+            Connection of an operation: 'conn' if given, the connection of the current
+            'transaction', or a new connection of the pool.
+        '''
+        if conn is None:
+            conn = self._current_connection()
+        if conn is not None:
+            yield conn
+            return
+        with self._engine.connect() as conn:
+            yield conn
+
+    # ------------------ secondary indexes ------------------
+
+    def _indexes(self, table_names=None):
+        if table_names is None:
+            table_names = list(self._tables.keys())
+        indexes = []
+        for table_name in table_names:
+            if table_name not in self._tables:
+                raise Exception(f"Table '{table_name}' not found.")
+            indexes += sorted(self._tables[table_name].indexes, key=lambda index: index.name)
+        return indexes
+
+    def drop_indexes(self, table_names=None):
+        '''
+            Drop the secondary indexes declared in the data models of 'table_names'
+            (default all tables). Primary keys are kept.
+        '''
+        with self._connection() as conn:
+            for index in self._indexes(table_names):
+                index.drop(conn, checkfirst=True)
+            if self._current_connection() is None:
+                conn.commit()
+
+    def create_indexes(self, table_names=None):
+        '''
+            Create the secondary indexes declared in the data models of 'table_names'
+            (default all tables) that do not exist yet.
+        '''
+        with self._connection() as conn:
+            for index in self._indexes(table_names):
+                index.create(conn, checkfirst=True)
+            if self._current_connection() is None:
+                conn.commit()
+
+    @contextmanager
+    def deferred_indexes(self, table_names=None):
+        '''
+            Context in which the secondary indexes of 'table_names' are dropped, so that
+            they are built once, on exit, instead of being updated for every record.
+
+            Worth it for large loads (e.g. several years of files); a single month loaded
+            into a large table is faster with the indexes in place.
+
+                with warehouse.use_profile('ingest'), warehouse.deferred_indexes(['aih_reduzida']):
+                    ... bulk loads ...
+        '''
+        self.drop_indexes(table_names)
+        try:
+            yield self
+        finally:
+            self.create_indexes(table_names)
+
     # ------------------ expected column names for each table ------------------
 
     def expected_columns(self):
@@ -110,7 +436,7 @@ class WarehouseBase:
     
     # ------------------ CRUD ------------------
 
-    def insert(self, table_name, data_df, batchsize=50, verbose=True):
+    def insert(self, table_name, data_df, batchsize=50, verbose=True, on_conflict=None):
         '''
             Insert new records from a given dataframe.
             
@@ -125,60 +451,213 @@ class WarehouseBase:
                     then the columns must match the original ones. 
                 batchsize:
                     Integer. Size of the batches of records to insert in the table.
+                on_conflict:
+                    None or String {'ignore', 'update', 'error'}. What to do with records whose
+                    primary key is already stored. 'ignore' skips them and 'update' overwrites the
+                    stored values, both through a single 'INSERT ... ON CONFLICT' per batch (SQLite
+                    and PostgreSQL). 'error' raises the integrity error. None (default) inserts the
+                    batch and, if it fails on a UNIQUE constraint, inserts it again ignoring the
+                    duplicated records. Other integrity errors are printed and the batch is skipped.
+
+            Return:
+            -------
+                counts:
+                    Dictionary. Number of records 'inserted', 'skipped' and 'updated'.
         '''
+        if on_conflict not in [None, 'ignore', 'update', 'error']:
+            raise Exception(f"Conflict mode '{on_conflict}' not supported.")
+
         # -- load the data model and the schema mapping from 'table_name' and rename the columns of 'data_df'
-        try:
-            table_model, table_mapping = self._tables[table_name], self._mappings[table_name]
-        except:
-            raise Exception(f"Table '{table_name}' not found.")
-        try:
-            data_df = data_df.rename(table_mapping, axis=1, errors='raise')
-        except:
-            raise Exception('Data source schema could not be properly mapped.')
+        table_model, data_df = self._map_frame(table_name, data_df)
         
         # - define 'smart_hash' to avoid 'NaN' values in the records during insert
         nonan_hash = smart_dict()
 
         # -- perform batch insertion of records into the table.
-        data_df = data_df[ table_mapping.values() ]
-        splitted_data = np.split(data_df, np.arange(batchsize, data_df.shape[0]+1, batchsize))
+        counts = {'inserted': 0, 'skipped': 0, 'updated': 0}
+        splitted_data = [ data_df.iloc[start:start+batchsize] for start in range(0, data_df.shape[0], batchsize) ]
         for nindex, current_batch in enumerate(splitted_data):
-            has_duplicate = False
             if verbose:
                 print(f'Insertion of batch {nindex+1} of {len(splitted_data)} ... ', end='')
             
             # - format records to be inserted
             records = [ { field : nonan_hash[val] for field, val in btc.items() } for btc in current_batch.to_dict(orient='records')]
-            if len(records)==0 and verbose: 
-                print('no records ... done.')
+            if len(records)==0:
+                if verbose:
+                    print('no records ... done.')
                 continue
         
             # -- insert batch
-            try:
-                ins = table_model.insert()
-                with self._engine.connect() as conn:
-                    rp = conn.execute(ins, records)
-                    conn.commit()
-            except IntegrityError as error:
-                if verbose:
-                    print(f'error: {error.args[0]} ... ', end='')
-                
-                # -- if there are duplicates, add one by one
-                if 'UNIQUE constraint failed:' in error.args[0]:
+            if on_conflict in ['ignore', 'update']:
+                batch_counts = self._insert_on_conflict(table_model, records, on_conflict)
+            else:
+                try:
+                    with self._connection() as conn:
+                        conn.execute(table_model.insert(), records)
+                        if self._current_connection() is None:
+                            conn.commit()
+                    batch_counts = {'inserted': len(records), 'skipped': 0, 'updated': 0}
+                except IntegrityError as error:
+                    if on_conflict == 'error':
+                        raise
                     if verbose:
-                        print(f'adding one by one ... ', end='')
-                
-                    for cur_record in records:
-                        new_ins = table_model.insert()
-                        try:
-                            with self._engine.connect() as conn:
-                                rp = conn.execute(new_ins, cur_record)
-                                conn.commit()
-                        except:
-                            continue
-                    
+                        print(f'error: {error.args[0]} ... ', end='')
+                    if 'UNIQUE constraint failed:' in error.args[0]:
+                        if verbose:
+                            print('ignoring duplicates ... ', end='')
+                        batch_counts = self._insert_on_conflict(table_model, records, 'ignore')
+                    else:
+                        batch_counts = {'inserted': 0, 'skipped': len(records), 'updated': 0}
+
+            for key in counts:
+                counts[key] += batch_counts[key]
             if verbose:
-                print('done.')
+                print(f"done ({batch_counts['inserted']} inserted, {batch_counts['skipped']} skipped, {batch_counts['updated']} updated).")
+
+        if self._current_connection() is not None:
+            self._add_to_count(self._current_connection(), table_name, counts['inserted'])
+        else:
+            with self._engine.begin() as conn:
+                self._add_to_count(conn, table_name, counts['inserted'])
+        return counts
+
+    def bulk_insert(self, table_name, data_df, batchsize=50000, on_conflict='error', verbose=False, conn=None):
+        '''
+            Insert the records of a dataframe in a single transaction.
+
+            Missing values are converted to NULL column by column and each batch is sent with
+            one 'executemany', through the same connection. If any batch fails, nothing is
+            inserted. To load several dataframes (e.g. the batches of a file) in the same
+            transaction, pass the connection returned by 'engine.begin()' as 'conn'.
+
+            Without 'conn', the load runs under the 'ingest' profile (see 'use_profile').
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database. Possible to extract
+                    from attribute 'tables'.
+                data_df:
+                    pandas.DataFrame. Records to be inserted (see 'insert').
+                batchsize:
+                    Integer. Number of records sent in each 'executemany'.
+                on_conflict:
+                    String {'error', 'ignore', 'update'}. See 'insert'. With 'error' a
+                    duplicated record rolls back the whole transaction.
+                conn:
+                    None or sqlalchemy.engine.Connection. Connection of an open transaction. If
+                    None, the current 'transaction' is used, or one is opened and committed
+                    for this call.
+
+            Return:
+            -------
+                counts:
+                    Dictionary. Number of records 'inserted', 'skipped' and 'updated'.
+        '''
+        if on_conflict not in ['ignore', 'update', 'error']:
+            raise Exception(f"Conflict mode '{on_conflict}' not supported.")
+        if conn is None:
+            conn = self._current_connection()
+        if conn is None:
+            with self.use_profile('ingest'), self._engine.begin() as conn:
+                return self.bulk_insert(table_name, data_df, batchsize=batchsize, on_conflict=on_conflict,
+                                        verbose=verbose, conn=conn)
+
+        table_model, data_df = self._map_frame(table_name, data_df)
+        counts = {'inserted': 0, 'skipped': 0, 'updated': 0}
+        for start in range(0, data_df.shape[0], batchsize):
+            records = frame_to_records(data_df.iloc[start:start+batchsize])
+            if on_conflict == 'error':
+                conn.execute(table_model.insert(), records)
+                batch_counts = {'inserted': len(records), 'skipped': 0, 'updated': 0}
+            else:
+                batch_counts = self._insert_on_conflict(table_model, records, on_conflict, conn=conn)
+            for key in counts:
+                counts[key] += batch_counts[key]
+        self._add_to_count(conn, table_name, counts['inserted'])
+
+        if verbose:
+            print(f"{table_name}: {counts['inserted']} inserted, {counts['skipped']} skipped, {counts['updated']} updated.")
+        return counts
+
+    def _map_frame(self, table_name, data_df):
+        '''
+            Data model of 'table_name' and the columns of 'data_df' renamed and selected
+            according to the schema mapping of the table.
+        '''
+        try:
+            table_model, table_mapping = self._tables[table_name], self._mappings[table_name]
+        except:
+            raise Exception(f"Table '{table_name}' not found.")
+        try:
+            data_df = data_df.rename(table_mapping, axis=1, errors='raise')
+        except:
+            raise Exception('Data source schema could not be properly mapped.')
+        return table_model, data_df[ list(table_mapping.values()) ]
+
+    def _conflict_statement(self, table_model, on_conflict):
+        '''
+            'INSERT ... ON CONFLICT DO NOTHING/UPDATE' statement for the dialect of the engine.
+        '''
+        dialect_name = self._engine.dialect.name
+        if dialect_name == 'sqlite':
+            stmt = sqlite.insert(table_model)
+        elif dialect_name == 'postgresql':
+            stmt = postgresql.insert(table_model)
+        else:
+            raise Exception(f"Conflict handling not supported for the '{dialect_name}' dialect.")
+
+        primary_keys = [ p.name for p in inspect(table_model).primary_key ]
+        if on_conflict == 'ignore':
+            return stmt.on_conflict_do_nothing()
+        if len(primary_keys) == 0:
+            raise Exception(f"Table '{table_model.name}' has no primary key to update on conflict.")
+        updated_cols = { col.name : stmt.excluded[col.name] for col in table_model.columns if col.name not in primary_keys }
+        if len(updated_cols) == 0:
+            return stmt.on_conflict_do_nothing(index_elements=primary_keys)
+        return stmt.on_conflict_do_update(index_elements=primary_keys, set_=updated_cols)
+
+    def _count_existing(self, conn, table_model, records):
+        '''
+            Number of distinct records (by primary key) already stored in the table.
+        '''
+        primary_keys = [ p.name for p in inspect(table_model).primary_key ]
+        if len(primary_keys) != 1:
+            return 0
+        pkey = table_model.c[primary_keys[0]]
+        keys = list({ rec[pkey.name] for rec in records if rec.get(pkey.name) is not None })
+        nexisting = 0
+        for start in range(0, len(keys), 500):
+            sel = select(func.count()).select_from(table_model).where(pkey.in_(keys[start:start+500]))
+            nexisting += conn.execute(sel).scalar()
+        return nexisting
+
+    def _insert_on_conflict(self, table_model, records, on_conflict, conn=None):
+        '''
+            Insert a batch of records with a single 'INSERT ... ON CONFLICT' (executemany).
+
+            Return:
+            -------
+                counts:
+                    Dictionary. Number of records 'inserted', 'skipped' and 'updated'.
+        '''
+        stmt = self._conflict_statement(table_model, on_conflict)
+        if conn is None:
+            conn = self._current_connection()
+        if conn is None:
+            with self._engine.connect() as conn:
+                counts = self._insert_on_conflict(table_model, records, on_conflict, conn=conn)
+                conn.commit()
+            return counts
+
+        if on_conflict == 'update':
+            nexisting = self._count_existing(conn, table_model, records)
+            conn.execute(stmt, records)
+            return {'inserted': len(records) - nexisting, 'skipped': 0, 'updated': nexisting}
+
+        rp = conn.execute(stmt, records)
+        ninserted = rp.rowcount if rp.rowcount is not None and rp.rowcount >= 0 else len(records)
+        return {'inserted': ninserted, 'skipped': len(records) - ninserted, 'updated': 0}
         
     def update(self, table_name, primary_key_value, updated_record, verbose=True):
         '''
@@ -204,9 +683,10 @@ class WarehouseBase:
             print(f'Update query: {updt} ...', end='')
         
         try:
-            with self._engine.connect() as conn:
+            with self._connection() as conn:
                 rp = conn.execute(updt)
-                conn.commit()
+                if self._current_connection() is None:
+                    conn.commit()
         except IntegrityError as error:
             print(f'error: {error.args[0]}', end='')
         
@@ -227,26 +707,201 @@ class WarehouseBase:
                     List of unique IDs representing the primary key of the records 
                     to be deleted.
         '''
-        # - Load the data model and extract the name of its primary key
-        table_model = self._tables[table_name]
-        primary_key_name = [ p.name for p in inspect(table_model).primary_key ][0]
-        
+        # -- set-based deletion in a single transaction (see 'delete_many')
         if list_of_records:
-            for nindex, current_rec in enumerate(list_of_records):
-                if verbose:
-                    print(f'Deletion of record {current_rec} ({nindex+1}/{len(list_of_records)}) ... ', end='')
-                
-                try:
-                    qdel = delete(table_model).where(table_model.c[primary_key_name]==current_rec)
-                    with self._engine.connect() as conn:
-                        rp = conn.execute(qdel)
-                        conn.commit()
-                except IntegrityError as error:
-                    if verbose:
-                        print(f'error: {error.args[0]}', end='')
-                
+            if verbose:
+                print(f'Deletion of {len(list_of_records)} records ... ', end='')
+            try:
+                ndeleted = self.delete_many(table_name, keys=list_of_records)
+            except IntegrityError as error:
                 if verbose:
-                    print('done.')
+                    print(f'error: {error.args[0]}', end='')
+                return
+            if verbose:
+                print(f'{ndeleted} deleted.')
+
+    def delete_many(self, table_name, keys=None, key_col=None, filters=None, period=None, date_col=None, conn=None):
+        '''
+            Delete a set of records with a few statements, in a single transaction.
+
+            The records are selected by their keys, by a predicate or both. The keys are
+            loaded into a temporary table, so the deletion is a single 'DELETE ... WHERE
+            EXISTS' joined with it, whatever the number of keys.
+
+                warehouse.delete_many('aih_reduzida', filters=[('FONTE', '==', 'CE2401')])
+                warehouse.delete_many('aih_reduzida', keys=df[['N_AIH']])
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database.
+                keys:
+                    None, List, numpy.ndarray, pandas.Series or pandas.DataFrame. Keys of the
+                    records. A DataFrame may hold several key columns.
+                key_col:
+                    None, String or List of Strings. Key columns (default the columns of the
+                    DataFrame or the primary key).
+                filters:
+                    None or List of Tuples (column, op, value) (see 'iter_query').
+                period:
+                    None or 2-element list of datetime.datetime. Period of 'date_col'.
+                date_col:
+                    None or String. Column of 'period' (default 'period_column').
+                conn:
+                    None or sqlalchemy.engine.Connection. Connection of an open transaction
+                    (default the current 'transaction', or a new one for this call).
+
+            Return:
+            -------
+                ndeleted:
+                    Integer. Number of records deleted.
+        '''
+        if conn is None:
+            conn = self._current_connection()
+        if conn is None:
+            with self._engine.begin() as conn:
+                return self.delete_many(table_name, keys=keys, key_col=key_col, filters=filters, period=period,
+                                        date_col=date_col, conn=conn)
+
+        table_model = self._table_model(table_name)
+        conditions = self._predicate(table_name, filters, period, date_col)
+        key_table = None
+        if keys is not None:
+            key_df = self._key_frame(table_model, keys, key_col)
+            key_table = self._load_key_table(conn, table_model, key_df)
+            conditions.append(self._join_keys(table_model, key_table, list(key_df.columns)))
+        if len(conditions) == 0:
+            raise Exception("Keys or a predicate should be given to delete records (see 'delete_table').")
+
+        rp = conn.execute(delete(table_model).where(*conditions))
+        if key_table is not None:
+            key_table.drop(conn)
+        self._add_to_count(conn, table_name, -rp.rowcount)
+        return rp.rowcount
+
+    def update_many(self, table_name, data_df=None, values=None, key_col=None, filters=None, period=None, date_col=None,
+                    conn=None):
+        '''
+            Update a set of records with a few statements, in a single transaction.
+
+            Either each record gets its own values, from the rows of 'data_df' matched by the
+            key columns, or all selected records get the same 'values'.
+
+                # -- new values per record (key columns plus the updated columns)
+                warehouse.update_many('aih_reduzida', data_df=df[['N_AIH', 'MUNIC_RES']])
+                # -- same values for the records of a source file
+                warehouse.update_many('aih_reduzida', values={'CAR_INT': '02'}, filters=[('FONTE', '==', 'CE2401')])
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database.
+                data_df:
+                    None or pandas.DataFrame. Key columns and the updated columns, named as in
+                    the data model. It is loaded into a temporary table and joined with the table.
+                values:
+                    None or Dictionary. Values set to every selected record.
+                key_col:
+                    None, String or List of Strings. Key columns of 'data_df' (default the
+                    primary key).
+                filters, period, date_col:
+                    Predicate selecting the records (see 'delete_many').
+                conn:
+                    None or sqlalchemy.engine.Connection. Connection of an open transaction
+                    (default the current 'transaction', or a new one for this call).
+
+            Return:
+            -------
+                nupdated:
+                    Integer. Number of records updated.
+        '''
+        if (data_df is None) == (values is None):
+            raise Exception("Either 'data_df' or 'values' should be given.")
+        if conn is None:
+            conn = self._current_connection()
+        if conn is None:
+            with self._engine.begin() as conn:
+                return self.update_many(table_name, data_df=data_df, values=values, key_col=key_col, filters=filters,
+                                        period=period, date_col=date_col, conn=conn)
+
+        table_model = self._table_model(table_name)
+        conditions = self._predicate(table_name, filters, period, date_col)
+        if values is not None:
+            if len(conditions) == 0:
+                raise Exception("A predicate should be given to update records with 'values'.")
+            return conn.execute(update(table_model).where(*conditions).values(values)).rowcount
+
+        key_col = self._key_columns(table_model, key_col)
+        value_cols = [ col for col in data_df.columns if col not in key_col ]
+        if len(value_cols) == 0:
+            raise Exception("No column to update in 'data_df'.")
+        key_table = self._load_key_table(conn, table_model, data_df[key_col + value_cols], key_col)
+        match = self._join_keys(table_model, key_table, key_col)
+        new_values = {}
+        for col in value_cols:
+            new_values[col] = select(key_table.c[col]).where(*[ key_table.c[k]==table_model.c[k] for k in key_col ]).scalar_subquery()
+
+        rp = conn.execute(update(table_model).where(match, *conditions).values(new_values))
+        key_table.drop(conn)
+        return rp.rowcount
+
+    def _table_model(self, table_name):
+        try:
+            return self._tables[table_name]
+        except:
+            raise Exception(f"Table '{table_name}' not found.")
+
+    def _predicate(self, table_name, filters=None, period=None, date_col=None):
+        '''
+            Conditions of the filters and of the period over a table.
+        '''
+        table_model = self._tables[table_name]
+        conditions = []
+        for col, op, value in (filters or []):
+            if op not in _FILTER_OPS:
+                raise Exception(f"Filter operator '{op}' not supported.")
+            conditions.append(_FILTER_OPS[op](table_model.c[col], value))
+        if period is not None:
+            date_col = date_col if date_col is not None else self.period_column(table_name)
+            if date_col is None:
+                raise Exception("The name of the datetime field should be provided.")
+            start, end = period[0], period[1] if period[1] is not None else dt.datetime.today()
+            conditions.append(table_model.c[date_col].between(start, end))
+        return conditions
+
+    def _key_columns(self, table_model, key_col):
+        if key_col is None:
+            key_col = [ p.name for p in inspect(table_model).primary_key ]
+            if len(key_col) == 0:
+                raise Exception(f"Table '{table_model.name}' has no primary key: 'key_col' should be given.")
+        return [key_col] if isinstance(key_col, str) else list(key_col)
+
+    def _key_frame(self, table_model, keys, key_col):
+        if isinstance(keys, pd.DataFrame):
+            key_col = list(keys.columns) if key_col is None else self._key_columns(table_model, key_col)
+            return keys[key_col]
+        key_col = self._key_columns(table_model, key_col)
+        if len(key_col) > 1:
+            raise Exception("Composite keys should be given as a DataFrame.")
+        return pd.DataFrame({key_col[0]: np.asarray(keys)})
+
+    def _load_key_table(self, conn, table_model, key_df, key_col=None):
+        '''
+            Temporary table (private to the connection) holding the rows of 'key_df', with
+            the types of the columns of 'table_model' and 'key_col' as primary key.
+        '''
+        key_col = list(key_df.columns) if key_col is None else key_col
+        key_df = key_df.drop_duplicates(subset=key_col)
+        columns = [ Column(col, table_model.c[col].type, primary_key=(col in key_col)) for col in key_df.columns ]
+        key_table = Table(f"_keys_{table_model.name}", MetaData(), *columns, prefixes=['TEMPORARY'])
+        key_table.create(conn)
+        records = frame_to_records(key_df)
+        for start in range(0, len(records), 50000):
+            conn.execute(key_table.insert(), records[start:start+50000])
+        return key_table
+
+    def _join_keys(self, table_model, key_table, key_col):
+        return select(1).where(*[ key_table.c[k]==table_model.c[k] for k in key_col ]).exists()
 
     def delete_table(self, table_name, is_sure=False, authkey=""):
         '''
@@ -265,16 +920,298 @@ class WarehouseBase:
         '''
         sql_str = f"DROP TABLE IF EXISTS {table_name};"
         sql_query = text(sql_str)
-        with self._engine.connect() as conn:
+        with self._connection() as conn:
             if is_sure and authkey=="###!Y!.":
                 rp = conn.execute(sql_query)
-                conn.commit()
+                if 'record_counts' in self._tables and table_name != 'record_counts':
+                    count_model = self._tables['record_counts']
+                    conn.execute(delete(count_model).where(count_model.c['TABLE_NAME']==table_name))
+                if self._current_connection() is None:
+                    conn.commit()
 
                 _temp = self._tables.pop(table_name)
                 _temp = self._mappings.pop(table_name)
+                with _engines_lock:
+                    _initialized.get(self._shared_engine, set()).discard(table_name)
             else:
                 raise Exception('delete table command called, but without assurance.')
             
+    # ------------------ ingest ledger ------------------
+
+    def is_loaded(self, source, table_names, checksum=None):
+        '''
+            Whether the source file was completely loaded into all tables 'table_names'.
+
+            Args:
+            -----
+                source:
+                    String. Name (or path) of the source file (e.g. 'RDCE2401'), see 'ledger_source'.
+                table_names:
+                    String or List of Strings. Tables fed by the file.
+                checksum:
+                    None or String. If given, entries of a file with a different checksum
+                    (e.g. a file updated by DATASUS) do not count as loaded.
+        '''
+        if isinstance(table_names, str):
+            table_names = [table_names]
+        ledger = self._ledger_model()
+        stmt = select(ledger).where(ledger.c.SOURCE==ledger_source(source), ledger.c.TABLE_NAME.in_(table_names),
+                                    ledger.c.STATUS=='completed')
+        with self._connection() as conn:
+            entries = conn.execute(stmt).mappings().all()
+        loaded = set([ entry['TABLE_NAME'] for entry in entries if checksum is None or entry['CHECKSUM']==checksum ])
+        return loaded == set(table_names)
+
+    def ledger(self, source=None):
+        '''
+            Entries of the ingest ledger (of a single source file, if given) as a DataFrame.
+        '''
+        ledger = self._ledger_model()
+        stmt = select(ledger)
+        if source is not None:
+            stmt = stmt.where(ledger.c.SOURCE==ledger_source(source))
+        with self._connection() as conn:
+            entries = conn.execute(stmt.order_by(ledger.c.SOURCE, ledger.c.TABLE_NAME)).mappings().all()
+        return pd.DataFrame([ dict(entry) for entry in entries ], columns=[ col.name for col in ledger.columns ])
+
+    @contextmanager
+    def ingest_file(self, source, table_names, checksum=None):
+        '''
+            Context to load a source file in a single transaction, under the 'ingest' profile.
+
+            It yields a dictionary with the connection ('conn', to be given to 'bulk_insert')
+            and the number of records read ('nrows', to be updated by the caller). The records
+            and the 'completed' entries of the ledger are committed together, so a file is
+            either loaded and registered or neither. On error, the transaction is rolled back
+            and the file is registered as 'failed'.
+
+                with warehouse.ingest_file('RDCE2401', ['aih_reduzida'], checksum) as load:
+                    counts = warehouse.bulk_insert('aih_reduzida', df, conn=load['conn'])
+                    load['nrows'] += df.shape[0]
+        '''
+        if isinstance(table_names, str):
+            table_names = [table_names]
+        started = dt.datetime.now()
+        current = self._current_connection()
+        if current is not None:
+            # -- inside a 'transaction', the file is registered (or rolled back) with it
+            load = {'conn': current, 'nrows': 0}
+            yield load
+            self._register_file(current, source, table_names, checksum, load['nrows'], 'completed', started)
+            return
+        try:
+            with self.use_profile('ingest'), self._engine.begin() as conn:
+                load = {'conn': conn, 'nrows': 0}
+                yield load
+                self._register_file(conn, source, table_names, checksum, load['nrows'], 'completed', started)
+        except BaseException:
+            with self._engine.begin() as conn:
+                self._register_file(conn, source, table_names, checksum, None, 'failed', started)
+            raise
+
+    def _ledger_model(self):
+        if 'ingest_ledger' not in self._tables:
+            raise Exception("Table 'ingest_ledger' not found.")
+        return self._tables['ingest_ledger']
+
+    def _register_file(self, conn, source, table_names, checksum, nrows, status, started):
+        records = [ {'SOURCE': ledger_source(source), 'TABLE_NAME': table_name, 'CHECKSUM': checksum, 'NROWS': nrows,
+                     'STATUS': status, 'STARTED': started, 'FINISHED': dt.datetime.now()} for table_name in table_names ]
+        self._insert_on_conflict(self._ledger_model(), records, 'update', conn=conn)
+
+    # ------------------ record counts ------------------
+
+    def _add_to_count(self, conn, table_name, nrows):
+        '''
+            Add 'nrows' (negative for deletions) to the stored number of records of a table,
+            in the transaction of 'conn'. The first time, the records are counted.
+        '''
+        count_model = self._tables.get('record_counts')
+        if count_model is None or table_name == 'record_counts' or nrows == 0:
+            return
+        updated = dt.datetime.now()
+        where = count_model.c['TABLE_NAME']==table_name
+        rp = conn.execute(update(count_model).where(where).values(NROWS=count_model.c['NROWS']+nrows, UPDATED=updated))
+        if rp.rowcount == 0:
+            nrows = conn.execute(select(func.count()).select_from(self._tables[table_name])).scalar()
+            conn.execute(insert(count_model).values(TABLE_NAME=table_name, NROWS=nrows, UPDATED=updated))
+
+    def stored_count(self, table_name):
+        '''
+            Number of records of a table kept in 'record_counts' by the insertions and
+            deletions of the warehouse ('insert', 'bulk_insert', 'ingest_file', 'delete_many').
+            Falls back to counting the records when the table has no stored count.
+
+            Records written outside the warehouse methods are not accounted for: use
+            'refresh_counts' after them.
+        '''
+        count_model = self._tables.get('record_counts')
+        if count_model is None:
+            return self.number_of_records(table_name)
+        with self._connection() as conn:
+            nrows = conn.execute(select(count_model.c['NROWS']).where(count_model.c['TABLE_NAME']==table_name)).scalar()
+        return nrows if nrows is not None else self.number_of_records(table_name)
+
+    def refresh_counts(self, table_names=None):
+        '''
+            Count the records of the tables (default all) and store the results in
+            'record_counts'.
+        '''
+        count_model = self._tables.get('record_counts')
+        if count_model is None:
+            raise Exception("Table 'record_counts' not found.")
+        if table_names is None:
+            table_names = [ name for name in self._tables.keys() if name != 'record_counts' ]
+        with self._connection() as conn:
+            records = [ {'TABLE_NAME': name, 'NROWS': conn.execute(select(func.count()).select_from(self._tables[name])).scalar(),
+                         'UPDATED': dt.datetime.now()} for name in table_names ]
+            self._insert_on_conflict(count_model, records, 'update', conn=conn)
+            if self._current_connection() is None:
+                conn.commit()
+
+    # --------------- STATISTICS ---------------
+
+    def period_column(self, table_name):
+        '''
+            Date column that defines the period of the records of a table: the first DateTime
+            column with its own index in the data model (e.g. 'DT_INTER', 'DTOBITO', 'COMPET'),
+            or None.
+        '''
+        table_model = self._tables[table_name]
+        for index in sorted(table_model.indexes, key=lambda index: index.name):
+            columns = list(index.columns)
+            if len(columns) == 1 and isinstance(columns[0].type, DateTime):
+                return columns[0].name
+        return None
+
+    def count_by(self, table_name, by, column=None):
+        '''
+            Number of records of a table grouped by a column, by year or by UF, computed by
+            the database ('GROUP BY').
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database.
+                by:
+                    String. Name of a column (e.g. 'FONTE'), 'YEAR' or 'UF'.
+                column:
+                    None or String. Date column used with 'YEAR' (default 'period_column') or
+                    municipality code column used with 'UF' (e.g. 'MUNIC_RES').
+
+            Return:
+            -------
+                counts:
+                    pandas.DataFrame. Columns 'by' and 'COUNT', ordered by the first.
+        '''
+        table_model = self._tables[table_name]
+        if by == 'YEAR':
+            column = column if column is not None else self.period_column(table_name)
+            if column is None:
+                raise Exception(f"No date column to count the records of '{table_name}' by year.")
+            key = func.extract('year', table_model.c[column])
+        elif by == 'UF':
+            if column is None:
+                raise Exception("The municipality code column should be provided to count by UF.")
+            key = func.substr(table_model.c[column], 1, 2)
+        else:
+            key = table_model.c[by]
+
+        sel = select(key.label(by), func.count().label('COUNT')).group_by(key).order_by(key)
+        with self._connection() as conn:
+            counts = pd.DataFrame(conn.execute(sel).all(), columns=[by, 'COUNT'])
+        if by == 'UF':
+            counts[by] = counts[by].map(lambda code: UF_CODES.get(code, code))
+            counts = counts.groupby(by, as_index=False, dropna=False)['COUNT'].sum()
+        return counts
+
+    def date_range(self, table_name, date_col=None):
+        '''
+            Minimum and maximum dates of a table (default on 'period_column').
+
+            Both are queried separately, so each one is answered by the index of the
+            column without scanning the table.
+        '''
+        table_model = self._tables[table_name]
+        date_col = date_col if date_col is not None else self.period_column(table_name)
+        if date_col is None:
+            return None, None
+        with self._connection() as conn:
+            first = conn.execute(select(func.min(table_model.c[date_col]))).scalar()
+            last = conn.execute(select(func.max(table_model.c[date_col]))).scalar()
+        return first, last
+
+    def database_size(self):
+        '''
+            Size of the database in bytes ('page_count*page_size' for SQLite), or None
+            for other databases.
+        '''
+        dialect = self._engine.dialect.name
+        with self._connection() as conn:
+            if dialect == 'sqlite':
+                page_count = conn.execute(text("PRAGMA page_count")).scalar()
+                page_size = conn.execute(text("PRAGMA page_size")).scalar()
+                return page_count*page_size
+            if dialect == 'postgresql':
+                return conn.execute(text("SELECT pg_database_size(current_database())")).scalar()
+        return None
+
+    def table_size(self, table_name):
+        '''
+            Size in bytes of a table and of its indexes, or None if the database does not
+            provide it. For SQLite it reads the 'dbstat' table, which visits every page of
+            the table: use 'database_size' for frequent checks.
+        '''
+        table_model = self._tables[table_name]
+        dialect = self._engine.dialect.name
+        with self._connection() as conn:
+            if dialect == 'sqlite':
+                names = [table_name] + [ index.name for index in table_model.indexes ]
+                try:
+                    stmt = text("SELECT SUM(pgsize) FROM dbstat WHERE name IN :names").bindparams(bindparam('names', expanding=True))
+                    return conn.execute(stmt, {'names': names}).scalar()
+                except Exception:
+                    return None
+            if dialect == 'postgresql':
+                return conn.execute(text("SELECT pg_total_relation_size(:name)"), {'name': table_name}).scalar()
+        return None
+
+    def statistics(self, table_names=None, sizes=False, exact=False):
+        '''
+            Summary of the tables of the warehouse: number of records, period column with
+            its minimum and maximum dates and, if 'sizes', the size in bytes.
+
+            The number of records is read from 'record_counts' (see 'stored_count') and the
+            dates from the index of the period column, so the summary does not scan the tables.
+
+            Args:
+            -----
+                table_names:
+                    None or List of Strings. Tables to summarize (default all).
+                sizes:
+                    Bool. Include the size of each table (see 'table_size').
+                exact:
+                    Bool. Count the records of each table instead of reading the stored counts.
+
+            Return:
+            -------
+                stats:
+                    pandas.DataFrame. One row per table.
+        '''
+        if table_names is None:
+            table_names = list(self._tables.keys())
+        stats = []
+        for table_name in table_names:
+            date_col = self.period_column(table_name)
+            first, last = self.date_range(table_name, date_col)
+            nrows = self.number_of_records(table_name) if exact else self.stored_count(table_name)
+            entry = {'TABLE': table_name, 'NROWS': nrows,
+                     'PERIOD_COLUMN': date_col, 'MIN_DATE': first, 'MAX_DATE': last}
+            if sizes:
+                entry['SIZE_BYTES'] = self.table_size(table_name)
+            stats.append(entry)
+        return pd.DataFrame(stats)
+
     # --------------- BUILT-IN QUERY METHODS ---------------
     
     def number_of_records(self, table_name):
@@ -291,20 +1228,72 @@ class WarehouseBase:
                 results:
                     Integer. Number of records queried from the database. 
         '''
-        # -- Load and select the data model
+        # -- Load the data model and count the records in the database
         table_model = self._tables[table_name]
-        sel = select(table_model)
+        sel = select(func.count()).select_from(table_model)
 
         try:
-            with self._engine.connect() as conn:
-                rp = conn.execute(sel)
-                nrecords = 0
-                for record in rp: nrecords+=1
-                return nrecords
+            with self._connection() as conn:
+                return conn.execute(sel).scalar()
         except Exception as error:
             print(error.args[0])
             return -1
     
+    def iter_query(self, table_name, columns=None, filters=None, period=None, date_col=None, batch_size=100000,
+                   as_arrow=False, order_by=None):
+        '''
+            Select records from a table and yield them in typed batches of at most 'batch_size'
+            records, so that large selections (e.g. years of admissions) are never held in
+            memory as a whole.
+
+            DateTime columns become 'datetime64', Numeric columns 'float64' (with decimal
+            places) or 'Int64', and text columns are kept as strings.
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database.
+                columns:
+                    None or List of Strings. Columns selected (default all).
+                filters:
+                    None or List of Tuples (column, op, value), with op in '==', '!=', '<',
+                    '<=', '>', '>=', 'in' and 'not in'. All must be satisfied.
+                period:
+                    None or 2-element list of datetime.datetime. Records with 'date_col' in
+                    the period (see 'query_period').
+                date_col:
+                    None or String. Column of 'period' (default 'period_column').
+                batch_size:
+                    Integer. Maximum number of records of each batch.
+                as_arrow:
+                    Bool. Yield 'pyarrow.RecordBatch' instead of pandas.DataFrame.
+                order_by:
+                    None, String or List of Strings. Columns used to sort the records.
+
+            Return:
+            -------
+                batches:
+                    Generator of pandas.DataFrame (or pyarrow.RecordBatch).
+        '''
+        table_model = self._table_model(table_name)
+        if columns is None:
+            columns = [ col.name for col in table_model.columns ]
+        sel = select(*[ table_model.c[col] for col in columns ])
+        sel = sel.where(*self._predicate(table_name, filters, period, date_col))
+        if order_by is not None:
+            order_by = [order_by] if isinstance(order_by, str) else order_by
+            sel = sel.order_by(*[ table_model.c[col] for col in order_by ])
+
+        with self._connection() as conn:
+            rp = conn.execution_options(stream_results=True).execute(sel)
+            for rows in rp.partitions(batch_size):
+                df = _typed_frame(rows, [ table_model.c[col] for col in columns ])
+                if as_arrow:
+                    import pyarrow as pa
+                    yield pa.RecordBatch.from_pandas(df, preserve_index=False)
+                else:
+                    yield df
+
     def query_all(self, table_name):
         '''
             Select records from a specific table within the warehouse.
@@ -324,7 +1313,7 @@ class WarehouseBase:
         sel = select(table_model)
 
         try:
-            with self._engine.connect() as conn:
+            with self._connection() as conn:
                 rp = conn.execute(sel)
                 results = [ record for record in rp ]
                 return results
@@ -368,7 +1357,7 @@ class WarehouseBase:
                 
         # -- try to perform query
         try:
-            with self._engine.connect() as conn:
+            with self._connection() as conn:
                 rp = conn.execute(sel)
                 results = [ record for record in rp ]
                 return results
@@ -413,7 +1402,7 @@ class WarehouseBase:
                 
         # -- try to perform query
         try:
-            with self._engine.connect() as conn:
+            with self._connection() as conn:
                 rp = conn.execute(sel)
                 results = [ record for record in rp ]
                 return results
@@ -452,7 +1441,7 @@ class WarehouseBase:
                 
         # -- try to perform query
         try:
-            with self._engine.connect() as conn:
+            with self._connection() as conn:
                 rp = conn.execute(sel)
                 results = [ record for record in rp ]
                 return results
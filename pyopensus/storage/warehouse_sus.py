@@ -1,7 +1,6 @@
 '''
 
 '''
-from sqlalchemy import create_engine
 from sqlalchemy import Column, Table, MetaData
 
 from pyopensus.storage.warehouse_base import WarehouseBase
@@ -10,13 +9,14 @@ from pyopensus.storage.warehouse_base import WarehouseBase
 from pyopensus.storage.sih_data_models import AIH, ServicosAIH, Rejeitadas
 from pyopensus.storage.cnes_data_models import BaseCnes, Estabelecimentos, Equipamentos, Leitos, Equipes, Profissionais, ServicoEspecializados
 from pyopensus.storage.sim_data_models import SIM
+from pyopensus.storage.ledger_data_models import IngestLedger, RecordCounts
 
 class WarehouseSIH(WarehouseBase):
     '''
         Warehouse schema for SIHSUS data.
     '''
     def __init__(self, engine_url):
-        self._engine = create_engine(engine_url, future=True)
+        self._engine = self._create_engine(engine_url)
         self._metadata = MetaData()
         self._tables = {}
         self._mappings = {}
@@ -24,7 +24,9 @@ class WarehouseSIH(WarehouseBase):
         # -- include the data models
         self._imported_data_models = [ AIH(self._metadata).define(),
                                        ServicosAIH(self._metadata).define(),
-                                       Rejeitadas(self._metadata).define() ]
+                                       Rejeitadas(self._metadata).define(),
+                                       IngestLedger(self._metadata).define(),
+                                       RecordCounts(self._metadata).define() ]
 
         for elem in self._imported_data_models:
             self._tables.update(elem[0])
@@ -35,7 +37,7 @@ class WarehouseCNES(WarehouseBase):
         Warehouse schema for CNES data.
     '''
     def __init__(self, engine_url):
-        self._engine = create_engine(engine_url, future=True)
+        self._engine = self._create_engine(engine_url)
         self._metadata = MetaData()
         self._tables = {}
         self._mappings = {}
@@ -47,7 +49,9 @@ class WarehouseCNES(WarehouseBase):
                                        Leitos(self._metadata).define(),
                                        Equipamentos(self._metadata).define(),
                                        Equipes(self._metadata).define(),
-                                       ServicoEspecializados(self._metadata).define()]
+                                       ServicoEspecializados(self._metadata).define(),
+                                       IngestLedger(self._metadata).define(),
+                                       RecordCounts(self._metadata).define() ]
 
         for elem in self._imported_data_models:
             self._tables.update(elem[0])
@@ -58,13 +62,15 @@ class WarehouseSIM(WarehouseBase):
         Warehouse schema for SIM data.
     '''
     def __init__(self, engine_url):
-        self._engine = create_engine(engine_url, future=True)
+        self._engine = self._create_engine(engine_url)
         self._metadata = MetaData()
         self._tables = {}
         self._mappings = {}
 
         # -- include the data models
-        self._imported_data_models = [ SIM(self._metadata).define()]
+        self._imported_data_models = [ SIM(self._metadata).define(),
+                                       IngestLedger(self._metadata).define(),
+                                       RecordCounts(self._metadata).define() ]
 
         for elem in self._imported_data_models:
             self._tables.update(elem[0])
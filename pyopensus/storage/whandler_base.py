@@ -4,6 +4,7 @@ import pandas as pd
 import datetime as dt
 from simpledbf import Dbf5
 from pathlib import Path
+from sqlalchemy import delete
 
 # -- import the warehouse class
 from pyopensus.storage.warehouse_base import WarehouseBase
@@ -28,9 +29,15 @@ class HandlerBase:
         table_names = tables_to_delete
         if tables_to_delete is None:
             table_names = list(self.warehouse.tables.keys())
+        if 'ingest_ledger' in self.warehouse.tables and 'ingest_ledger' not in table_names:
+            # -- files loaded into the dropped tables must be loaded again
+            ledger = self.warehouse.tables['ingest_ledger']
+            with self.warehouse.engine.begin() as conn:
+                conn.execute(delete(ledger).where(ledger.c.TABLE_NAME.in_(table_names)))
         for tb_name in table_names:
             self.warehouse.delete_table(tb_name, is_sure=True, authkey="###!Y!.")
-        self.warehouse = WarehouseBase(self.engine_url)
+        # -- same kind of warehouse (and shared engine), with the data models of the dropped tables
+        self.warehouse = type(self.warehouse)(self.engine_url)
         self.engine = self.warehouse.db_init()
     
     def insert_data(self):
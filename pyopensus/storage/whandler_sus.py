@@ -8,6 +8,30 @@ from pathlib import Path
 # -- import the warehouse class
 from pyopensus.storage.whandler_base import HandlerBase
 from pyopensus.storage.warehouse_sus import WarehouseSIM, WarehouseSIH, WarehouseCNES
+from pyopensus.utils.utils import parse_dates
+from pyopensus.utils.DBFIX import DBFIX
+from pyopensus.utils.dbc import open_dbc
+from pyopensus.opensus.manifest import file_checksum
+from pyopensus.storage.pipeline import ingest_files
+
+# -- table of the records of each SIHSUS preffix
+SIH_TABLES = { 'RD': 'aih_reduzida', 'SP': 'servicos_profissionais', 'RJ': 'aih_rejeitada' }
+
+def read_source(path_to_file, codec='latin-1'):
+    '''
+        Read a DATASUS file (DBC, DBF or PARQUET) into a DataFrame.
+    '''
+    path_to_file = Path(path_to_file)
+    if path_to_file.suffix.lower() == ".parquet":
+        return pd.read_parquet(path_to_file)
+    if path_to_file.suffix.lower() == ".dbc":
+        with open_dbc(str(path_to_file)) as stream:
+            return DBFIX(stream, codec=codec).to_dataframe_vectorized()
+    dbf = DBFIX(str(path_to_file), codec=codec, memory_map=True)
+    try:
+        return dbf.to_dataframe_vectorized()
+    finally:
+        dbf.close()
 
 # ------------------ SIHSUS & CNES --------------------
 
@@ -18,7 +42,7 @@ class HandlerSIH(HandlerBase):
         self.warehouse = WarehouseSIH(self.engine_url)
         self.engine = self.warehouse.db_init()
     
-    def insert_sih(self, sih_df, sih_fname, preffix, verbose=False):
+    def insert_sih(self, sih_df, sih_fname, preffix, verbose=False, conn=None):
         '''
             Given a dataframe originated from the SIHSUS database, inserts it into the
             SIH integrated database.
@@ -29,22 +53,137 @@ class HandlerSIH(HandlerBase):
                     pandas.DataFrame.
                 sih_fname:
                     String. Original name of the file.
+                conn:
+                    None or sqlalchemy.engine.Connection. Open transaction used for the
+                    insert (see 'WarehouseBase.bulk_insert').
+
+        '''
+        sih_df = self.transform_sih(sih_df, sih_fname, preffix)
+        self.write_sih(sih_df, preffix, verbose=verbose, conn=conn)
 
+    @staticmethod
+    def transform_sih(sih_df, sih_fname, preffix):
+        '''
+            Transformations applied to the SIHSUS records before insertion: the 'FONTE'
+            column and the parsing of the dates (written as 'YYYYMMDD').
         '''
         fonte_name = Path(sih_fname).stem
         fonte_name = fonte_name.replace("RD", "").replace("SP", "").replace("RJ", "")
         sih_df["FONTE"] = [ fonte_name for n in range(sih_df.shape[0]) ]
         
-        if preffix == "RD":
-            for dt_col in ["NASC", "DT_INTER", "DT_SAIDA"]:
-                sih_df[dt_col] = pd.to_datetime(sih_df[dt_col], errors="coerce")
-            self.warehouse.insert('aih_reduzida', sih_df, batchsize=200, verbose=verbose)
-        elif preffix == "SP":
-            self.warehouse.insert('servicos_profissionais', sih_df, batchsize=200, verbose=verbose)
-        elif preffix == "RJ":
+        if preffix in ["RD", "RJ"]:
             for dt_col in ["NASC", "DT_INTER", "DT_SAIDA"]:
-                sih_df[dt_col] = pd.to_datetime(sih_df[dt_col], errors="coerce")
-            self.warehouse.insert('aih_rejeitada', sih_df, batchsize=200, verbose=verbose)
+                sih_df[dt_col] = parse_dates(sih_df[dt_col], format="%Y%m%d")
+        return sih_df
+
+    def write_sih(self, sih_df, preffix, verbose=False, conn=None):
+        '''
+            Insert transformed SIHSUS records (see 'transform_sih') into the table of the preffix.
+        '''
+        if preffix in SIH_TABLES:
+            return self.warehouse.bulk_insert(SIH_TABLES[preffix], sih_df, on_conflict='ignore', verbose=verbose, conn=conn)
+
+    @staticmethod
+    def prepare_sih(path_to_file, preffix):
+        '''
+            Read and transform a SIHSUS file (DBC, DBF or PARQUET). Runs in the worker
+            processes of 'ingest_sih_files'.
+        '''
+        return HandlerSIH.transform_sih(read_source(path_to_file), Path(path_to_file).name, preffix)
+
+    def ingest_sih_files(self, files, preffix=None, n_workers=None, queue_size=2, force=False, prepare=None, verbose=False):
+        '''
+            Insert several SIHSUS files: they are read and transformed in parallel by a pool of
+            processes, and inserted by a single writer, one transaction per file registered in
+            the ingest ledger (see 'pyopensus.storage.pipeline.ingest_files').
+
+            Args:
+            -----
+                files:
+                    List of Strings or pathlib.Path. DBC, DBF or PARQUET files.
+                preffix:
+                    None or String. 'RD', 'SP' or 'RJ'. If None, taken from the name of each file.
+                n_workers:
+                    None or Integer. Number of processes reading the files (default the number of CPUs).
+                queue_size:
+                    Integer. Maximum number of files read and waiting to be inserted.
+                force:
+                    Bool. Load the files even if the ledger registers them as loaded.
+                prepare:
+                    None or Function. Called as 'prepare(path_to_file, preffix)' in the worker
+                    processes, returning the records to insert. Defaults to 'prepare_sih'. Must
+                    be defined at module level.
+
+            Return:
+            -------
+                summary:
+                    pandas.DataFrame. Status and number of records of each file.
+        '''
+        tasks = []
+        for path_to_file in files:
+            path_to_file = Path(path_to_file)
+            file_preffix = preffix if preffix is not None else path_to_file.stem[:2].upper()
+            tasks.append({'source': path_to_file.stem, 'tables': [SIH_TABLES[file_preffix]],
+                          'checksum': file_checksum(path_to_file), 'args': (str(path_to_file), file_preffix)})
+
+        def write(sih_df, task, conn):
+            self.write_sih(sih_df, task['args'][1], verbose=verbose, conn=conn)
+            return sih_df.shape[0]
+
+        if prepare is None:
+            prepare = HandlerSIH.prepare_sih
+        return ingest_files(self.warehouse, tasks, prepare, write, n_workers=n_workers,
+                            queue_size=queue_size, force=force, verbose=verbose)
+
+    def insert_sih_file(self, path_to_file, preffix, batch_size=100000, verbose=False, force=False):
+        '''
+            Insert a SIHSUS DBF (or DBC) file batch by batch, so that only 'batch_size'
+            records are held in memory at a time. All batches are inserted in the same
+            transaction, under the 'ingest' profile of the warehouse: either the whole file
+            is loaded or nothing is.
+
+            The file is registered in the ingest ledger of the warehouse, in the same
+            transaction, and skipped if it was already loaded with the same checksum.
+
+            Args:
+            -----
+                path_to_file:
+                    String or pathlib.Path. DBF or DBC file from the SIHSUS database.
+                preffix:
+                    String. 'RD', 'SP' or 'RJ'.
+                batch_size:
+                    Integer. Number of records decoded and inserted at a time.
+                force:
+                    Bool. Load the file even if the ledger registers it as loaded.
+
+            Return:
+            -------
+                nrows:
+                    Integer or None. Number of records read from the file, or None if it
+                    was skipped.
+        '''
+        path_to_file = Path(path_to_file)
+        source = path_to_file.stem
+        table_name = SIH_TABLES[preffix]
+        checksum = file_checksum(path_to_file)
+        if not force and self.warehouse.is_loaded(source, table_name, checksum):
+            if verbose:
+                print(f"{source}: already loaded, skipped.")
+            return None
+
+        if path_to_file.suffix.lower() == ".dbc":
+            dbf = DBFIX(open_dbc(str(path_to_file)), codec='latin-1')
+        else:
+            dbf = DBFIX(str(path_to_file), codec='latin-1', memory_map=True)
+
+        try:
+            with self.warehouse.ingest_file(source, table_name, checksum) as load:
+                for batch in dbf.iter_batches(batch_size):
+                    self.insert_sih(batch, path_to_file.name, preffix, verbose=verbose, conn=load['conn'])
+                    load['nrows'] += batch.shape[0]
+        finally:
+            dbf.close()
+        return load['nrows']
 
     def insert_cnes(self, cnes_df, cnes_fname, preffix, verbose=False):
         '''
@@ -63,13 +202,13 @@ class HandlerSIH(HandlerBase):
         cnes_df["FONTE"] = [ fonte_name for n in range(cnes_df.shape[0]) ]
 
         if preffix == "ST":
-            self.warehouse.insert('cnes_estabelecimentos', cnes_df, batchsize=200, verbose=verbose)
+            self.warehouse.bulk_insert('cnes_estabelecimentos', cnes_df, on_conflict='ignore', verbose=verbose)
         elif preffix == "LT":
-            self.warehouse.insert('cnes_leitos', cnes_df, batchsize=200, verbose=verbose)
+            self.warehouse.bulk_insert('cnes_leitos', cnes_df, on_conflict='ignore', verbose=verbose)
         elif preffix == "PF":
-            self.warehouse.insert('cnes_profissionais', cnes_df, batchsize=200, verbose=verbose)
+            self.warehouse.bulk_insert('cnes_profissionais', cnes_df, on_conflict='ignore', verbose=verbose)
         elif preffix == "SR":
-            self.warehouse.insert('cnes_servico_especializado', cnes_df, batchsize=200, verbose=verbose)
+            self.warehouse.bulk_insert('cnes_servico_especializado', cnes_df, on_conflict='ignore', verbose=verbose)
 
 
 class HandlerCNES(HandlerBase):
@@ -90,17 +229,60 @@ class HandlerSIM(HandlerBase):
         self.warehouse = WarehouseSIM(self.engine_url)
         self.engine = self.warehouse.db_init()
     
-    def insert_sim(self, sim_df, sim_fname, verbose=False):
+    def insert_sim(self, sim_df, sim_fname, verbose=False, conn=None):
         '''
             Insert records to SIM warehouse from data expected to come
             from the official SIM data (official schema).
+
+            To register the file in the ingest ledger, insert it within
+            'warehouse.ingest_file' and pass its connection as 'conn'.
+        '''
+        sim_df = self.transform_sim(sim_df, sim_fname)
+        self.write_sim(sim_df, verbose=verbose, conn=conn)
+
+    @staticmethod
+    def transform_sim(sim_df, sim_fname):
+        '''
+            Transformations applied to the SIM records before insertion: dates, source
+            of the data and primary key.
         '''
         fonte_name = Path(sim_fname).stem
-        sim_df["DTOBITO"] = pd.to_datetime(sim_df["DTOBITO"], format="%d%m%Y", errors='coerce')
-        sim_df["DTNASC"] = pd.to_datetime(sim_df["DTNASC"], format="%d%m%Y", errors='coerce')
+        sim_df["DTOBITO"] = parse_dates(sim_df["DTOBITO"], format="%d%m%Y")
+        sim_df["DTNASC"] = parse_dates(sim_df["DTNASC"], format="%d%m%Y")
         sim_df["FONTE_DADOS"] = [ fonte_name for n in range(sim_df.shape[0]) ]
         sim_df = sim_df.rename({"contador": "CONTADOR"}, axis=1)
         sim_df["CHAVE_CONTADOR_FONTE"] = sim_df["CONTADOR"] + sim_df["FONTE_DADOS"]
+        return sim_df
+
+    def write_sim(self, sim_df, verbose=False, conn=None):
+        '''
+            Insert transformed SIM records (see 'transform_sim').
+        '''
+        return self.warehouse.bulk_insert('sim', sim_df, on_conflict='ignore', verbose=verbose, conn=conn)
+
+    @staticmethod
+    def prepare_sim(path_to_file):
+        '''
+            Read and transform a SIM file (DBC, DBF or PARQUET). Runs in the worker
+            processes of 'ingest_sim_files'.
+        '''
+        return HandlerSIM.transform_sim(read_source(path_to_file), Path(path_to_file).name)
+
+    def ingest_sim_files(self, files, n_workers=None, queue_size=2, force=False, verbose=False):
+        '''
+            Insert several SIM files, read and transformed in parallel and inserted by a
+            single writer (see 'HandlerSIH.ingest_sih_files').
+        '''
+        tasks = []
+        for path_to_file in files:
+            path_to_file = Path(path_to_file)
+            tasks.append({'source': path_to_file.stem, 'tables': ['sim'],
+                          'checksum': file_checksum(path_to_file), 'args': (str(path_to_file),)})
+
+        def write(sim_df, task, conn):
+            self.write_sim(sim_df, verbose=verbose, conn=conn)
+            return sim_df.shape[0]
 
-        self.warehouse.insert('sim', sim_df, batchsize=200, verbose=verbose)
+        return ingest_files(self.warehouse, tasks, HandlerSIM.prepare_sim, write, n_workers=n_workers,
+                            queue_size=queue_size, force=force, verbose=verbose)
         
@@ -1,8 +1,14 @@
+import io
 import os
+import mmap
 import struct
 import codecs
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import datetime
+import numpy as np
+import pandas as pd
 from simpledbf import Dbf5
 from simpledbf.simpledbf import DbfBase
 
@@ -22,13 +28,21 @@ class DBFIX(DbfBase):
     Parameters
     ----------
 
-    dbf : string
-        The name (with optional path) of the DBF file.
+    dbf : string or file object
+        The name (with optional path) of the DBF file, or a binary file object
+        positioned at the start of the DBF contents (e.g. a DBC stream from
+        `pyopensus.utils.dbc.open_dbc`).
 
     codec : string, optional
         The codec to use when decoding text-based records. The default is
         'utf-8'. See Python's `codec` standard lib module for other options.
 
+    memory_map : bool, optional
+        Memory-map the DBF file instead of reading it through a buffered file
+        object. The vectorized reader then decodes the records directly from the
+        mapped pages, touching only the byte ranges of the requested columns.
+        Ignored when `dbf` is a file object without a file descriptor.
+
     Attributes
     ----------
 
@@ -50,6 +64,9 @@ class DBFIX(DbfBase):
     fields : list of tuples
         Column descriptions as a tuple: (Name, Type, # of bytes).
 
+    decimals : dict
+        Number of decimal places of each column, as declared in the header.
+
     columns : list
         The names of the data columns.
 
@@ -58,15 +75,26 @@ class DBFIX(DbfBase):
 
     fmtsiz : int
         The size of each record in bytes.
+
+    dtype : numpy.dtype
+        Structured dtype of a record, with one fixed-width byte column per field.
+        Used by the vectorized reader ('to_dataframe_vectorized').
     '''
-    def __init__(self, dbf, codec='utf-8'):
+    def __init__(self, dbf, codec='utf-8', memory_map=False):
         self._enc = codec
-        path, name = os.path.split(dbf)
-        self.dbf = name
         # Escape quotes, set by indiviual runners
         self._esc = None
-        # Reading as binary so bytes will always be returned
-        self.f = open(dbf, 'rb')
+        if hasattr(dbf, 'read'):
+            # Already opened stream (e.g. decompressed DBC)
+            path, name = os.path.split(getattr(dbf, 'name', ''))
+            self.f = dbf
+            self.path = None
+        else:
+            path, name = os.path.split(dbf)
+            self.path = os.fspath(dbf)
+            # Reading as binary so bytes will always be returned
+            self.f = open(dbf, 'rb')
+        self.dbf = name
 
         self.numrec, self.lenheader = struct.unpack('<xxxxLH22x', 
                 self.f.read(32))    
@@ -74,11 +102,13 @@ class DBFIX(DbfBase):
 
         # The first field is always a one byte deletion flag
         fields = [('DeletionFlag', 'C', 1),]
+        self.decimals = {}
         for fieldno in range(self.numfields):
-            name, typ, size = struct.unpack('<11sc4xB15x', self.f.read(32))
+            name, typ, size, decimals = struct.unpack('<11sc4xBB14x', self.f.read(32))
             # eliminate NUL bytes from name string  
             name = name.strip(b'\x00')        
             fields.append((name.decode(self._enc), typ.decode(self._enc), size))
+            self.decimals[fields[-1][0]] = decimals
         self.fields = fields
         # Get the names only for DataFrame generation, skip delete flag
         self.columns = [f[0] for f in self.fields[1:]]
@@ -91,6 +121,15 @@ class DBFIX(DbfBase):
         self.fmt = ''.join(['{:d}s'.format(fieldinfo[2]) for 
                             fieldinfo in self.fields])
         self.fmtsiz = struct.calcsize(self.fmt)
+        self.dtype = np.dtype([(name, 'S{:d}'.format(size)) for name, typ, size in self.fields])
+
+        self._map = None
+        self._position = 0
+        if memory_map:
+            try:
+                self._map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+                self._map = None
 
     def _get_recs(self, chunk=None):
         '''Generator that returns individual records.
@@ -190,4 +229,405 @@ class DBFIX(DbfBase):
                     raise ValueError(err.format(value))
 
                 result.append(value)
-            yield result
\ No newline at end of file
+            yield result
+
+    # ------------------ vectorized decoding ------------------
+
+    def record_dtype(self, columns=None):
+        '''Structured dtype of a record restricted to the deletion flag and `columns`.
+
+        The offsets of the fields inside the record are kept, so the dtype can be
+        laid over the raw records and the other fields are never touched.
+        '''
+        if columns is None:
+            return self.dtype
+        unknown = [ col for col in columns if col not in self.dtype.fields or col == 'DeletionFlag' ]
+        if len(unknown) > 0:
+            raise Exception(f"Columns not present in {self.dbf}: {unknown}")
+        names = ['DeletionFlag'] + list(columns)
+        return np.dtype({'names': names,
+                         'formats': [ self.dtype.fields[name][0] for name in names ],
+                         'offsets': [ self.dtype.fields[name][1] for name in names ],
+                         'itemsize': self.fmtsiz})
+
+    def _read_records(self, count=None, columns=None):
+        '''Read the next `count` records as a NumPy structured array (raw bytes).
+
+        With `memory_map` the array is a view of the mapped file, otherwise the
+        records are read from the file object.
+        '''
+        if count is None:
+            count = self.numrec
+        dtype = self.record_dtype(columns)
+        if self._map is not None:
+            start = self._position
+            stop = min(start + count, self.numrec, (len(self._map) - self.lenheader)//self.fmtsiz)
+            self._position = max(start, stop)
+            return np.ndarray((self._position - start,), dtype=dtype, buffer=self._map,
+                              offset=self.lenheader + start*self.fmtsiz)
+        data = self.f.read(count*self.fmtsiz)
+        return np.frombuffer(data, dtype=dtype, count=len(data)//self.fmtsiz)
+
+    def _read_columns(self, columns=None, filters=None):
+        '''Columns to lay over the raw records: the requested ones and the filtered ones.'''
+        if columns is None or not filters:
+            return columns
+        read_columns = list(columns)
+        for col, op, value in filters:
+            if col not in read_columns:
+                read_columns.append(col)
+        return read_columns
+
+    def filter_mask(self, records, filters):
+        '''Boolean mask of the records satisfying all `filters`, computed on raw bytes.
+
+        Each filter is a tuple `(column, op, value)` with `op` one of '==', '!=',
+        '<', '<=', '>', '>=', 'in' and 'not in' ('in' takes a list of values).
+        Text and date fields are compared as fixed-width bytes (dates given as
+        'YYYYMMDD', `datetime.date` or `datetime.datetime`, also for text fields
+        holding dates such as 'DT_INTER'), so they are never decoded; numeric
+        fields are parsed from their digits only.
+        '''
+        mask = np.ones(len(records), dtype=bool)
+        types = { name: (typ, size) for name, typ, size in self.fields }
+        for col, op, value in filters:
+            if col not in types or col == 'DeletionFlag':
+                raise Exception(f"Filter column not present in {self.dbf}: {col}")
+            if op not in _FILTER_OPS:
+                raise Exception(f"Filter operator not supported: {op}")
+            typ, size = types[col]
+            if op in ['==', '!=']:
+                op, value = ('in' if op == '==' else 'not in'), [value]
+            values = value if op in ['in', 'not in'] else [value]
+            if typ in ['N', 'F']:
+                column = _parse_numeric(_byte_matrix(records[col], size), False)
+                values = [ float(v) for v in values ]
+            else:
+                column = records[col]
+                values = [ _raw_value(v, typ, size, self._enc) for v in values ]
+            if op in ['in', 'not in']:
+                hit = np.isin(column, values)
+                if typ not in ['N', 'F']:
+                    # -- values padded with NUL instead of spaces
+                    hit |= np.isin(column, [ v.rstrip(b' ') for v in values ])
+                mask &= hit if op == 'in' else ~hit
+            else:
+                mask &= _FILTER_OPS[op](column, values[0])
+        return mask
+
+    def _decode_records(self, records, columns=None, filters=None):
+        '''Decode a structured array of raw records into a DataFrame.
+
+        Each column is decoded at once: the deletion flag becomes a boolean mask,
+        text is decoded and stripped in bulk, numbers are parsed from the digits
+        of the fixed-width byte matrix and dates by `pandas.to_datetime`. Only the
+        `columns` requested (default all) are decoded, and only for the records
+        satisfying `filters` (see `filter_mask`).
+        '''
+        if columns is None:
+            columns = self.columns
+        kept = records['DeletionFlag'] == b' '
+        if filters:
+            kept &= self.filter_mask(records, filters)
+        types = { name: (typ, size) for name, typ, size in self.fields }
+        data = {}
+        for name in columns:
+            typ, size = types[name]
+            column = records[name][kept]
+            if typ == 'C':
+                data[name] = _decode_text(column, self._enc, self._esc)
+            elif typ == 'N':
+                as_int = self.decimals.get(name, 0) == 0 and size < 19
+                data[name] = _parse_numeric(_byte_matrix(column, size), as_int)
+            elif typ == 'F':
+                data[name] = _parse_numeric(_byte_matrix(column, size), False)
+            elif typ == 'D':
+                data[name] = _parse_dates(column)
+            elif typ == 'L':
+                values = pd.array([None]*len(column), dtype='boolean')
+                values[np.isin(column, [b'T', b't', b'Y', b'y'])] = True
+                values[np.isin(column, [b'F', b'f', b'N', b'n'])] = False
+                data[name] = values
+            else:
+                err = 'Column type "{}" not yet supported.'
+                raise ValueError(err.format(typ))
+        return pd.DataFrame(data, columns=list(columns))
+
+    def to_dataframe_vectorized(self, chunksize=None, columns=None, filters=None):
+        '''Read the records into a DataFrame, decoding whole columns at a time.
+
+        Same result as `to_dataframe`, but the fields are decoded with NumPy
+        instead of a Python loop over each value of each record.
+
+        Parameters
+        ----------
+        chunksize : int, optional
+            Number of records of each DataFrame. Default 'None' returns a single
+            DataFrame; otherwise a generator of DataFrames is returned.
+
+        columns : list, optional
+            Names of the columns to decode (in the order given). Default 'None'
+            decodes all columns.
+
+        filters : list, optional
+            Tuples `(column, op, value)` the records must satisfy (see
+            `filter_mask`). Other records are skipped before decoding.
+        '''
+        if chunksize is None:
+            records = self._read_records(columns=self._read_columns(columns, filters))
+            return self._decode_records(records, columns, filters)
+        return self.iter_batches(chunksize, columns, filters=filters)
+
+    def column_dtypes(self, columns=None):
+        '''pandas dtype of each column, fixed from the header.
+
+        Text is 'string', numbers without decimal places 'Int64' (nullable),
+        other numbers 'float64', dates 'datetime64[s]' and logicals 'boolean'.
+        '''
+        types = { name: (typ, size) for name, typ, size in self.fields[1:] }
+        dtypes = {}
+        for name in (self.columns if columns is None else columns):
+            typ, size = types[name]
+            if typ == 'N' and self.decimals.get(name, 0) == 0 and size < 19:
+                dtypes[name] = 'Int64'
+            elif typ in ['N', 'F']:
+                dtypes[name] = 'float64'
+            elif typ == 'D':
+                dtypes[name] = 'datetime64[s]'
+            elif typ == 'L':
+                dtypes[name] = 'boolean'
+            else:
+                dtypes[name] = 'string'
+        return dtypes
+
+    def arrow_schema(self, columns=None):
+        '''Arrow schema equivalent to `column_dtypes` (requires pyarrow).'''
+        import pyarrow as pa
+        arrow_types = {'Int64': pa.int64(), 'float64': pa.float64(), 'datetime64[s]': pa.date32(),
+                       'boolean': pa.bool_(), 'string': pa.string()}
+        return pa.schema([ pa.field(name, arrow_types[dtype]) for name, dtype in self.column_dtypes(columns).items() ])
+
+    def iter_batches(self, batch_size=100000, columns=None, as_arrow=False, filters=None):
+        '''Generator of typed batches of records, in file order.
+
+        The dtypes are fixed once from the header (see `column_dtypes`), so every
+        batch has the same schema regardless of its values, and only one batch
+        is held in memory at a time.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            Number of records read per batch (deleted records are dropped, so a
+            batch can be smaller).
+
+        columns : list, optional
+            Names of the columns to decode. Default 'None' decodes all columns.
+
+        as_arrow : bool, optional
+            Yield `pyarrow.RecordBatch` objects instead of DataFrames.
+
+        filters : list, optional
+            Tuples `(column, op, value)` the records must satisfy (see
+            `filter_mask`). Other records are skipped before decoding.
+        '''
+        read_columns = self._read_columns(columns, filters)
+        remaining = self.numrec
+        while remaining > 0:
+            records = self._read_records(min(batch_size, remaining), read_columns)
+            if len(records) == 0:
+                break
+            remaining -= len(records)
+            yield self._typed_batch(records, columns, as_arrow, filters)
+
+    def _typed_batch(self, records, columns=None, as_arrow=False, filters=None):
+        '''Decode raw records and cast them to the dtypes fixed by the header.'''
+        batch = _coerce_batch(self._decode_records(records, columns, filters), self.column_dtypes(columns))
+        if as_arrow:
+            import pyarrow as pa
+            batch = pa.RecordBatch.from_pandas(batch, schema=self.arrow_schema(columns), preserve_index=False)
+        return batch
+
+    def _seek_record(self, index):
+        '''Position the reader at record `index` (0-based).'''
+        if self._map is not None:
+            self._position = index
+        else:
+            self.f.seek(self.lenheader + index*self.fmtsiz)
+
+    def iter_shards(self, shard_size=100000, columns=None, n_workers=None, as_arrow=False, filters=None):
+        '''Decode the file in a process pool, yielding the shards in file order.
+
+        The records are split into ranges of `shard_size` records. Since the
+        records have a fixed width, each worker memory-maps the file and decodes
+        its range independently. At most two shards per worker are in flight, so
+        memory stays bounded while the shards are consumed.
+
+        Parameters
+        ----------
+        shard_size : int, optional
+            Number of records of each shard.
+
+        columns : list, optional
+            Names of the columns to decode. Default 'None' decodes all columns.
+
+        n_workers : int, optional
+            Number of processes. Default 'None' uses the number of CPUs.
+
+        as_arrow : bool, optional
+            Yield `pyarrow.RecordBatch` objects instead of DataFrames.
+
+        filters : list, optional
+            Tuples `(column, op, value)` the records must satisfy (see
+            `filter_mask`).
+        '''
+        if self.path is None:
+            raise Exception("Parallel decoding needs a DBF file on disk, not a stream.")
+        if columns is not None:
+            self.record_dtype(columns)
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+
+        ranges = [ (start, min(start + shard_size, self.numrec)) for start in range(0, self.numrec, shard_size) ]
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            pending = deque()
+            for start, stop in ranges:
+                pending.append(executor.submit(_decode_shard, self.path, self._enc, start, stop,
+                                               columns, as_arrow, filters))
+                if len(pending) >= 2*n_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def to_dataframe_parallel(self, n_workers=None, columns=None, shard_size=None, filters=None):
+        '''Read the records into a single DataFrame, decoding shards in parallel.
+
+        Parameters
+        ----------
+        n_workers : int, optional
+            Number of processes. Default 'None' uses the number of CPUs.
+
+        columns : list, optional
+            Names of the columns to decode. Default 'None' decodes all columns.
+
+        shard_size : int, optional
+            Number of records of each shard. Default 'None' splits the file in
+            one shard per worker.
+
+        filters : list, optional
+            Tuples `(column, op, value)` the records must satisfy (see
+            `filter_mask`).
+        '''
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        if shard_size is None:
+            shard_size = max(1, -(-self.numrec // n_workers))
+        shards = list(self.iter_shards(shard_size, columns, n_workers, filters=filters))
+        if len(shards) == 0:
+            return pd.DataFrame({ name: pd.Series(dtype=dtype) for name, dtype in self.column_dtypes(columns).items() })
+        return pd.concat(shards, ignore_index=True)
+
+    def close(self):
+        '''Release the memory map (if any) and close the file.'''
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.f.close()
+
+
+def _decode_shard(path, codec, start, stop, columns=None, as_arrow=False, filters=None):
+    '''Worker of `DBFIX.iter_shards`: decode the records [start, stop) of a DBF file.'''
+    dbf = DBFIX(path, codec=codec, memory_map=True)
+    try:
+        dbf._seek_record(start)
+        records = dbf._read_records(stop - start, dbf._read_columns(columns, filters))
+        return dbf._typed_batch(records, columns, as_arrow, filters)
+    finally:
+        dbf.close()
+
+_FILTER_OPS = {
+    '==': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal,
+    '>': np.greater, '>=': np.greater_equal, 'in': None, 'not in': None,
+}
+
+def _raw_value(value, typ, size, codec):
+    '''Fixed-width bytes of a filter value, as stored in a text or date field.'''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.strftime('%Y%m%d')
+    if not isinstance(value, bytes):
+        value = str(value).encode(codec)
+    return value.ljust(size)
+
+def _byte_matrix(column, size):
+    '''View a fixed-width byte column as a (records x size) uint8 matrix.'''
+    return np.ascontiguousarray(column).view(np.uint8).reshape(-1, size)
+
+def _decode_text(column, codec, esc=None):
+    '''Decode and strip a fixed-width byte column; empty values become None.'''
+    if codecs.lookup(codec).name in ('latin-1', 'iso8859-1'):
+        # -- latin-1 bytes are the code points themselves: widen to UCS4 without decoding
+        size = column.dtype.itemsize
+        text = _byte_matrix(column, size).astype(np.uint32).view('U{:d}'.format(size)).ravel()
+    else:
+        text = np.char.decode(column, codec)
+    text = np.char.strip(text)
+    if esc:
+        text = np.char.replace(text, '"', esc + '"')
+    values = text.astype(object)
+    values[text == ''] = None
+    return values
+
+def _parse_dates(column):
+    '''Parse a column of 'YYYYMMDD' dates; blank or invalid values become NaT.'''
+    values = pd.to_datetime(pd.Series(column.astype('U8')), format='%Y%m%d', errors='coerce')
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        # -- no valid date in the chunk
+        return np.full(len(column), np.datetime64('NaT'), dtype='datetime64[s]')
+    return values.values.astype('datetime64[s]')
+
+def _coerce_batch(batch, dtypes):
+    '''Cast a decoded batch to `dtypes` (see `column_dtypes`), whatever its values.
+
+    Integer fields holding fractional text (parsed as floats) are rounded, and
+    date columns without any valid value (all missing) are converted to NaT, so
+    that every batch gets the schema fixed by the header.
+    '''
+    for name, dtype in dtypes.items():
+        values = batch[name]
+        if dtype == 'Int64' and pd.api.types.is_float_dtype(values):
+            batch[name] = values.round()
+        elif dtype == 'datetime64[s]' and not pd.api.types.is_datetime64_any_dtype(values):
+            batch[name] = pd.to_datetime(values, errors='coerce')
+    return batch.astype(dtypes)
+
+def _parse_numeric(matrix, as_int):
+    '''Parse a matrix of fixed-width ASCII numbers (right justified, optional sign and dot).
+
+    Values that are blank or not numbers become missing. Integer columns are
+    returned as 'Int64' unless a value has a fractional part.
+    '''
+    is_digit = (matrix >= 48) & (matrix <= 57)
+    is_dot = matrix == 46
+    is_minus = matrix == 45
+    is_blank = (matrix == 32) | (matrix == 0)
+    valid = ((is_digit | is_dot | is_minus | is_blank).all(axis=1) & is_digit.any(axis=1) &
+             (is_dot.sum(axis=1) <= 1) & (is_minus.sum(axis=1) <= 1))
+
+    # -- power of ten of each digit: number of digits at its right
+    digits = np.where(is_digit, matrix - 48, 0)
+    power = np.cumsum(is_digit[:, ::-1], axis=1)[:, ::-1] - is_digit
+    ndecimals = np.where(is_dot, power, 0).sum(axis=1)
+    negative = is_minus.any(axis=1)
+
+    if matrix.shape[1] < 19:
+        mantissa = (digits.astype(np.int64)*(10**power.astype(np.int64))).sum(axis=1)
+        mantissa = np.where(negative, -mantissa, mantissa)
+        scale = 10**ndecimals.astype(np.int64)
+        if as_int and not (mantissa % scale)[valid].any():
+            values = pd.array(mantissa//scale, dtype='Int64')
+            values[~valid] = pd.NA
+            return values
+        values = mantissa/scale
+    else:
+        values = (digits*(10.**power)).sum(axis=1)/10.**ndecimals
+        values = np.where(negative, -values, values)
+    return np.where(valid, values, np.nan)
@@ -0,0 +1,281 @@
+'''
+    Catalog of the statistics of PARQUET files.
+
+    For each registered file, the number of records and the minimum and maximum values of
+    a few key columns (period and municipality/establishment codes) are stored for the
+    whole file and for each of its row groups in a SQLite database. Period or municipality
+    queries look up the catalog first and only open the files, and read the row groups,
+    whose ranges intersect the requested one.
+
+    Values are compared with their own type: numbers as numbers, text as text and dates
+    as 'YYYY-MM-DD' text, whether they are typed in the file or written as text (see
+    'DATE_FORMATS'). Bounds given by the user are converted in the same way. Statistics
+    whose order is not the order of the values (e.g. 'DDMMYYYY' dates written as text)
+    can not be used to skip data, so the files and row groups holding them are always read.
+'''
+import os
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, select, delete, and_, or_
+from sqlalchemy import Column, Table, MetaData, Integer, String, Float
+
+# -- columns whose statistics are kept by default
+KEY_COLUMNS = ['DT_INTER', 'DTOBITO', 'COMPET', 'MUNIC_RES', 'MUNIC_MOV', 'CODMUNRES', 'CODMUNOCOR', 'CNES']
+
+# -- layout of the dates of the key columns when they are written as text (not typed)
+DATE_FORMATS = { 'DT_INTER': '%Y%m%d', 'DTOBITO': '%d%m%Y', 'COMPET': '%Y%m' }
+
+
+class ParquetCatalog:
+    '''
+        Per-file and per-row-group statistics of PARQUET files, stored in SQLite.
+
+        Paths are stored relative to the folder of the catalog, so that a dataset and its
+        catalog can be moved together.
+
+        Args:
+        -----
+            path:
+                String. SQLite file of the catalog (created if it does not exist).
+            key_columns:
+                List of Strings. Columns whose minimum and maximum values are registered.
+    '''
+    def __init__(self, path, key_columns=None):
+        self.path = path
+        self.base = os.path.dirname(os.path.abspath(path))
+        self.key_columns = KEY_COLUMNS if key_columns is None else key_columns
+
+        self._engine = create_engine(f"sqlite:///{os.path.abspath(path)}", future=True)
+        self._metadata = MetaData()
+        self.files = Table(
+            'parquet_files', self._metadata,
+            Column('path', String, primary_key=True),
+            Column('num_rows', Integer, nullable=False),
+            Column('num_row_groups', Integer, nullable=False),
+            Column('modified', String, nullable=True),
+        )
+        self.stats = Table(
+            'parquet_statistics', self._metadata,
+            Column('path', String, nullable=False, index=True),
+            Column('row_group', Integer, nullable=True), # -- None for the whole file
+            Column('column_name', String, nullable=False, index=True),
+            Column('num_rows', Integer, nullable=False),
+            Column('value_type', String, nullable=True), # -- 'number', 'text' or 'unordered'
+            Column('min_value', String, nullable=True),
+            Column('max_value', String, nullable=True),
+            Column('min_number', Float, nullable=True),
+            Column('max_number', Float, nullable=True),
+        )
+        self._metadata.create_all(self._engine)
+
+    def _relative(self, path_to_parquet):
+        return os.path.relpath(os.path.abspath(path_to_parquet), self.base)
+
+    def register(self, path_to_parquet):
+        '''
+            Store (or replace) the statistics of a PARQUET file.
+
+            The minimum and maximum values come from the row group statistics written in the
+            footer of the file, so the data pages are not read.
+        '''
+        relpath = self._relative(path_to_parquet)
+        metadata = pq.ParquetFile(path_to_parquet).metadata
+        names = metadata.schema.to_arrow_schema().names
+        positions = { name: i for i, name in enumerate(names) if name in self.key_columns }
+
+        records = []
+        for col, i in positions.items():
+            file_min, file_max = None, None
+            for rg in range(metadata.num_row_groups):
+                row_group = metadata.row_group(rg)
+                statistics = row_group.column(i).statistics
+                low, high = None, None
+                if statistics is not None and statistics.has_min_max:
+                    low, high = _normalize(col, statistics.min, stored=True), _normalize(col, statistics.max, stored=True)
+                    file_min = low if file_min is None else _merge(file_min, low, min)
+                    file_max = high if file_max is None else _merge(file_max, high, max)
+                records.append(_statistics_record(relpath, rg, col, row_group.num_rows, low, high))
+            records.append(_statistics_record(relpath, None, col, metadata.num_rows, file_min, file_max))
+
+        modified = dt.datetime.fromtimestamp(os.path.getmtime(path_to_parquet)).isoformat()
+        with self._engine.begin() as conn:
+            conn.execute(delete(self.stats).where(self.stats.c.path==relpath))
+            conn.execute(delete(self.files).where(self.files.c.path==relpath))
+            conn.execute(self.files.insert().values(path=relpath, num_rows=metadata.num_rows,
+                                                    num_row_groups=metadata.num_row_groups, modified=modified))
+            if len(records) > 0:
+                conn.execute(self.stats.insert(), records)
+
+    def unregister(self, path_to_parquet):
+        relpath = self._relative(path_to_parquet)
+        with self._engine.begin() as conn:
+            conn.execute(delete(self.stats).where(self.stats.c.path==relpath))
+            conn.execute(delete(self.files).where(self.files.c.path==relpath))
+
+    def _overlap(self, column, low, high):
+        '''
+            Condition of the statistics whose range intersects [low, high], compared as numbers
+            or as text depending on the type of the statistics. Ranges without statistics (e.g.
+            only null values) never match, while 'unordered' ones always match.
+        '''
+        stats = self.stats.c
+        number_cond, text_cond = [ stats.value_type=='number' ], [ stats.value_type=='text' ]
+        for bound, stat_col, number_col, op in [(low, stats.max_value, stats.max_number, '>='),
+                                                (high, stats.min_value, stats.min_number, '<=')]:
+            if bound is None:
+                continue
+            number, text = _as_number(bound), _bound_text(column, bound)
+            # -- bounds that are not numbers can not restrict numeric statistics
+            if number is not None:
+                number_cond.append(number_col >= number if op=='>=' else number_col <= number)
+            text_cond.append(stat_col >= text if op=='>=' else stat_col <= text)
+        return and_(stats.column_name==column, or_(and_(*number_cond), and_(*text_cond), stats.value_type=='unordered'))
+
+    def select_files(self, column, low=None, high=None):
+        '''
+            Files (absolute paths) that may hold records with 'low' <= column <= 'high'.
+
+            Files without the column are not returned.
+        '''
+        stmt = select(self.stats.c.path).where(and_(self.stats.c.row_group.is_(None), self._overlap(column, low, high)))
+        with self._engine.connect() as conn:
+            paths = conn.execute(stmt.order_by(self.stats.c.path)).scalars().all()
+        return [ os.path.join(self.base, path) for path in paths ]
+
+    def select_row_groups(self, path_to_parquet, column, low=None, high=None):
+        '''
+            Indices of the row groups of a file that may hold records with 'low' <= column <= 'high'.
+        '''
+        relpath = self._relative(path_to_parquet)
+        stmt = select(self.stats.c.row_group).where(and_(self.stats.c.path==relpath, self.stats.c.row_group.is_not(None),
+                                                         self._overlap(column, low, high)))
+        with self._engine.connect() as conn:
+            return conn.execute(stmt.order_by(self.stats.c.row_group)).scalars().all()
+
+    def read(self, column, low=None, high=None, columns=None):
+        '''
+            Read the records with 'low' <= column <= 'high' into a DataFrame, opening only the
+            selected files and reading only their selected row groups.
+
+            The filtered column is read even when it is not in 'columns', and dropped after
+            the records outside the range are removed.
+        '''
+        read_columns = columns
+        if columns is not None and column not in columns:
+            read_columns = list(columns) + [column]
+        tables = []
+        for path in self.select_files(column, low, high):
+            row_groups = self.select_row_groups(path, column, low, high)
+            if len(row_groups) == 0:
+                continue
+            table = pq.ParquetFile(path).read_row_groups(row_groups, columns=read_columns)
+            tables.append(table)
+        if len(tables) == 0:
+            return pd.DataFrame(columns=columns)
+        df = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+        # -- row groups may also hold records outside the range
+        df = df[df[column].map(lambda value: _in_range(column, value, low, high))]
+        if read_columns is not columns:
+            df = df[columns]
+        return df.reset_index(drop=True)
+
+    def summary(self):
+        '''
+            DataFrame with the number of records and row groups of each registered file.
+        '''
+        with self._engine.connect() as conn:
+            rows = conn.execute(select(self.files).order_by(self.files.c.path)).mappings().all()
+        return pd.DataFrame([ dict(row) for row in rows ], columns=[ col.name for col in self.files.columns ])
+
+
+def _normalize(column, value, stored=False):
+    '''
+        Comparable form of a value: ('number', float), ('text', String) or None when missing.
+
+        Dates, typed or written as text in the layout of 'DATE_FORMATS', become 'YYYY-MM-DD'
+        text. For statistics read from the files ('stored'), text dates whose layout does not
+        start with the year are ('unordered', text): their minimum and maximum are not the
+        first and last dates.
+    '''
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (dt.datetime, pd.Timestamp)):
+        return ('text', value.date().isoformat())
+    if isinstance(value, dt.date):
+        return ('text', value.isoformat())
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)):
+        return ('number', float(value))
+    value = str(value)
+    if column in DATE_FORMATS:
+        try:
+            date = dt.datetime.strptime(value, DATE_FORMATS[column]).date().isoformat()
+        except ValueError:
+            return ('text', value)
+        if stored and not DATE_FORMATS[column].startswith('%Y'):
+            return ('unordered', date)
+        return ('text', date)
+    return ('text', value)
+
+def _as_number(value):
+    '''
+        Bound as a number, or None if it is not numeric (e.g. a date).
+    '''
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+def _bound_text(column, bound):
+    '''
+        Bound compared with text values (e.g. 230440 with the code '230440').
+    '''
+    kind, value = _normalize(column, bound)
+    if kind == 'number':
+        return str(int(value)) if value.is_integer() else str(value)
+    return value
+
+def _merge(current, value, reduce):
+    # -- statistics of different types (e.g. a row group of text dates) are not comparable
+    if current[0] != value[0] or current[0] == 'unordered':
+        return ('unordered', current[1])
+    return (current[0], reduce(current[1], value[1]))
+
+def _statistics_record(relpath, row_group, column, num_rows, low, high):
+    record = {'path': relpath, 'row_group': row_group, 'column_name': column, 'num_rows': num_rows,
+              'value_type': None, 'min_value': None, 'max_value': None, 'min_number': None, 'max_number': None}
+    if low is None or high is None:
+        return record
+    record['value_type'] = low[0] if low[0] == high[0] else 'unordered'
+    if record['value_type'] == 'number':
+        record['min_number'], record['max_number'] = low[1], high[1]
+    else:
+        record['min_value'], record['max_value'] = str(low[1]), str(high[1])
+    return record
+
+def _in_range(column, value, low, high):
+    '''
+        Whether a value read from a file is within [low, high] (missing values never are).
+    '''
+    value = _normalize(column, value)
+    if value is None:
+        return False
+    for bound, inside in [(low, lambda a, b: a >= b), (high, lambda a, b: a <= b)]:
+        if bound is None:
+            continue
+        if value[0] == 'number':
+            number = _as_number(bound)
+            if number is not None and not inside(value[1], number):
+                return False
+        elif not inside(value[1], _bound_text(column, bound)):
+            return False
+    return True
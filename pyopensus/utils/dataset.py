@@ -0,0 +1,172 @@
+'''
+    Hive-partitioned PARQUET dataset of converted DATASUS files.
+
+    Each DBC file is converted into a PARQUET file stored under
+
+        <root>/system=<source>/prefix=<preffix>/uf=<UF>/year=<YYYY>/month=<MM>/<FILENAME>.parquet
+
+    ('month' is omitted for yearly sources such as SIM). The union of the schemas of all
+    files is kept in '<root>/_common_metadata', so the whole dataset can be scanned with a
+    single schema (columns missing in older files are read as nulls) and readers only open
+    the partitions selected by their filters. The statistics of every file are registered
+    in the catalog '<root>/_catalog.sqlite' (see 'pyopensus.utils.catalog').
+'''
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import pyopensus.utils.utils as utils
+from pyopensus.utils.parquet import dbc_to_parquet
+from pyopensus.utils.catalog import ParquetCatalog
+
+COMMON_METADATA = '_common_metadata'
+CATALOG = '_catalog.sqlite'
+
+# -- types of the partition keys (directory names)
+PARTITIONING = ds.partitioning(pa.schema([
+    ('system', pa.string()),
+    ('prefix', pa.string()),
+    ('uf', pa.string()),
+    ('year', pa.int16()),
+    ('month', pa.int8()),
+]), flavor='hive')
+
+_metadata_lock = threading.Lock()
+
+def partition_dir(root, origin, filename):
+    '''
+        Directory of the dataset partition of a DATASUS file.
+
+        Args:
+        -----
+            root:
+                String. Root folder of the dataset.
+            origin:
+                String. Source of the data (see Opensus.get_sources()).
+            filename:
+                String. Name of the DATASUS file (e.g. 'RDCE2401.dbc').
+    '''
+    parts = utils.parse_filename(origin, filename)
+    path = os.path.join(root, f"system={parts['system']}", f"prefix={parts['preffix']}",
+                        f"uf={parts['uf']}", f"year={parts['year']}")
+    if parts['month'] is not None:
+        path = os.path.join(path, f"month={parts['month']}")
+    return path
+
+def dataset_schema(root):
+    '''
+        Unified schema of the dataset, or None if nothing was written yet.
+    '''
+    path = os.path.join(root, COMMON_METADATA)
+    if not os.path.isfile(path):
+        return None
+    return pq.read_schema(path)
+
+def update_schema(root, schema):
+    '''
+        Merge 'schema' into the unified schema of the dataset ('_common_metadata').
+
+        New columns are appended and numeric types are promoted (e.g. int64 and double
+        become double). Incompatible types for the same column raise an exception, so
+        that a month with a different layout is not silently written.
+    '''
+    schema = schema.remove_metadata()
+    with _metadata_lock:
+        current = dataset_schema(root)
+        if current is not None:
+            try:
+                schema = pa.unify_schemas([current, schema], promote_options='permissive')
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as err:
+                raise Exception(f"Schema not compatible with the dataset at {root}: {err}")
+            if schema.equals(current):
+                return current
+        os.makedirs(root, exist_ok=True)
+        tmp_path = os.path.join(root, f'{COMMON_METADATA}.tmp')
+        pq.write_metadata(schema, tmp_path)
+        os.replace(tmp_path, os.path.join(root, COMMON_METADATA))
+    return schema
+
+def dbc_to_dataset(path_to_dbc, root, origin, chunksize=100000, codec='latin-1', compression='snappy', columns=None, filters=None,
+                   normalizer=None, row_group_size=None, sort_by=None):
+    '''
+        Convert a DBC file into a PARQUET file of the partitioned dataset.
+
+        Args:
+        -----
+            path_to_dbc:
+                String. Input DBC file, named after the DATASUS convention.
+            root:
+                String. Root folder of the dataset.
+            origin:
+                String. Source of the data (see Opensus.get_sources()).
+            chunksize, codec, compression, columns, filters, normalizer, row_group_size, sort_by:
+                See 'pyopensus.utils.parquet.dbc_to_parquet'.
+
+        Return:
+        -------
+            path_to_parquet:
+                String. PARQUET file written.
+    '''
+    folder = partition_dir(root, origin, path_to_dbc)
+    os.makedirs(folder, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path_to_dbc))[0].upper()
+    path_to_parquet = os.path.join(folder, f'{stem}.parquet')
+
+    # -- hidden while being written (readers ignore names starting with '.')
+    tmp_path = os.path.join(folder, f'.{stem}.parquet.tmp')
+    dbc_to_parquet(path_to_dbc, tmp_path, chunksize=chunksize, codec=codec, compression=compression,
+                   columns=columns, filters=filters, normalizer=normalizer, row_group_size=row_group_size,
+                   sort_by=sort_by)
+    update_schema(root, pq.read_schema(tmp_path))
+    os.replace(tmp_path, path_to_parquet)
+    with _metadata_lock:
+        catalog(root).register(path_to_parquet)
+    return path_to_parquet
+
+def catalog(root):
+    '''
+        Catalog of the row group statistics of the files of the dataset.
+    '''
+    return ParquetCatalog(os.path.join(root, CATALOG))
+
+def open_dataset(root):
+    '''
+        Lazy 'pyarrow.dataset.Dataset' over the partitioned dataset, with the unified schema
+        plus the partition columns ('system', 'prefix', 'uf', 'year', 'month').
+    '''
+    schema = dataset_schema(root)
+    if schema is None:
+        raise Exception(f"No dataset found at {root}.")
+    for field in PARTITIONING.schema:
+        if field.name not in schema.names:
+            schema = schema.append(field)
+    return ds.dataset(root, schema=schema, format='parquet', partitioning=PARTITIONING,
+                      exclude_invalid_files=False, ignore_prefixes=['.', '_'])
+
+def read_dataset(root, columns=None, filters=None):
+    '''
+        Read the records of the dataset selected by 'filters' into a DataFrame.
+
+        Partitions that do not match the filters on 'system', 'prefix', 'uf', 'year' and
+        'month' are not opened. For instance, all RD files of the Northeast in 2019-2023:
+
+            read_dataset(root, filters=[('prefix', '==', 'RD'), ('uf', 'in', ['CE', 'PE', ...]),
+                                        ('year', '>=', 2019), ('year', '<=', 2023)])
+
+        Args:
+        -----
+            root:
+                String. Root folder of the dataset.
+            columns:
+                None or List of Strings. Columns to read (default all).
+            filters:
+                None, List of Tuples (column, op, value) or pyarrow.compute.Expression.
+    '''
+    expression = filters
+    if isinstance(filters, list):
+        expression = pq.filters_to_expression(filters) if len(filters) > 0 else None
+    table = open_dataset(root).to_table(columns=columns, filter=expression)
+    return table.to_pandas()
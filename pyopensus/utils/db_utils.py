@@ -5,7 +5,44 @@
 import pandas as pd
 from sqlalchemy import text
 
-def perform_query(query_str, engine, batchsize=1000):
+def iter_query(query_str, engine, batchsize=100000, params=None, as_arrow=False, bindparams=None):
+    '''
+        Perform a SQL query and yield its result in batches of at most 'batchsize' rows,
+        so that large results are never held in memory as a whole. A query without rows
+        yields a single empty batch, with the columns of the result.
+
+        Args:
+        -----
+            query_str:
+                String. SQL query (with ':name' placeholders for 'params').
+            engine:
+                sqlalchemy.engine.base.Engine. engine used for database connection.
+            batchsize:
+                Integer. Maximum number of rows of each batch.
+            params:
+                None or Dictionary. Values of the bound parameters of the query.
+            as_arrow:
+                Bool. Yield 'pyarrow.RecordBatch' instead of pandas.DataFrame.
+            bindparams:
+                None or List of sqlalchemy.sql.expression.BindParameter. Typed bound parameters
+                of the query (e.g. dates, converted to the format stored by the database).
+
+        Return:
+        -------
+            batches:
+                Generator of pandas.DataFrame (or pyarrow.RecordBatch).
+    '''
+    with engine.connect() as conn:
+        qres = conn.execution_options(stream_results=True).execute(_statement(query_str, bindparams), params or {})
+        columns = list(qres.keys())
+        nbatches = 0
+        for rows in qres.partitions(batchsize):
+            nbatches += 1
+            yield _as_batch(pd.DataFrame.from_records(rows, columns=columns), as_arrow)
+        if nbatches == 0:
+            yield _as_batch(pd.DataFrame(columns=columns), as_arrow)
+
+def perform_query(query_str, engine, batchsize=1000, params=None, bindparams=None):
     '''
         ...
 
@@ -15,26 +52,29 @@ def perform_query(query_str, engine, batchsize=1000):
                 String. SQL query.
             engine:
                 sqlalchemy.engine.base.Engine. engine used for database connection.
+            params:
+                None or Dictionary. Values of the bound parameters of the query.
+            bindparams:
+                None or List of sqlalchemy.sql.expression.BindParameter. Typed bound parameters.
 
         Return:
         -------
             res_df:
                 pandas.DataFrame. Dataframe corresponding to the fetched data from the SQL query.
     '''
-    schema_data = {
-        'rows': [],
-        'columns': [],
-    }
+    batches = list(iter_query(query_str, engine, batchsize=batchsize, params=params, bindparams=bindparams))
+    if len(batches) == 1:
+        return batches[0]
+    return pd.concat(batches, ignore_index=True)
 
-    with engine.connect() as conn:
-        qres = conn.execute(text(query_str))
-        schema_data['columns'] = list(qres.keys())
-
-        while True:
-            rows = qres.fetchmany(batchsize)
-            if not rows:
-                break
-            schema_data["rows"] += [ row for row in rows ]
-    
-    res_df = pd.DataFrame(schema_data['rows'], columns=schema_data['columns'])
-    return res_df
\ No newline at end of file
+def _statement(query_str, bindparams=None):
+    stmt = text(query_str)
+    if bindparams is not None:
+        stmt = stmt.bindparams(*bindparams)
+    return stmt
+
+def _as_batch(df, as_arrow):
+    if not as_arrow:
+        return df
+    import pyarrow as pa
+    return pa.RecordBatch.from_pandas(df, preserve_index=False)
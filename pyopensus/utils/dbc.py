@@ -0,0 +1,283 @@
+'''
+    Decompression of DATASUS DBC files.
+
+    A DBC file is a DBF file whose records were compressed with the PKWare Data
+    Compression Library ("implode"). The layout is:
+
+        [DBF header (length in bytes 8-9)] [CRC32 (4 bytes)] [compressed records]
+
+    The header is copied verbatim and the records are decompressed by a Python port
+    of Mark Adler's 'blast' decoder (zlib/contrib/blast), the same algorithm used by
+    the 'read.dbc' R package. No R interpreter or external process is needed.
+'''
+import io
+import struct
+
+MAXBITS = 13 # -- maximum bits in a code
+MAXWIN = 4096 # -- maximum window size (largest distance)
+
+# -- bit lengths of the literal, length and distance codes, as repeat counts (see 'blast.c').
+_LITLEN = bytes([
+    11, 124, 8, 7, 28, 7, 188, 13, 76, 4, 10, 8, 12, 10, 12, 10, 8, 23, 8,
+    9, 7, 6, 7, 8, 7, 6, 55, 8, 23, 24, 12, 11, 7, 9, 11, 12, 6, 7, 22, 5,
+    7, 24, 6, 11, 9, 6, 7, 22, 7, 11, 38, 7, 9, 8, 25, 11, 8, 11, 9, 12,
+    8, 12, 5, 38, 5, 38, 5, 11, 7, 5, 6, 21, 6, 10, 53, 8, 7, 24, 10, 27,
+    44, 253, 253, 253, 252, 252, 252, 13, 12, 45, 12, 45, 12, 61, 12, 45,
+    44, 173])
+_LENLEN = bytes([2, 35, 36, 53, 38, 23])
+_DISTLEN = bytes([2, 20, 53, 230, 247, 151, 248])
+# -- base and extra bits of the lengths
+_BASE = (3, 2, 4, 5, 6, 7, 8, 9, 10, 12, 16, 24, 40, 72, 136, 264)
+_EXTRA = (0, 0, 0, 0, 0, 0, 0, 0, 1, 2, 3, 4, 5, 6, 7, 8)
+
+
+def _lookup_table(rep):
+    '''
+        Build a decoding table indexed by the next MAXBITS bits of the stream.
+
+        Codes are canonical Huffman codes stored with inverted bits and read from the
+        least significant bit. Each entry packs the symbol and the code length as
+        '(symbol << 4) | length'; -1 marks bit patterns that are not a valid code.
+    '''
+    lengths = []
+    for byte in rep:
+        lengths += [byte & 15]*((byte >> 4) + 1)
+
+    table = [-1]*(1 << MAXBITS)
+    code = 0
+    for length in range(1, MAXBITS+1):
+        for symbol, symbol_length in enumerate(lengths):
+            if symbol_length != length:
+                continue
+            pattern = 0
+            for n in range(length):
+                pattern |= (((code >> (length-1-n)) & 1) ^ 1) << n
+            entry = (symbol << 4) | length
+            for high in range(1 << (MAXBITS-length)):
+                table[pattern | (high << length)] = entry
+            code += 1
+        code <<= 1
+    return table
+
+_LITCODE = _lookup_table(_LITLEN)
+_LENCODE = _lookup_table(_LENLEN)
+_DISTCODE = _lookup_table(_DISTLEN)
+
+
+def blast(fp, flush_size=1 << 20, read_size=1 << 16):
+    '''
+        Generator decompressing a PKWare DCL imploded stream.
+
+        Args:
+        -----
+            fp:
+                File object (binary) positioned at the start of the compressed data.
+            flush_size:
+                Integer. Approximate size of the chunks of decompressed bytes yielded.
+            read_size:
+                Integer. Size of the blocks read from 'fp'.
+
+        Yield:
+        ------
+            chunk:
+                Bytes. Consecutive pieces of the decompressed data.
+    '''
+    litcode, lencode, distcode = _LITCODE, _LENCODE, _DISTCODE
+    base, extra = _BASE, _EXTRA
+    mask = (1 << MAXBITS) - 1
+
+    data, pos, eof = fp.read(read_size), 0, False
+    bitbuf, bitcnt = 0, 0
+    out = bytearray()
+
+    # -- header: coded or uncoded literals and the dictionary size (4 to 6 bits of distance).
+    if len(data) < 2:
+        raise Exception('Invalid DBC data: compressed stream is empty.')
+    lit, dictbits = data[0], data[1]
+    pos = 2
+    if lit > 1:
+        raise Exception('Invalid DBC data: literal flag is not 0 or 1.')
+    if dictbits < 4 or dictbits > 6:
+        raise Exception('Invalid DBC data: dictionary size is not 4, 5 or 6.')
+
+    while True:
+        # -- at most 1+13+8+13+6 = 41 bits are consumed per symbol.
+        if bitcnt < 48:
+            if pos + 8 > len(data) and not eof:
+                data = data[pos:] + fp.read(read_size)
+                pos = 0
+                eof = len(data) < 8
+            nbytes = min((64 - bitcnt) >> 3, len(data) - pos)
+            bitbuf |= int.from_bytes(data[pos:pos+nbytes], 'little') << bitcnt
+            pos += nbytes
+            bitcnt += nbytes << 3
+
+        flag = bitbuf & 1
+        bitbuf >>= 1
+        if flag:
+            # -- length and distance pair
+            entry = lencode[bitbuf & mask]
+            if entry < 0:
+                raise Exception('Invalid DBC data: bad length code.')
+            lenbits = entry & 15
+            bitbuf >>= lenbits
+            symbol = entry >> 4
+            nextra = extra[symbol]
+            length = base[symbol] + (bitbuf & ((1 << nextra) - 1))
+            bitbuf >>= nextra
+            if length == 519:
+                # -- end of stream
+                bitcnt -= 1 + lenbits + nextra
+                break
+
+            entry = distcode[bitbuf & mask]
+            if entry < 0:
+                raise Exception('Invalid DBC data: bad distance code.')
+            distbits = entry & 15
+            bitbuf >>= distbits
+            nlow = 2 if length == 2 else dictbits
+            dist = ((entry >> 4) << nlow) + (bitbuf & ((1 << nlow) - 1)) + 1
+            bitbuf >>= nlow
+            bitcnt -= 1 + lenbits + nextra + distbits + nlow
+
+            start = len(out) - dist
+            if start < 0:
+                raise Exception('Invalid DBC data: distance too far back.')
+            if dist >= length:
+                out += out[start:start+length]
+            else:
+                out += (out[start:]*(length//dist + 1))[:length]
+        else:
+            # -- literal
+            if lit:
+                entry = litcode[bitbuf & mask]
+                if entry < 0:
+                    raise Exception('Invalid DBC data: bad literal code.')
+                bitbuf >>= entry & 15
+                out.append(entry >> 4)
+                bitcnt -= 1 + (entry & 15)
+            else:
+                out.append(bitbuf & 255)
+                bitbuf >>= 8
+                bitcnt -= 9
+
+        if bitcnt < 0:
+            raise Exception('Invalid DBC data: compressed stream ended before the end code.')
+
+        if len(out) >= flush_size + MAXWIN:
+            # -- keep the window needed by the next copies
+            yield bytes(out[:-MAXWIN])
+            del out[:-MAXWIN]
+
+    if bitcnt < 0:
+        raise Exception('Invalid DBC data: compressed stream ended before the end code.')
+    if out:
+        yield bytes(out)
+
+
+def read_dbc_header(fp):
+    '''
+        Read the DBF header stored at the beginning of a DBC file and skip the CRC32
+        that precedes the compressed records.
+
+        Return:
+        -------
+            header:
+                Bytes. DBF header, to be written verbatim at the start of the DBF file.
+    '''
+    head = fp.read(10)
+    if len(head) < 10:
+        raise Exception('Invalid DBC file: header is too short.')
+    header_size = struct.unpack('<H', head[8:10])[0]
+    header = head + fp.read(header_size - 10)
+    if len(header) != header_size:
+        raise Exception('Invalid DBC file: header is too short.')
+    fp.read(4) # -- CRC32
+    return header
+
+
+def iter_dbc(path_to_dbc, flush_size=1 << 20):
+    '''
+        Generator yielding the contents of the DBF file stored in a DBC file: the
+        header first and then chunks of the decompressed records.
+    '''
+    with open(path_to_dbc, 'rb') as fp:
+        yield read_dbc_header(fp)
+        for chunk in blast(fp, flush_size=flush_size):
+            yield chunk
+
+
+def dbc2dbf(path_to_dbc, path_to_dbf):
+    '''
+        Convert a DBC file into a DBF file.
+
+        Args:
+        -----
+            path_to_dbc:
+                String. Path to the input DBC file.
+            path_to_dbf:
+                String. Path to the output DBF file.
+    '''
+    with open(path_to_dbf, 'wb') as out:
+        for chunk in iter_dbc(path_to_dbc):
+            out.write(chunk)
+
+
+def dbc_to_buffer(path_to_dbc):
+    '''
+        Decompress a DBC file into an in-memory DBF file.
+
+        Return:
+        -------
+            buffer:
+                io.BytesIO. DBF contents positioned at the start (can be parsed by DBFIX).
+    '''
+    buffer = io.BytesIO()
+    for chunk in iter_dbc(path_to_dbc):
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+
+class DBCStream(io.RawIOBase):
+    '''
+        Read-only file object over the DBF contents of a DBC file.
+
+        Data is decompressed on demand while it is read, so only the chunk being
+        consumed is kept in memory. It can be given to DBFIX in place of a DBF path.
+
+        Args:
+        -----
+            path_to_dbc:
+                String. Path to the DBC file.
+    '''
+    def __init__(self, path_to_dbc, flush_size=1 << 20):
+        self.name = path_to_dbc
+        self._chunks = iter_dbc(path_to_dbc, flush_size=flush_size)
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        self._chunks.close()
+        super().close()
+
+
+def open_dbc(path_to_dbc, buffer_size=1 << 20):
+    '''
+        Open a DBC file as a buffered binary stream of its (decompressed) DBF contents.
+    '''
+    return io.BufferedReader(DBCStream(path_to_dbc), buffer_size=buffer_size)
+
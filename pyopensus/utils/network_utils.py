@@ -3,6 +3,28 @@
 '''
 import pandas as pd
 import datetime as dt
+from sqlalchemy import DateTime, bindparam
+
+import pyopensus.utils.db_utils as db_utils
+
+# -- nodes of the edges built from the admissions of 'aih_reduzida'
+EDGE_NODES = {
+    'c2c': ['MUNIC_RES', 'MUNIC_MOV'],
+    'c2h': ['MUNIC_RES', 'CNES'],
+    'h2d': ['CNES'],
+}
+# -- weight of the edges: number of admissions or their total value
+EDGE_WEIGHTS = {
+    'people': 'COUNT(*)',
+    'money': 'SUM(VAL_TOT)',
+}
+
+def _clip_level(level, lower, upper):
+    return min(max(level, lower), upper)
+
+def _period_params(start_date, final_date):
+    # -- typed parameters, so dates are compared in the format they are stored
+    return [ bindparam('start_date', start_date, type_=DateTime()), bindparam('final_date', final_date, type_=DateTime()) ]
 
 def select_period_aih(engine, start_date, final_date, diag_level=0):
     '''
@@ -12,31 +34,24 @@ def select_period_aih(engine, start_date, final_date, diag_level=0):
         -----
             engine
     '''
-    if diag_level>4:
-        diag_level = 4
-    elif diag_level<0:
-        diag_level = 0
-    
-    query = f'''
+    diag_level = _clip_level(diag_level, 0, 4)
+    query = '''
         SELECT 
             N_AIH, CNES, MUNIC_RES, MUNIC_MOV,
-            SUBSTR(DIAG_PRINC,1,{diag_level}) as DIAG_CATEG 
+            SUBSTR(DIAG_PRINC, 1, :diag_level) as DIAG_CATEG 
         FROM aih_reduzida
-        WHERE DT_INTER >= '{start_date.strftime("%Y-%m-%d")}' AND DT_INTER <= '{final_date.strftime("%Y-%m-%d")}'
+        WHERE DT_INTER >= :start_date AND DT_INTER <= :final_date
     '''
-    df = query_data(query, engine)
+    df = db_utils.perform_query(query, engine, params={'diag_level': diag_level},
+                                bindparams=_period_params(start_date, final_date))
     return df
 
 def select_period_servicos(engine, start_date, final_date, proc_level=6):
     '''
         Perform the query over the medical procedures database for a selected period.
     '''
-    if proc_level>10:
-        proc_level = 10
-    elif proc_level<6:
-        proc_level = 6
-
-    query = f'''
+    proc_level = _clip_level(proc_level, 6, 10)
+    query = '''
         SELECT
             *
         FROM (
@@ -47,11 +62,74 @@ def select_period_servicos(engine, start_date, final_date, proc_level=6):
             LEFT JOIN aih_reduzida b
             ON a.SP_NAIH = b.N_AIH
         )
-        WHERE DT_INTER >= '{start_date.strftime("%Y-%m-%d")}' AND DT_INTER <= '{final_date.strftime("%Y-%m-%d")}'
+        WHERE DT_INTER >= :start_date AND DT_INTER <= :final_date
     '''
-    df = query_data(query, engine)
+    df = db_utils.perform_query(query, engine, bindparams=_period_params(start_date, final_date))
     return df
 
+def aggregate_edges(engine, start_date, final_date, network='c2c', diag_level=0, mode='people'):
+    '''
+        Weights of the edges between the nodes of 'network', for each group of diagnosis,
+        aggregated by the database.
+
+        The admissions of the period are grouped in the query (GROUP BY the nodes and the
+        first 'diag_level' chars of the ICD-10 code), so only the aggregated edges, and not
+        every admission, are transferred from the database.
+
+        Args:
+        -----
+            engine:
+                sqlalchemy.engine.base.Engine. engine used for database connection.
+            start_date:
+                datetime.datetime. Begininning of the period selected to build the network.
+            final_date:
+                datetime.datetime. Ending of the period selected to build the network.
+            network:
+                String. Nodes of the edges (see 'EDGE_NODES'): 'c2c' (city to city), 'c2h'
+                (city to hospital) or 'h2d' (hospital to diagnosis).
+            diag_level:
+                Integer. Number of chars of the ICD-10 code defining the groups of diagnosis
+                (0 for a single group, '').
+            mode:
+                String. Weight of the edges (see 'EDGE_WEIGHTS'): 'people' (number of admissions)
+                or 'money' (total value of the admissions).
+
+        Return:
+        -------
+            edges:
+                pandas.DataFrame. One row per edge and group of diagnosis, with the columns of the
+                nodes, 'DIAG_CATEG' and 'WEIGHT'.
+    '''
+    if network not in EDGE_NODES:
+        raise Exception(f"Network '{network}' not supported.")
+    if mode not in EDGE_WEIGHTS:
+        raise Exception(f"Mode '{mode}' not supported.")
+    nodes = EDGE_NODES[network]
+    diag_level = _clip_level(diag_level, 0, 4)
+
+    query = f'''
+        SELECT 
+            {', '.join(nodes)}, SUBSTR(DIAG_PRINC, 1, :diag_level) AS DIAG_CATEG,
+            {EDGE_WEIGHTS[mode]} AS WEIGHT
+        FROM aih_reduzida
+        WHERE DT_INTER >= :start_date AND DT_INTER <= :final_date
+        GROUP BY {', '.join(nodes)}, DIAG_CATEG
+    '''
+    edges = db_utils.perform_query(query, engine, params={'diag_level': diag_level},
+                                   bindparams=_period_params(start_date, final_date))
+    edges['WEIGHT'] = edges['WEIGHT'].astype(float)
+    return edges
+
+def pivot_edges(edges, nodes):
+    '''
+        Edgelist with one column of weights per group of diagnosis (zero when there is no
+        flux), from the aggregated edges of 'aggregate_edges'. The column 'SOMA' holds the
+        total weight of each edge.
+    '''
+    edgelist = edges.pivot_table(index=nodes, columns='DIAG_CATEG', values='WEIGHT', aggfunc='sum').fillna(0)
+    edgelist['SOMA'] = edgelist.sum(axis=1)
+    return edgelist
+
 def edgelist_citytocity(engine, start_date, final_date, diag_level):
     '''
         Create an edgelist for hospital flux between brazilian municipalities.
@@ -83,10 +161,8 @@ def edgelist_citytocity(engine, start_date, final_date, diag_level):
             edgelist:
                 pandas.DataFrame. 
     '''
-    df = select_period_aih(engine, start_date, final_date, diag_level=diag_level)
-    edgelist = df.groupby(["MUNIC_RES", "MUNIC_MOV"])["DIAG_CATEG"].value_counts().reset_index()
-    edgelist = pd.pivot_table(edgelist, index=["MUNIC_RES", "MUNIC_MOV"], columns="DIAG_CATEG", values="count").fillna(0)
-    edgelist["SOMA"] = edgelist.apply(sum, axis=1)
+    edges = aggregate_edges(engine, start_date, final_date, network='c2c', diag_level=diag_level)
+    edgelist = pivot_edges(edges, EDGE_NODES['c2c'])
     # -- when 'diag_level' is zero, a dummy column appears. remove it. 
     if '' in edgelist.columns:
         edgelist = edgelist.drop(columns='')
@@ -132,8 +208,5 @@ def edgelist_for_citytohospital(engine, start_date, final_date, diag_level):
     '''
         ...
     '''
-    df = select_period_aih(engine, start_date, final_date, diag_level=diag_level)
-    edgelist = df.groupby(["MUNIC_RES", "CNES"])["DIAG_CATEG"].value_counts().reset_index()
-    edgelist = pd.pivot_table(edgelist, index=["MUNIC_RES", "CNES"], columns="DIAG_CATEG", values="count").fillna(0)
-    edgelist["SOMA"] = edgelist.apply(sum, axis=1)
-    return edgelist
\ No newline at end of file
+    edges = aggregate_edges(engine, start_date, final_date, network='c2h', diag_level=diag_level)
+    return pivot_edges(edges, EDGE_NODES['c2h'])
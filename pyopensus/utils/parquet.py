@@ -0,0 +1,141 @@
+'''
+    Conversion of DATASUS DBC/DBF files into PARQUET.
+
+    Records are decoded in fixed-size chunks by the vectorized reader of DBFIX
+    ('iter_batches') and each chunk is written as a PARQUET row group, so the peak
+    memory depends on the chunk size and not on the size of the file. DBC files are
+    decompressed while they are read (see 'pyopensus.utils.dbc.open_dbc'), without
+    intermediate DBF files on disk.
+'''
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pyopensus.utils.DBFIX import DBFIX
+from pyopensus.utils.dbc import open_dbc
+
+# -- column used to sort the records of each source (period of the record)
+SORT_COLUMNS = { 'sihsus': 'DT_INTER', 'sim': 'DTOBITO', 'cnes': 'COMPET' }
+
+def dbf_arrow_schema(dbf, columns=None):
+    '''
+        Arrow schema derived from the header of a DBF file.
+
+        Character fields are kept as strings, numeric fields become integers (no
+        decimal places) or floats, dates become 'date32' and logical fields booleans.
+        Since it only depends on the header, every chunk of the file gets the same schema.
+
+        Args:
+        -----
+            dbf:
+                pyopensus.utils.DBFIX.DBFIX. Opened DBF file.
+            columns:
+                None or List of Strings. Columns included in the schema (default all).
+    '''
+    return dbf.arrow_schema(columns)
+
+def dbf_to_parquet(dbf, path_to_parquet, chunksize=100000, compression='snappy', columns=None, n_workers=1,
+                   filters=None, normalizer=None, row_group_size=None, sort_by=None):
+    '''
+        Write the records of an opened DBF file into a PARQUET file, one row group per chunk
+        (or per 'row_group_size' records).
+
+        Args:
+        -----
+            dbf:
+                pyopensus.utils.DBFIX.DBFIX. Opened DBF file (from a path or a stream).
+            path_to_parquet:
+                String. Output PARQUET file.
+            chunksize:
+                Integer. Number of records decoded and written at a time.
+            compression:
+                String. Compression codec of the PARQUET file.
+            columns:
+                None or List of Strings. Columns to decode and write (default all).
+            n_workers:
+                Integer. Number of processes decoding the chunks ('DBFIX.iter_shards').
+                Only used when the DBF is a file on disk.
+            filters:
+                None or List of Tuples (column, op, value). Only the records satisfying all
+                of them are written; the others are dropped before decoding (see
+                'DBFIX.filter_mask').
+            normalizer:
+                None or object with the methods 'arrow_schema(schema)' and 'normalize(batch)',
+                applied to the output schema and to each record batch (e.g. the typed schema
+                of the data models, 'pyopensus.storage.model_schema.ModelSchema').
+            row_group_size:
+                None or Integer. Maximum number of records of each row group (default the chunk size).
+            sort_by:
+                None, String or List of Strings. Columns used to sort the records of the file (see
+                'SORT_COLUMNS'), so that the row groups cover narrow ranges of these columns and
+                their statistics can be used to skip them. Columns absent from the file are ignored.
+                Sorting holds the (decoded) records of the whole file in memory, so it is only done
+                when requested: without it, at most one chunk is in memory.
+
+        Return:
+        -------
+            nrows:
+                Integer. Number of records written.
+    '''
+    schema = dbf_arrow_schema(dbf, columns)
+    if normalizer is not None:
+        schema = normalizer.arrow_schema(schema)
+    if n_workers > 1 and dbf.path is not None:
+        batches = dbf.iter_shards(chunksize, columns=columns, n_workers=n_workers, as_arrow=True,
+                                  filters=filters)
+    else:
+        batches = dbf.iter_batches(chunksize, columns=columns, as_arrow=True, filters=filters)
+    if normalizer is not None:
+        batches = ( normalizer.normalize(batch) for batch in batches )
+
+    if isinstance(sort_by, str):
+        sort_by = [sort_by]
+    sort_by = [ col for col in (sort_by or []) if col in schema.names ]
+
+    nrows = 0
+    with pq.ParquetWriter(path_to_parquet, schema, compression=compression) as writer:
+        if len(sort_by) > 0:
+            table = pa.Table.from_batches(batches, schema=schema).sort_by([ (col, 'ascending') for col in sort_by ])
+            writer.write_table(table, row_group_size=row_group_size or chunksize)
+            nrows = table.num_rows
+        else:
+            for batch in batches:
+                writer.write_table(pa.Table.from_batches([batch], schema=schema), row_group_size=row_group_size)
+                nrows += batch.num_rows
+    return nrows
+
+def dbc_to_parquet(path_to_dbc, path_to_parquet, chunksize=100000, codec='latin-1', compression='snappy', columns=None,
+                   filters=None, normalizer=None, row_group_size=None, sort_by=None):
+    '''
+        Convert a DBC file into PARQUET, streaming the decompressed records.
+
+        Args:
+        -----
+            path_to_dbc:
+                String. Input DBC file.
+            path_to_parquet:
+                String. Output PARQUET file.
+            chunksize:
+                Integer. Number of records decoded and written at a time.
+            codec:
+                String. Codec used to decode text fields.
+            compression:
+                String. Compression codec of the PARQUET file.
+            columns:
+                None or List of Strings. Columns to decode and write (default all).
+            filters:
+                None or List of Tuples (column, op, value). Only the records satisfying all
+                of them are written.
+            normalizer:
+                None or object converting the record batches (see 'dbf_to_parquet').
+            row_group_size, sort_by:
+                See 'dbf_to_parquet'.
+
+        Return:
+        -------
+            nrows:
+                Integer. Number of records written.
+    '''
+    with open_dbc(path_to_dbc) as stream:
+        dbf = DBFIX(stream, codec=codec)
+        return dbf_to_parquet(dbf, path_to_parquet, chunksize=chunksize, compression=compression, columns=columns,
+                              filters=filters, normalizer=normalizer, row_group_size=row_group_size, sort_by=sort_by)
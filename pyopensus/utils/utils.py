@@ -1,9 +1,16 @@
 import os
+import ftplib
+import socket
 import subprocess
 import datetime as dt
+import pandas as pd
 from sqlalchemy import text
 from dateutil.relativedelta import relativedelta
 
+# -- DBC decompression in pure python (no R needed)
+from pyopensus.utils.dbc import dbc2dbf, dbc_to_buffer
+import pyopensus.utils.db_utils as db_utils
+
 # -- set path for R (need to make it more consistent)
 # -- more consistent option so far it is using the R binary from conda
 
@@ -23,6 +30,15 @@ from dateutil.relativedelta import relativedelta
 #from rpy2.robjects.packages import PackageNotInstalledError
 
 # -- preffix dictionary
+# -- IBGE code of each UF (first two digits of the municipality codes)
+UF_CODES = {
+    '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
+    '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL', '28': 'SE', '29': 'BA',
+    '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP',
+    '41': 'PR', '42': 'SC', '43': 'RS',
+    '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF',
+}
+
 def preffix_dictionary():
     sih_hash = {
         'ER': 'AIH Rejeitadas com código de erro',
@@ -102,47 +118,257 @@ def find_r_executable():
     raise RuntimeError("R executable not found. Please install R or set the R_HOME environment variable.")
 
 
-#def dbc2dbf(path_to_dbc, path_to_dbf):
-#    try:
-#        read_dbc = importr('read.dbc')
-#    except PackageNotInstalledError as err:
-#        raise Exception("Need to install package from rpy2")
-#
-#    read_dbc.dbc2dbf(path_to_dbc, path_to_dbf)
-
-
-def perform_query(query_str, engine, batchsize=1000):
+def perform_query(query_str, engine, batchsize=1000, params=None):
     '''
         Given a SQL query and the sqlalchemy engine corresponding to a
         database, performs and return the result of the query.
-    '''
-
-    schema_data = {
-        'rows': [],
-        'columns': [],
-    }
-
-    query_str = text(query_str)
-    with engine.connect() as conn:
-        qres = conn.execute(query_str)
-        schema_data['columns'] = list(qres.keys())
 
-        while True:
-            rows = qres.fetchmany(batchsize)
-            if not rows:
-                break
-            schema_data["rows"] += [ row for row in rows ]
-    
-    res_df = pd.DataFrame(schema_data['rows'], columns=schema_data['columns'])
-    return res_df
+        To process large results batch by batch, use 'pyopensus.utils.db_utils.iter_query'.
+    '''
+    return db_utils.perform_query(query_str, engine, batchsize=batchsize, params=params)
 
 
 # -------------------------------------------
 # --------- specifics for retrieval ---------
 # -------------------------------------------
 
+def available_months(origin, year):
+    '''
+        List the months published for a given source and year. Sources stored
+        in yearly files (SIM, SINASC and SINAN) return [None].
+
+        Args:
+        -----
+            origin:
+                String. Source of the data (see Opensus.get_sources()).
+            year:
+                Integer. Year of the requested data.
+
+        Return:
+        -------
+            month_lst:
+                List of Strings (or [None] for yearly sources).
+    '''
+    origin = origin.lower()
+    this_year = dt.date.today().year
+    if origin in ['sim', 'sinasc', 'sinan', 'sinan_prelim']:
+        return [None]
+
+    month_lst = ['01', '02', '03', '04', '05', '06',
+                 '07', '08', '09', '10', '11', '12']
+    if origin=='cnes' and year==2005:
+        month_lst = ['08', '09', '10', '11', '12']
+    elif origin in ['sihsus', 'siasus'] and year==this_year:
+        processed_date = dt.datetime.today() - relativedelta(months=2)
+        if processed_date.year == this_year:
+            month_lst = [ f'{n+1:2.0f}'.replace(" ", "0") for n in range(processed_date.month+1) ]
+    return month_lst
+
+def build_filename(origin, preffix, uf, year, month=None):
+    '''
+        Name (without extension) of the DATASUS file for a given source, preffix,
+        UF, year and month.
+
+        Args:
+        -----
+            origin:
+                String. Source of the data (see Opensus.get_sources()).
+            preffix:
+                String. Preffix of the data for the source (ignored for SIM and SINASC).
+            uf:
+                String. UF string for a brazilian state (ignored for SINAN).
+            year:
+                Integer.
+            month:
+                String or None. Two-digit month, when the source has monthly files.
+    '''
+    origin = origin.lower()
+    if origin=='sim':
+        return f"DO{uf.upper()}{year}"
+    elif origin=='sinasc':
+        return f"DN{uf.upper()}{year}"
+    elif origin in ['sinan', 'sinan_prelim']:
+        return f"{preffix}BR{f'{year}'[2:]}"
+    return f"{preffix}{uf.upper()}{f'{year}'[2:]}{month}"
+
+def parse_filename(origin, filename):
+    '''
+        Inverse of 'build_filename': source, preffix, UF, year and month of a DATASUS file.
+
+        Args:
+        -----
+            origin:
+                String. Source of the data (see Opensus.get_sources()).
+            filename:
+                String. Name of the file (with or without extension). Split files of large
+                states (e.g. 'PASP2401a') are accepted.
+
+        Return:
+        -------
+            parts:
+                Dictionary with keys 'system', 'preffix', 'uf', 'year' (Integer) and 'month'
+                (two-digit String, or None for yearly sources).
+    '''
+    origin = origin.lower()
+    stem = os.path.splitext(os.path.basename(filename))[0].upper()
+    if stem[-1].isalpha() and origin in ['sihsus', 'siasus', 'cnes']:
+        stem = stem[:-1]
+
+    # -- parsed from the right: preffixes have 2 (e.g. 'RD') or 3 letters (e.g. 'ABO' of SIASUS)
+    if origin in ['sim', 'sinasc']:
+        preffix, uf, year, month = stem[:-6], stem[-6:-4], stem[-4:], None
+    elif origin in ['sinan', 'sinan_prelim']:
+        preffix, uf, year, month = stem[:-4], 'BR', stem[-2:], None
+    else:
+        preffix, uf, year, month = stem[:-6], stem[-6:-4], stem[-4:-2], stem[-2:]
+
+    if len(preffix) == 0 or not uf.isalpha() or not year.isdigit() or (month is not None and not month.isdigit()):
+        raise Exception(f"Filename {filename} does not follow the DATASUS convention for {origin}.")
+    # -- two-digit years: DATASUS files start in the 1990s
+    if len(year) == 2:
+        year = 1900 + int(year) if int(year) >= 90 else 2000 + int(year)
+    year = int(year)
+    return {'system': origin, 'preffix': preffix, 'uf': uf, 'year': year, 'month': month}
+
+def parse_dates(series, format=None):
+    '''
+        Convert a column to datetime64, skipping the parsing when the column already holds
+        dates (e.g. read from PARQUET files written with the typed schema of the data models).
+
+        Args:
+        -----
+            series:
+                pandas.Series.
+            format:
+                String or None. Format of the dates stored as text (e.g. '%Y%m%d').
+    '''
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    values = series.dropna()
+    if len(values) > 0 and isinstance(values.iloc[0], dt.date):
+        return pd.to_datetime(series, errors='coerce')
+    return pd.to_datetime(series, format=format, errors='coerce')
+
+# -- errors of the FTP connection, retried by reconnecting. Errors of the local files (e.g. a full
+# -- disk) are plain 'OSError' and are not retried.
+FTP_ERRORS = (ftplib.Error, EOFError, ConnectionError, socket.timeout, socket.gaierror)
+
+def ftp_download(baseftp, remote_name, local_path, reconnect=None, manifest=None, max_retries=3, blocksize=8192):
+    '''
+        Download a file from the current FTP directory, resuming interrupted transfers.
+
+        Data is written to '<local_path>.part' and, when the connection drops, the transfer
+        is restarted from the current size of the partial file through the FTP 'REST' command.
+        A leftover partial file from a previous run is resumed in the same way. The finished
+        file is checked against the size reported by the server before being moved to 'local_path'.
+
+        If a download manifest is given, the transfer is skipped when the local copy matches
+        the size and 'MDTM' timestamp currently reported by the server.
+
+        Args:
+        -----
+            baseftp:
+                ftplib.FTP. Connection already placed in the directory of the file.
+            remote_name:
+                String. Name of the file in the FTP directory.
+            local_path:
+                String. Output path of the downloaded file.
+            reconnect:
+                Callable or None. Returns a working ftplib.FTP connection after a failure of the
+                connection (see 'FTP_ERRORS', e.g. Opensus.reconnect_if_needed). If None, transfer
+                errors are raised. Errors writing the local file are always raised.
+            manifest:
+                pyopensus.opensus.manifest.DownloadManifest or None. Record of previous downloads.
+            max_retries:
+                Integer. Maximum number of reconnections for the same file.
+            blocksize:
+                Integer. Block size of the binary transfer.
+
+        Return:
+        -------
+            baseftp:
+                ftplib.FTP. Connection in use after the download (it changes if a reconnection happened).
+            size:
+                Integer. Size in bytes of the downloaded file (0 if the transfer was skipped).
+    '''
+    workdir = baseftp.pwd()
+    remote_path = f"{workdir.rstrip('/')}/{remote_name}"
+    remote_size, remote_mdtm = remote_stat(baseftp, remote_name)
+
+    part_path = f'{local_path}.part'
+    if manifest is not None:
+        if manifest.is_current(remote_path, remote_size, remote_mdtm, local_path):
+            return baseftp, 0
+        # -- a partial file of a version that has been republished can not be resumed.
+        entry = manifest.get(remote_path)
+        if entry is not None and entry['mdtm'] != remote_mdtm and os.path.isfile(part_path):
+            os.remove(part_path)
+
+    # -- the manifest records the partial download once data arrives (not for missing files)
+    started = manifest is None
+    def write(fp, block):
+        nonlocal started
+        if not started:
+            manifest.mark_partial(remote_path, remote_size, remote_mdtm, local_path)
+            started = True
+        fp.write(block)
+
+    attempt, can_resume = 0, True
+    while True:
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        if remote_size is not None and offset > remote_size:
+            # -- stale partial file, larger than the remote one.
+            os.remove(part_path)
+            offset = 0
+        if remote_size is not None and offset == remote_size:
+            break
+
+        try:
+            with open(part_path, 'ab') as fp:
+                baseftp.retrbinary(f'RETR {remote_name}', lambda block: write(fp, block), blocksize=blocksize,
+                                   rest=offset if offset > 0 else None)
+            break
+        except ftplib.error_perm:
+            # -- 'REST' refused: restart the transfer from zero once.
+            if offset > 0 and can_resume:
+                can_resume = False
+                os.remove(part_path)
+                continue
+            raise
+        except FTP_ERRORS:
+            attempt += 1
+            if reconnect is None or attempt > max_retries:
+                raise
+            baseftp = reconnect()
+            baseftp.cwd(workdir)
+
+    final_size = os.path.getsize(part_path)
+    if remote_size is not None and final_size != remote_size:
+        raise Exception(f'Incomplete download of {remote_name}: {final_size} of {remote_size} bytes.')
+    os.replace(part_path, local_path)
+    if manifest is not None:
+        manifest.mark_complete(remote_path, final_size, remote_mdtm, local_path)
+    return baseftp, final_size
+
+def remote_stat(baseftp, remote_name):
+    '''
+        Size and modification time ('MDTM', as 'YYYYMMDDhhmmss') of a file in the current
+        FTP directory. Values not supported by the server are returned as None.
+    '''
+    try:
+        baseftp.voidcmd('TYPE I')
+        remote_size = baseftp.size(remote_name)
+    except ftplib.error_perm:
+        # -- SIZE not supported by the server (the missing file case is raised by RETR).
+        remote_size = None
+    try:
+        remote_mdtm = baseftp.sendcmd(f'MDTM {remote_name}').split()[-1]
+    except ftplib.error_perm:
+        remote_mdtm = None
+    return remote_size, remote_mdtm
+
 # ----------------- SIASUS/SIHSUS -----------------
-def retrieve_siasih(baseftp, dest, uf, year, preffix, to_dbf, verbose):
+def retrieve_siasih(baseftp, dest, uf, year, preffix, to_dbf, verbose, reconnect=None, manifest=None):
     '''
     
     '''
@@ -153,13 +379,7 @@ def retrieve_siasih(baseftp, dest, uf, year, preffix, to_dbf, verbose):
 
     year_str = f'{year}'[2:]
     filename = f"{preffix}{uf.upper()}{year_str}"
-    month_lst = ['01', '02', '03', '04', '05', '06', 
-                 '07', '08', '09', '10', '11', '12']
-
-    if year==this_year:
-        processed_date = dt.datetime.today() - relativedelta(months=2)
-        if processed_date.year == this_year:
-            month_lst = [ f'{n+1:2.0f}'.replace(" ", "0") for n in range(processed_date.month+1) ]
+    month_lst = available_months('sihsus', year)
 
     for cur_month in month_lst:
         filename_dbc = f'{filename}{cur_month}.dbc'
@@ -167,8 +387,7 @@ def retrieve_siasih(baseftp, dest, uf, year, preffix, to_dbf, verbose):
         if verbose:
             print(f'Download do arquivo {filename_dbc} ...', end='')
             
-        with open(os.path.join(dest, "DBC", filename_dbc), 'wb') as fp:
-            baseftp.retrbinary(f'RETR {filename_dbc}', fp.write)
+        baseftp, _ = ftp_download(baseftp, filename_dbc, os.path.join(dest, "DBC", filename_dbc), reconnect=reconnect, manifest=manifest)
                 
         # -- conversion to DBF
         if to_dbf:
@@ -181,7 +400,7 @@ def retrieve_siasih(baseftp, dest, uf, year, preffix, to_dbf, verbose):
             print(' Feito.')
 
 # ----------------- SIM/SINASC -----------------
-def retrieve_vital(baseftp, dest, origin, uf, year, to_dbf, verbose):
+def retrieve_vital(baseftp, dest, origin, uf, year, to_dbf, verbose, reconnect=None, manifest=None):
     '''
     
     '''
@@ -202,8 +421,7 @@ def retrieve_vital(baseftp, dest, origin, uf, year, to_dbf, verbose):
     if verbose:
         print(f'Download do arquivo {filename_dbc} ...', end='')
     
-    with open(os.path.join(dest, "DBC", filename_dbc), 'wb') as fp:
-        baseftp.retrbinary(f'RETR {filename_dbc}', fp.write)
+    baseftp, _ = ftp_download(baseftp, filename_dbc, os.path.join(dest, "DBC", filename_dbc), reconnect=reconnect, manifest=manifest)
 
     # -- conversion to DBF
     if to_dbf:
@@ -216,7 +434,7 @@ def retrieve_vital(baseftp, dest, origin, uf, year, to_dbf, verbose):
         print(' Feito.')
 
 
-def retrieve_cnes(baseftp, dest, uf, year, preffix, to_dbf, verbose):
+def retrieve_cnes(baseftp, dest, uf, year, preffix, to_dbf, verbose, reconnect=None, manifest=None):
     '''
         ...
     '''
@@ -234,10 +452,7 @@ def retrieve_cnes(baseftp, dest, uf, year, preffix, to_dbf, verbose):
     
     year_str = f'{year}'[2:]
     filename = f"{preffix}{uf.upper()}{year_str}"
-    month_lst = ['01', '02', '03', '04', '05', '06', 
-                 '07', '08', '09', '10', '11', '12']
-    
-    if year==2005: month_lst = ['08', '09', '10', '11', '12']
+    month_lst = available_months('cnes', year)
 
     for cur_month in month_lst:
         filename_dbc = f'{filename}{cur_month}.dbc'
@@ -245,8 +460,7 @@ def retrieve_cnes(baseftp, dest, uf, year, preffix, to_dbf, verbose):
         if verbose:
             print(f'Download do arquivo {filename_dbc} ...', end='')
             
-        with open(os.path.join(dest, "DBC", filename_dbc), 'wb') as fp:
-            baseftp.retrbinary(f'RETR {filename_dbc}', fp.write)
+        baseftp, _ = ftp_download(baseftp, filename_dbc, os.path.join(dest, "DBC", filename_dbc), reconnect=reconnect, manifest=manifest)
                 
         # -- conversion to DBF
         if to_dbf:
@@ -257,7 +471,7 @@ def retrieve_cnes(baseftp, dest, uf, year, preffix, to_dbf, verbose):
         if verbose:
             print(' Feito.')
 
-def retrieve_sinan(baseftp, dest, year, preffix, to_dbf, verbose):
+def retrieve_sinan(baseftp, dest, year, preffix, to_dbf, verbose, reconnect=None, manifest=None):
     '''
         Retrieve national SINAN data regarding specific disorder.
 
@@ -295,8 +509,7 @@ def retrieve_sinan(baseftp, dest, year, preffix, to_dbf, verbose):
     if verbose:
         print(f'Download do arquivo {filename_dbc} ...', end='')
         
-    with open(os.path.join(dest, "DBC", filename_dbc), 'wb') as fp:
-        baseftp.retrbinary(f'RETR {filename_dbc}', fp.write)
+    baseftp, _ = ftp_download(baseftp, filename_dbc, os.path.join(dest, "DBC", filename_dbc), reconnect=reconnect, manifest=manifest)
             
     # -- conversion to DBF
     if to_dbf:
@@ -9,6 +9,7 @@ final = '2024'
 to_dbf = True
 preffix = "RD"
 verbose = True
+n_workers = 8
 output = Path.home().joinpath("Documents", "data", "opendatasus", "sihsus")
 
 # -------------- connect --------------
@@ -24,9 +25,6 @@ uf_all = ["AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA",
            "RS", "RO", "RR", "SC", "SP", "SE", "TO"]
 ano_range = range(int(inicial), int(final)+1)
 
-for uf in uf_all:
-    for ano in ano_range:
-        try:
-            opensus.retrieve_year(output, base, uf, ano, preffix=preffix, to_dbf=to_dbf, verbose=verbose)
-        except:
-            pass
\ No newline at end of file
+# -- files are downloaded by a pool of independent FTP sessions.
+stats = opensus.retrieve_parallel(output, base, uf_all, ano_range, preffixes=[preffix], n_workers=n_workers, to_dbf=to_dbf, verbose=verbose)
+print(f"{stats['done']} arquivos processados, {len(stats['missing'])} ausentes, {len(stats['failed'])} com falha.")
\ No newline at end of file
@@ -47,7 +47,7 @@ for origin in origin_list: # -- loop on the database (only SIHSUS)
                 for mm in mm_list:
                     fname = f"{preffix}{uf}{yy}{mm}"
                     try:
-                        opensus.retrieve_file(basefolder, origin, fname, to_dbf=True, to_parquet=True, verbose=True)                    
+                        opensus.retrieve_file(basefolder, origin, fname, to_parquet=True, verbose=True)                    
                     except:
                         continue
 
@@ -25,7 +25,7 @@ for origin in origin_list:
         for yy in yy_list:
             fname = f"DO{uf}{yy}"
             try:
-                opensus.retrieve_file(basefolder, origin, fname, to_dbf=True, to_parquet=True, verbose=True)                    
+                opensus.retrieve_file(basefolder, origin, fname, to_parquet=True, verbose=True)                    
             except:
                 continue
 
@@ -19,12 +19,9 @@ parquet_location_rj = basefolder.joinpath("PARQUET_SUDESTE_RJ")
 name_dict = { "RD": parquet_location_rd, "RJ": parquet_location_rj }
 
 verbose = True
-for preffix in ["RD", "RJ"]:
-    cur_loc = name_dict[preffix]
-    parq_files = sorted([ nm for nm in cur_loc.glob("*") ])
-    for current_file in parq_files:
-        cur_df = pd.read_parquet(current_file)
-        # -- inject data
-        if verbose:
-            print(f"Injecting {current_file.stem} file ... ", end='')
-        warehouse_injector.insert_sih(cur_df, current_file.stem, preffix)
\ No newline at end of file
+if __name__ == "__main__":
+    for preffix in ["RD", "RJ"]:
+        cur_loc = name_dict[preffix]
+        parq_files = sorted([ nm for nm in cur_loc.glob("*") ])
+        # -- files are read in parallel and inserted by a single writer
+        summary = warehouse_injector.ingest_sih_files(parq_files, preffix, verbose=verbose)
@@ -0,0 +1,80 @@
+import struct
+
+import pytest
+
+def build_dbf(fields, records, deleted=()):
+    '''
+        Bytes of a dBase III file.
+
+        Args:
+        -----
+            fields:
+                List of Tuples (name, type, size, decimals).
+            records:
+                List of Lists with the text of each field (numbers are right justified).
+            deleted:
+                Indexes of the records flagged as deleted.
+    '''
+    header_size = 32 + 32*len(fields) + 1
+    record_size = 1 + sum([ field[2] for field in fields ])
+    header = struct.pack('<B3BLHH20x', 3, 124, 1, 1, len(records), header_size, record_size)
+    for name, typ, size, decimals in fields:
+        header += struct.pack('<11sc4xBB14x', name.encode(), typ.encode(), size, decimals)
+    header += b'\r'
+
+    body = bytearray()
+    for index, record in enumerate(records):
+        body += b'*' if index in deleted else b' '
+        for (name, typ, size, decimals), value in zip(fields, record):
+            value = value if isinstance(value, bytes) else str(value).encode('latin-1')
+            body += value.rjust(size) if typ in 'NF' else value.ljust(size)
+    return header + bytes(body) + b'\x1a'
+
+@pytest.fixture
+def dbf_file(tmp_path):
+    '''
+        Factory writing a DBF file (see 'build_dbf') into a temporary folder.
+    '''
+    def write(fields, records, deleted=(), name='test.dbf'):
+        path = tmp_path / name
+        path.write_bytes(build_dbf(fields, records, deleted))
+        return str(path)
+    return write
+
+def implode(data):
+    '''
+        PKWare DCL stream of 'data' made of uncoded literals only (as a DBC file without
+        compression), ended by the end-of-stream code.
+    '''
+    from pyopensus.utils.dbc import _LENCODE
+    # -- the smallest bit pattern of the length symbol 15 is the code itself
+    end_code = next( pattern for pattern, entry in enumerate(_LENCODE) if entry >= 0 and entry >> 4 == 15 )
+    end_bits = _LENCODE[end_code] & 15
+
+    bits, nbits = 0, 0
+    for byte in data:
+        bits |= (byte << 1) << nbits # -- flag 0 and the literal
+        nbits += 9
+    bits |= (1 | (end_code << 1) | (255 << (1 + end_bits))) << nbits # -- length 519
+    nbits += 1 + end_bits + 8
+    return bytes([0, 4]) + bits.to_bytes((nbits + 7)//8, 'little')
+
+def build_dbc(fields, records, deleted=()):
+    '''
+        Bytes of a DBC file (see 'build_dbf'): DBF header, CRC32 (not checked) and the
+        imploded records.
+    '''
+    dbf = build_dbf(fields, records, deleted)
+    header_size = struct.unpack('<H', dbf[8:10])[0]
+    return dbf[:header_size] + b'\x00'*4 + implode(dbf[header_size:])
+
+@pytest.fixture
+def dbc_file(tmp_path):
+    '''
+        Factory writing a DBC file (see 'build_dbc') into a temporary folder.
+    '''
+    def write(fields, records, deleted=(), name='test.dbc'):
+        path = tmp_path / name
+        path.write_bytes(build_dbc(fields, records, deleted))
+        return str(path)
+    return write
@@ -0,0 +1,59 @@
+import datetime as dt
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from pyopensus.utils.catalog import ParquetCatalog
+
+@pytest.fixture
+def catalog(tmp_path):
+    return ParquetCatalog(str(tmp_path / '_catalog.sqlite'))
+
+def write(path, row_group_size=2, **columns):
+    pq.write_table(pa.table(columns), str(path), row_group_size=row_group_size)
+    return str(path)
+
+def test_text_dates_against_date_bounds(tmp_path, catalog):
+    path = write(tmp_path / 'RDCE2401.parquet', DT_INTER=['20240101', '20240105', '20240220', '20240301'])
+    catalog.register(path)
+
+    assert catalog.select_files('DT_INTER', dt.date(2024, 2, 1), dt.date(2024, 2, 28)) == [path]
+    assert catalog.select_row_groups(path, 'DT_INTER', dt.date(2024, 2, 1), dt.date(2024, 2, 28)) == [1]
+    assert catalog.select_files('DT_INTER', dt.date(2024, 4, 1)) == []
+    df = catalog.read('DT_INTER', '2024-01-02', '2024-02-20')
+    assert df['DT_INTER'].tolist() == ['20240105', '20240220']
+
+def test_integer_codes_of_different_widths(tmp_path, catalog):
+    path = write(tmp_path / 'codes.parquet', CNES=[99, 100, 1000, 5000])
+    catalog.register(path)
+
+    assert catalog.select_row_groups(path, 'CNES', 100, 999) == [0]
+    assert catalog.select_row_groups(path, 'CNES', '2000') == [1]
+    assert catalog.read('CNES', 100, 999)['CNES'].tolist() == [100]
+
+def test_unordered_text_dates_are_always_read(tmp_path, catalog):
+    # -- 'DDMMYYYY': the text order is not the order of the dates
+    path = write(tmp_path / 'DOCE2023.parquet', DTOBITO=['31012023', '01122023', '15062023', '02022023'])
+    catalog.register(path)
+
+    assert catalog.select_row_groups(path, 'DTOBITO', dt.date(2023, 12, 1), dt.date(2023, 12, 31)) == [0, 1]
+    assert catalog.read('DTOBITO', dt.date(2023, 12, 1), dt.date(2023, 12, 31))['DTOBITO'].tolist() == ['01122023']
+
+def test_typed_dates(tmp_path, catalog):
+    dates = [dt.date(2024, 1, 1), dt.date(2024, 1, 5), dt.date(2024, 2, 20), None]
+    path = write(tmp_path / 'typed.parquet', DT_INTER=pa.array(dates, pa.date32()))
+    catalog.register(path)
+
+    assert catalog.select_row_groups(path, 'DT_INTER', '2024-02-01') == [1]
+    assert len(catalog.read('DT_INTER', dt.datetime(2024, 1, 2))) == 2
+
+def test_read_columns_without_the_filtered_column(tmp_path, catalog):
+    path = write(tmp_path / 'RDCE2401.parquet', DT_INTER=['20240101', '20240105', '20240220', '20240301'],
+                 N_AIH=['A', 'B', 'C', 'D'])
+    catalog.register(path)
+
+    df = catalog.read('DT_INTER', '2024-01-02', '2024-02-20', columns=['N_AIH'])
+    assert list(df.columns) == ['N_AIH']
+    assert df['N_AIH'].tolist() == ['B', 'C']
+    assert list(catalog.read('DT_INTER', '2024-01-02', columns=['N_AIH', 'DT_INTER']).columns) == ['N_AIH', 'DT_INTER']
@@ -0,0 +1,51 @@
+import os
+
+import pyarrow as pa
+import pytest
+
+from pyopensus.utils.dataset import dataset_schema, dbc_to_dataset, partition_dir, read_dataset, update_schema
+
+FIELDS = [('N_AIH', 'C', 13, 0), ('MUNIC_RES', 'C', 6, 0), ('VAL_TOT', 'N', 14, 2)]
+
+def admissions(uf, n):
+    return [ [f'{uf}{index:011d}', '230440', f'{index}.50'] for index in range(n) ]
+
+def test_partition_dir(tmp_path):
+    root = str(tmp_path)
+    assert partition_dir(root, 'sihsus', 'RDCE2401.dbc') == os.path.join(root, 'system=sihsus', 'prefix=RD', 'uf=CE',
+                                                                         'year=2024', 'month=01')
+    assert partition_dir(root, 'sim', 'DOCE2023.dbc') == os.path.join(root, 'system=sim', 'prefix=DO', 'uf=CE', 'year=2023')
+
+def test_dbc_to_dataset(dbc_file, tmp_path):
+    root = str(tmp_path / 'dataset')
+    for name, uf, n in [('RDCE2401.dbc', 'CE', 3), ('RDCE2402.dbc', 'CE', 2), ('RDPE2401.dbc', 'PE', 4)]:
+        path = dbc_to_dataset(dbc_file(FIELDS, admissions(uf, n), name=name), root, 'sihsus')
+        assert path == os.path.join(partition_dir(root, 'sihsus', name), f'{name[:-4]}.parquet')
+    assert not [ name for folder, dirs, names in os.walk(root) for name in names if name.endswith('.tmp') ]
+
+    df = read_dataset(root)
+    assert df.shape[0] == 9
+    assert set(['N_AIH', 'MUNIC_RES', 'VAL_TOT', 'system', 'prefix', 'uf', 'year', 'month']) <= set(df.columns)
+
+    df = read_dataset(root, columns=['N_AIH', 'month'], filters=[('uf', '==', 'CE'), ('year', '==', 2024), ('month', '==', 2)])
+    assert df['N_AIH'].tolist() == ['CE00000000000', 'CE00000000001']
+    assert df['month'].unique().tolist() == [2]
+
+def test_columns_of_newer_files(dbc_file, tmp_path):
+    root = str(tmp_path / 'dataset')
+    dbc_to_dataset(dbc_file(FIELDS, admissions('CE', 2), name='RDCE2401.dbc'), root, 'sihsus')
+    fields = FIELDS + [('CID_MORTE', 'C', 4, 0)]
+    records = [ record + ['I219'] for record in admissions('CE', 1) ]
+    dbc_to_dataset(dbc_file(fields, records, name='RDCE2402.dbc'), root, 'sihsus')
+
+    assert dataset_schema(root).names == ['N_AIH', 'MUNIC_RES', 'VAL_TOT', 'CID_MORTE']
+    df = read_dataset(root, columns=['month', 'CID_MORTE']).sort_values('month')
+    assert df['CID_MORTE'].isna().tolist() == [True, True, False]
+    assert df['CID_MORTE'].iloc[2] == 'I219'
+
+def test_incompatible_schema(tmp_path):
+    root = str(tmp_path)
+    update_schema(root, pa.schema([('N_AIH', pa.string()), ('IDADE', pa.int64())]))
+    assert update_schema(root, pa.schema([('IDADE', pa.float64())])).field('IDADE').type == pa.float64()
+    with pytest.raises(Exception):
+        update_schema(root, pa.schema([('N_AIH', pa.timestamp('s'))]))
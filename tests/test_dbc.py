@@ -0,0 +1,33 @@
+import io
+
+import pytest
+
+from pyopensus.utils.dbc import blast, dbc2dbf, open_dbc
+from tests.conftest import build_dbf
+
+# -- test vector of 'blast.c' (zlib/contrib/blast)
+IMPLODED = bytes([0x00, 0x04, 0x82, 0x24, 0x25, 0x8f, 0x80, 0x7f])
+EXPLODED = b'AIAIAIAIAIAIA'
+
+def write_dbc(path, header, compressed):
+    # -- DBF header, CRC32 (not checked) and the compressed records
+    path.write_bytes(header + b'\x00'*4 + compressed)
+    return str(path)
+
+def test_blast_test_vector():
+    assert b''.join(blast(io.BytesIO(IMPLODED))) == EXPLODED
+
+def test_blast_invalid_stream():
+    with pytest.raises(Exception):
+        list(blast(io.BytesIO(b'\x02\x04\x82\x24')))
+    with pytest.raises(Exception):
+        list(blast(io.BytesIO(IMPLODED[:-2])))
+
+def test_dbc_to_dbf(tmp_path):
+    header = build_dbf([('SEXO', 'C', 1, 0)], [])[:-1]
+    path = write_dbc(tmp_path / 'test.dbc', header, IMPLODED)
+
+    dbc2dbf(path, str(tmp_path / 'test.dbf'))
+    assert (tmp_path / 'test.dbf').read_bytes() == header + EXPLODED
+    with open_dbc(path) as stream:
+        assert stream.read() == header + EXPLODED
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from simpledbf import Dbf5
+
+from pyopensus.utils.DBFIX import DBFIX, _coerce_batch
+from pyopensus.utils.parquet import dbf_to_parquet
+
+FIELDS = [('N_AIH', 'C', 13, 0), ('MUNIC_RES', 'C', 6, 0), ('DT_INTER', 'C', 8, 0), ('NASC', 'D', 8, 0),
+          ('VAL_TOT', 'N', 14, 2), ('IDADE', 'N', 2, 0), ('DIAG_PRINC', 'C', 4, 0)]
+RECORDS = [
+    ['2300000000001', '230440', '20240105', '19800101', '10.50', '3', 'A09'],
+    ['2300000000002', '230730', '20240211', '', '7.25', '', 'Ç10'],
+    ['2300000000003', '230440', '20240318', '20010203', '0.00', '99', 'J189'],
+    ['2300000000004', '231290', '20240120', '19991231', '1.00', '5', 'I219'],
+    ['2300000000005', '230440', '20240229', '20100715', '1234.99', '41', 'A09'],
+]
+
+def normalized(df):
+    '''
+        Columns of a decoded DBF with the types of 'Dbf5' (dates as datetime64 and
+        numbers as float), to compare both readers.
+    '''
+    df = df.copy()
+    df['NASC'] = pd.to_datetime(df['NASC'])
+    for col in ['VAL_TOT', 'IDADE']:
+        df[col] = df[col].astype(float)
+    return df.reset_index(drop=True)
+
+@pytest.fixture
+def sih_dbf(dbf_file):
+    return dbf_file(FIELDS, RECORDS, deleted=(2,))
+
+@pytest.mark.parametrize('memory_map', [False, True])
+def test_vectorized_reader_matches_dbf5(sih_dbf, memory_map):
+    expected = normalized(Dbf5(sih_dbf, codec='latin-1').to_dataframe())
+    decoded = DBFIX(sih_dbf, codec='latin-1', memory_map=memory_map).to_dataframe_vectorized()
+    pd.testing.assert_frame_equal(normalized(decoded), expected, check_dtype=False)
+
+    batches = DBFIX(sih_dbf, codec='latin-1', memory_map=memory_map).to_dataframe_vectorized(chunksize=2)
+    pd.testing.assert_frame_equal(normalized(pd.concat(list(batches))), expected, check_dtype=False)
+
+@pytest.mark.parametrize('memory_map', [False, True])
+def test_column_projection(sih_dbf, memory_map):
+    expected = normalized(Dbf5(sih_dbf, codec='latin-1').to_dataframe())
+    decoded = DBFIX(sih_dbf, codec='latin-1', memory_map=memory_map).to_dataframe_vectorized(columns=['IDADE', 'N_AIH'])
+    assert list(decoded.columns) == ['IDADE', 'N_AIH']
+    pd.testing.assert_frame_equal(decoded.astype({'IDADE': float}), expected[['IDADE', 'N_AIH']], check_dtype=False)
+
+@pytest.mark.parametrize('filters, query', [
+    ([('MUNIC_RES', '==', '230440')], "MUNIC_RES == '230440'"),
+    ([('MUNIC_RES', 'in', ['230730', '231290'])], "MUNIC_RES in ['230730', '231290']"),
+    ([('DT_INTER', '>=', '20240201'), ('DT_INTER', '<', '20240301')], "'20240201' <= DT_INTER < '20240301'"),
+    ([('VAL_TOT', '>', 5)], 'VAL_TOT > 5'),
+    ([('DIAG_PRINC', 'not in', ['A09'])], "DIAG_PRINC not in ['A09']"),
+])
+@pytest.mark.parametrize('memory_map', [False, True])
+def test_filtered_reader_matches_dbf5(sih_dbf, filters, query, memory_map):
+    expected = normalized(Dbf5(sih_dbf, codec='latin-1').to_dataframe().query(query))
+    decoded = DBFIX(sih_dbf, codec='latin-1', memory_map=memory_map).to_dataframe_vectorized(filters=filters)
+    pd.testing.assert_frame_equal(normalized(decoded), expected, check_dtype=False)
+
+    batches = DBFIX(sih_dbf, codec='latin-1', memory_map=memory_map).iter_batches(2, filters=filters)
+    pd.testing.assert_frame_equal(normalized(pd.concat(list(batches))), expected, check_dtype=False)
+
+def test_fractional_text_in_integer_field(dbf_file):
+    path = dbf_file([('IDADE', 'N', 5, 0)], [['1.5'], ['2'], ['']])
+
+    batch = next(DBFIX(path).iter_batches(10))
+    assert str(batch['IDADE'].dtype) == 'Int64'
+    assert batch['IDADE'].tolist() == [2, 2, pd.NA]
+
+    batch = next(DBFIX(path).iter_batches(10, as_arrow=True))
+    assert batch.schema.field('IDADE').type == pa.int64()
+    assert batch.column('IDADE').to_pylist() == [2, 2, None]
+
+def test_chunk_without_valid_dates(dbf_file, tmp_path):
+    records = [['20240101', '1'], ['20240102', '2'], ['', '3'], ['00000000', '4']]
+    path = dbf_file([('NASC', 'D', 8, 0), ('IDADE', 'N', 2, 0)], records)
+
+    batches = list(DBFIX(path).iter_batches(2, as_arrow=True))
+    assert [ batch.schema.field('NASC').type for batch in batches ] == [pa.date32(), pa.date32()]
+    assert batches[1].column('NASC').null_count == 2
+
+    nrows = dbf_to_parquet(DBFIX(path), str(tmp_path / 'test.parquet'), chunksize=2)
+    table = pq.read_table(str(tmp_path / 'test.parquet'))
+    assert nrows == 4
+    assert table.column('NASC').null_count == 2
+
+def test_all_missing_dates_decoded_as_float():
+    batch = _coerce_batch(pd.DataFrame({'NASC': [np.nan, np.nan]}), {'NASC': 'datetime64[s]'})
+    assert str(batch['NASC'].dtype) == 'datetime64[s]'
+    assert batch['NASC'].isna().all()
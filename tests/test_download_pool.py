@@ -0,0 +1,86 @@
+import ftplib
+
+import pytest
+
+import pyopensus.opensus.download_pool as download_pool
+from pyopensus.opensus.download_pool import DownloadJob, DownloadPool
+
+class StubSession:
+    '''
+        Opensus session whose transfers follow 'StubSession.behaviour': number of bytes,
+        or an exception raised for the file (a list gives one result per attempt).
+    '''
+    behaviour = {}
+    attempts = {}
+
+    def __init__(self):
+        self.baseftp = StubFTP()
+
+    def retrieve_file(self, dest, origin, filename, preffix_folder=None, to_dbf=False):
+        results = StubSession.behaviour[filename]
+        if isinstance(results, list):
+            attempt = StubSession.attempts.get(filename, 0)
+            StubSession.attempts[filename] = attempt + 1
+            results = results[attempt]
+        if isinstance(results, Exception):
+            raise results
+        return results
+
+class StubFTP:
+    def quit(self):
+        pass
+
+@pytest.fixture
+def stub_session(monkeypatch):
+    StubSession.behaviour, StubSession.attempts = {}, {}
+    monkeypatch.setattr(download_pool, 'Opensus', StubSession)
+    return StubSession
+
+class StubIndex:
+    def __init__(self, names):
+        self.names = names
+
+    def lookup(self, preffix, uf, year, month):
+        return [ {'name': name} for name in self.names if name.startswith(f'{preffix}{uf}{str(year)[2:]}{month}') ]
+
+def test_plan_monthly_files():
+    jobs = DownloadPool.plan('SIHSUS', ['CE'], [2019], ['RD'])
+    assert [ DownloadPool.filename(job) for job in jobs ] == [ f'RDCE19{month:02d}' for month in range(1, 13) ]
+    assert jobs[0] == DownloadJob('sihsus', 'RD', 'CE', 2019, '01')
+
+def test_plan_removes_duplicated_files():
+    # -- SINAN files are national: every UF points to the same file
+    jobs = DownloadPool.plan('sinan', ['CE', 'SP', 'RJ'], [2019, 2020], ['DENG'])
+    assert [ DownloadPool.filename(job) for job in jobs ] == ['DENGBR19', 'DENGBR20']
+
+def test_plan_with_index_splits_files():
+    index = StubIndex(['PACE1901a.dbc', 'PACE1901b.dbc', 'PACE1903.dbc'])
+    jobs = DownloadPool.plan('siasus', ['CE'], [2019], ['PA'], index=index)
+    assert [ job.filename for job in jobs ] == ['PACE1901a', 'PACE1901b', 'PACE1903']
+
+def test_run_records_each_outcome(stub_session, tmp_path):
+    stub_session.behaviour = {
+        'RDCE1901': 100,
+        'RDCE1902': ftplib.error_perm('550 not found'),
+        'RDCE1903': [ftplib.error_temp('421 timeout'), 50],
+        'RDCE1904': ValueError('corrupted file'),
+        'RDCE1905': [ftplib.error_temp('421 timeout')]*3,
+    }
+    jobs = [ DownloadJob('sihsus', 'RD', 'CE', 2019, f'{month:02d}') for month in range(1, 6) ]
+    statuses = {}
+    pool = DownloadPool(str(tmp_path), n_workers=2, max_retries=3,
+                        progress_callback=lambda job, status, stats: statuses.update({job.month: status}))
+    stats = pool.run(jobs)
+
+    assert statuses == {'01': 'done', '02': 'missing', '03': 'done', '04': 'failed', '05': 'failed'}
+    assert stats['done'] == stats['total'] == 5
+    assert stats['bytes'] == 150
+    assert [ job.month for job in stats['missing'] ] == ['02']
+    assert sorted([ job.month for job in stats['failed'] ]) == ['04', '05']
+    assert stub_session.attempts['RDCE1905'] == 3
+
+def test_local_errors_are_not_retried(stub_session, tmp_path):
+    stub_session.behaviour = {'RDCE1901': [OSError(28, 'No space left on device')]*3}
+    stats = DownloadPool(str(tmp_path), n_workers=1, max_retries=3).run([DownloadJob('sihsus', 'RD', 'CE', 2019, '01')])
+    assert len(stats['failed']) == 1
+    assert stub_session.attempts['RDCE1901'] == 1
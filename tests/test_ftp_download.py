@@ -0,0 +1,139 @@
+import ftplib
+
+import pytest
+
+from pyopensus.opensus.manifest import DownloadManifest
+from pyopensus.utils.utils import ftp_download
+
+class StubFTP:
+    '''
+        FTP connection serving 'files' from the current directory. Each item of 'drops'
+        ends a 'RETR' after that number of bytes with a connection error.
+    '''
+    def __init__(self, files, drops=(), rest=True, mdtm='20240101120000'):
+        self.files = files
+        self.mdtm = mdtm
+        self.drops = list(drops)
+        self.rest = rest
+        self.offsets = []
+
+    def pwd(self):
+        return '/dados'
+
+    def cwd(self, path):
+        pass
+
+    def voidcmd(self, cmd):
+        pass
+
+    def size(self, name):
+        if name not in self.files:
+            raise ftplib.error_perm('550 not found')
+        return len(self.files[name])
+
+    def sendcmd(self, cmd):
+        if cmd.split()[-1] not in self.files:
+            raise ftplib.error_perm('550 not found')
+        return f'213 {self.mdtm}'
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        name = cmd.split()[-1]
+        if name not in self.files:
+            raise ftplib.error_perm('550 not found')
+        if rest is not None and not self.rest:
+            raise ftplib.error_perm('502 REST not implemented')
+        self.offsets.append(rest or 0)
+        data = self.files[name][rest or 0:]
+        if self.drops:
+            callback(data[:self.drops.pop(0)])
+            raise EOFError
+        for start in range(0, len(data), blocksize):
+            callback(data[start:start+blocksize])
+
+DATA = bytes(range(256))*4
+
+def test_download(tmp_path):
+    ftp = StubFTP({'RDCE2401.dbc': DATA})
+    baseftp, size = ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'))
+    assert baseftp is ftp and size == len(DATA)
+    assert (tmp_path / 'RDCE2401.dbc').read_bytes() == DATA
+    assert not (tmp_path / 'RDCE2401.dbc.part').exists()
+
+def test_resume_after_connection_error(tmp_path):
+    ftp = StubFTP({'RDCE2401.dbc': DATA}, drops=[100, 300])
+    reconnections = []
+    def reconnect():
+        reconnections.append(1)
+        return ftp
+
+    baseftp, size = ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), reconnect=reconnect)
+    assert ftp.offsets == [0, 100, 400]
+    assert len(reconnections) == 2
+    assert (tmp_path / 'RDCE2401.dbc').read_bytes() == DATA
+
+def test_resume_leftover_partial_file(tmp_path):
+    (tmp_path / 'RDCE2401.dbc.part').write_bytes(DATA[:500])
+    ftp = StubFTP({'RDCE2401.dbc': DATA})
+    ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'))
+    assert ftp.offsets == [500]
+    assert (tmp_path / 'RDCE2401.dbc').read_bytes() == DATA
+
+def test_restart_when_rest_is_refused(tmp_path):
+    (tmp_path / 'RDCE2401.dbc.part').write_bytes(b'x'*500)
+    ftp = StubFTP({'RDCE2401.dbc': DATA}, rest=False)
+    ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'))
+    assert ftp.offsets == [0]
+    assert (tmp_path / 'RDCE2401.dbc').read_bytes() == DATA
+
+def test_connection_errors_after_retries(tmp_path):
+    ftp = StubFTP({'RDCE2401.dbc': DATA}, drops=[10]*3)
+    with pytest.raises(EOFError):
+        ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), reconnect=lambda: ftp, max_retries=2)
+    assert (tmp_path / 'RDCE2401.dbc.part').read_bytes() == DATA[:30]
+
+def test_local_errors_are_not_retried(tmp_path):
+    ftp = StubFTP({'RDCE2401.dbc': DATA})
+    def reconnect():
+        raise AssertionError('local errors should not reconnect')
+
+    with pytest.raises(FileNotFoundError):
+        ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'missing' / 'RDCE2401.dbc'), reconnect=reconnect)
+    assert ftp.offsets == []
+
+def test_missing_file(tmp_path):
+    with pytest.raises(ftplib.error_perm):
+        ftp_download(StubFTP({}), 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), reconnect=lambda: None)
+
+# -- download manifest
+
+def test_manifest_skips_current_files(tmp_path):
+    manifest = DownloadManifest(str(tmp_path / 'manifest.json'))
+    ftp = StubFTP({'RDCE2401.dbc': DATA})
+    assert ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), manifest=manifest)[1] == len(DATA)
+    assert manifest.get('/dados/RDCE2401.dbc')['status'] == 'complete'
+
+    assert ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), manifest=manifest)[1] == 0
+    assert ftp.offsets == [0]
+
+    # -- file republished by DATASUS
+    ftp.mdtm = '20240301120000'
+    assert ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), manifest=manifest)[1] == len(DATA)
+    assert manifest.get('/dados/RDCE2401.dbc')['mdtm'] == '20240301120000'
+
+def test_manifest_discards_partial_file_of_republished_version(tmp_path):
+    manifest = DownloadManifest(str(tmp_path / 'manifest.json'))
+    ftp = StubFTP({'RDCE2401.dbc': DATA}, drops=[100])
+    with pytest.raises(EOFError):
+        ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), manifest=manifest)
+    assert manifest.get('/dados/RDCE2401.dbc')['status'] == 'partial'
+
+    ftp.mdtm = '20240301120000'
+    ftp_download(ftp, 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), manifest=manifest)
+    assert ftp.offsets == [0, 0]
+    assert (tmp_path / 'RDCE2401.dbc').read_bytes() == DATA
+
+def test_manifest_ignores_missing_files(tmp_path):
+    manifest = DownloadManifest(str(tmp_path / 'manifest.json'))
+    with pytest.raises(ftplib.error_perm):
+        ftp_download(StubFTP({}), 'RDCE2401.dbc', str(tmp_path / 'RDCE2401.dbc'), manifest=manifest)
+    assert manifest.get('/dados/RDCE2401.dbc') is None
@@ -0,0 +1,51 @@
+import json
+
+from pyopensus.opensus.manifest import DownloadManifest, file_checksum
+
+def test_is_current(tmp_path):
+    local = tmp_path / 'RDCE2401.dbc'
+    local.write_bytes(b'data')
+    manifest = DownloadManifest(str(tmp_path / 'manifest.json'))
+    assert not manifest.is_current('/dados/RDCE2401.dbc', 4, '20240101', str(local))
+
+    manifest.mark_partial('/dados/RDCE2401.dbc', 4, '20240101', str(local))
+    assert not manifest.is_current('/dados/RDCE2401.dbc', 4, '20240101', str(local))
+
+    manifest.mark_complete('/dados/RDCE2401.dbc', 4, '20240101', str(local))
+    assert manifest.get('/dados/RDCE2401.dbc')['md5'] == file_checksum(str(local))
+    assert manifest.is_current('/dados/RDCE2401.dbc', 4, '20240101', str(local), verify=True)
+    assert not manifest.is_current('/dados/RDCE2401.dbc', 5, '20240101', str(local))
+    assert not manifest.is_current('/dados/RDCE2401.dbc', 4, '20240301', str(local))
+
+    local.write_bytes(b'DATA')
+    assert manifest.is_current('/dados/RDCE2401.dbc', 4, '20240101', str(local))
+    assert not manifest.is_current('/dados/RDCE2401.dbc', 4, '20240101', str(local), verify=True)
+    local.unlink()
+    assert not manifest.is_current('/dados/RDCE2401.dbc', 4, '20240101', str(local))
+
+def test_batched_writes(tmp_path):
+    path = tmp_path / 'manifest.json'
+    local = tmp_path / 'RDCE2401.dbc'
+    local.write_bytes(b'data')
+    manifest = DownloadManifest(str(path), flush_every=3, flush_interval=3600)
+
+    manifest.mark_partial('/dados/RDCE2401.dbc', 4, None, str(local))
+    manifest.mark_complete('/dados/RDCE2401.dbc', 4, None, str(local))
+    assert not path.exists()
+    manifest.mark_partial('/dados/RDCE2402.dbc', 4, None, str(local))
+    assert set(json.loads(path.read_text())) == {'/dados/RDCE2401.dbc', '/dados/RDCE2402.dbc'}
+
+    with manifest:
+        manifest.mark_complete('/dados/RDCE2402.dbc', 4, None, str(local))
+    assert DownloadManifest(str(path)).get('/dados/RDCE2402.dbc')['status'] == 'complete'
+
+def test_flush_interval(tmp_path):
+    path = tmp_path / 'manifest.json'
+    manifest = DownloadManifest(str(path), flush_every=100, flush_interval=0)
+    manifest.mark_partial('/dados/RDCE2401.dbc', 4, None, str(tmp_path / 'RDCE2401.dbc'))
+    assert path.exists()
+
+def test_load_shares_the_manifest_of_a_folder(tmp_path):
+    manifest = DownloadManifest.load(str(tmp_path))
+    assert DownloadManifest.load(str(tmp_path)) is manifest
+    assert manifest.path == str(tmp_path / 'manifest.json')
@@ -0,0 +1,74 @@
+import datetime as dt
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from pyopensus.storage.model_schema import DICTIONARY, ModelSchema
+from pyopensus.utils.DBFIX import DBFIX
+from pyopensus.utils.parquet import dbf_to_parquet
+from pyopensus.utils.utils import parse_dates
+
+def test_types_of_the_data_models():
+    types = ModelSchema('sihsus', 'RD').types
+    assert types['DT_INTER'] == pa.date32()
+    assert types['MUNIC_RES'] == DICTIONARY
+    assert types['N_AIH'] == pa.string() # -- primary key
+    assert types['VAL_TOT'] == pa.float64()
+    assert types['IDADE'] == pa.int64()
+
+    assert ModelSchema.for_file('sihsus', 'RDCE2401.dbc').preffix == 'RD'
+    assert ModelSchema.for_file('sihsus', 'ERCE2401.dbc') is None
+    with pytest.raises(Exception):
+        ModelSchema('sihsus', 'ER')
+
+def test_normalize_text_columns():
+    batch = pa.RecordBatch.from_pydict({
+        'N_AIH': ['2300000000001', '2300000000002', '2300000000003'],
+        'MUNIC_RES': ['230440', '030440', '230440'],
+        'DT_INTER': ['20240105', '2024XX01', ''],
+        'QT_DIARIAS': [' 3', 'x', None],
+        'OTHER': ['a', 'b', 'c'],
+    })
+    schema = ModelSchema('sihsus', 'RD')
+    normalized = schema.normalize(batch)
+    assert normalized.schema == schema.arrow_schema(batch.schema)
+    assert normalized.column('MUNIC_RES').type == DICTIONARY
+    assert normalized.column('MUNIC_RES').to_pylist() == ['230440', '030440', '230440']
+    assert normalized.column('DT_INTER').to_pylist() == [dt.date(2024, 1, 5), None, None]
+    assert normalized.column('QT_DIARIAS').to_pylist() == [3, None, None]
+    assert normalized.column('OTHER').type == pa.string()
+
+def test_date_formats_of_the_sources():
+    batch = pa.RecordBatch.from_pydict({'DTOBITO': ['05012024', '31122023']})
+    assert ModelSchema('sim', 'DO').normalize(batch).column('DTOBITO').to_pylist() == [dt.date(2024, 1, 5), dt.date(2023, 12, 31)]
+
+    batch = pa.RecordBatch.from_pydict({'CNES': ['0000001'], 'COMPETEN': ['202401']})
+    schema = ModelSchema('cnes', 'ST')
+    assert schema.arrow_schema(batch.schema).names == ['CNES', 'COMPETEN', 'COMPET']
+    assert schema.normalize(batch).column('COMPET').to_pylist() == [dt.date(2024, 1, 1)]
+
+def test_typed_parquet(dbf_file, tmp_path):
+    fields = [('N_AIH', 'C', 13, 0), ('MUNIC_RES', 'C', 6, 0), ('DT_INTER', 'C', 8, 0), ('NASC', 'D', 8, 0),
+              ('VAL_TOT', 'N', 14, 2), ('IDADE', 'N', 2, 0)]
+    records = [['2300000000001', '230440', '20240105', '19800101', '10.50', '3'],
+               ['2300000000002', '230730', '', '', '7.25', '']]
+    path = dbf_file(fields, records)
+
+    nrows = dbf_to_parquet(DBFIX(path), str(tmp_path / 'typed.parquet'), normalizer=ModelSchema('sihsus', 'RD'))
+    table = pq.read_table(str(tmp_path / 'typed.parquet'))
+    assert nrows == 2
+    assert [ table.schema.field(name).type for name in ['DT_INTER', 'NASC', 'VAL_TOT', 'IDADE'] ] == \
+           [pa.date32(), pa.date32(), pa.float64(), pa.int64()]
+    assert table.schema.field('MUNIC_RES').type == DICTIONARY
+
+    df = table.to_pandas()
+    assert parse_dates(df['DT_INTER'], format='%Y%m%d').tolist()[0] == pd.Timestamp(2024, 1, 5)
+    assert parse_dates(df['DT_INTER'], format='%Y%m%d').isna().tolist() == [False, True]
+
+def test_parse_dates():
+    dates = pd.Series(pd.to_datetime(['2024-01-05', None]))
+    assert parse_dates(dates) is dates
+    assert parse_dates(pd.Series(['20240105', ''])).isna().tolist() == [False, True]
+    assert parse_dates(pd.Series(['05012024']), format='%d%m%Y')[0] == pd.Timestamp(2024, 1, 5)
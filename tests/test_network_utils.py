@@ -0,0 +1,61 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from pyopensus.storage.warehouse_sus import WarehouseSIH
+from pyopensus.utils import network_utils
+from pyopensus.utils.db_utils import perform_query
+
+START, END = dt.datetime(2024, 1, 1), dt.datetime(2024, 1, 31)
+
+@pytest.fixture
+def engine(tmp_path):
+    warehouse = WarehouseSIH(f"sqlite:///{tmp_path / 'sih.db'}")
+    warehouse.db_init()
+    admissions = [
+        # -- N_AIH, MUNIC_RES, MUNIC_MOV, CNES, DIAG_PRINC, VAL_TOT, DT_INTER
+        ('A', '230440', '230440', '0000001', 'A09', 10.5, dt.datetime(2024, 1, 1)),
+        ('B', '230440', '230440', '0000001', 'A09', 2.0, dt.datetime(2024, 1, 31)),
+        ('C', '230440', '230730', '0000002', 'J189', 7.25, dt.datetime(2024, 1, 10)),
+        ('D', '230730', '230440', '0000001', 'J180', 1.0, dt.datetime(2024, 1, 12)),
+        ('E', '230730', '230440', '0000003', 'I219', 3.0, dt.datetime(2024, 1, 20)),
+        ('F', '230440', '230730', '0000002', 'A09', 100.0, dt.datetime(2024, 2, 1)),
+    ]
+    df = pd.DataFrame({ col: ['1']*len(admissions) for col in warehouse.mappings['aih_reduzida'] })
+    for index, col in enumerate(['N_AIH', 'MUNIC_RES', 'MUNIC_MOV', 'CNES', 'DIAG_PRINC', 'VAL_TOT', 'DT_INTER']):
+        df[col] = [ record[index] for record in admissions ]
+    df['NASC'], df['DT_SAIDA'] = dt.datetime(1980, 1, 1), dt.datetime(2024, 2, 2)
+    warehouse.bulk_insert('aih_reduzida', df)
+    return warehouse.engine
+
+def pandas_edgelist(engine, nodes, diag_level):
+    '''
+        Edgelist built in pandas from every admission of the period, as before 'aggregate_edges'.
+    '''
+    df = network_utils.select_period_aih(engine, START, END, diag_level=diag_level)
+    edgelist = df.groupby(nodes)['DIAG_CATEG'].value_counts().reset_index()
+    edgelist = pd.pivot_table(edgelist, index=nodes, columns='DIAG_CATEG', values='count').fillna(0)
+    edgelist['SOMA'] = edgelist.apply(sum, axis=1)
+    return edgelist
+
+@pytest.mark.parametrize('network', ['c2c', 'c2h'])
+@pytest.mark.parametrize('diag_level', [0, 1, 3])
+def test_aggregate_edges_matches_pandas(engine, network, diag_level):
+    nodes = network_utils.EDGE_NODES[network]
+    edges = network_utils.aggregate_edges(engine, START, END, network=network, diag_level=diag_level)
+    assert edges['WEIGHT'].sum() == 5
+    pd.testing.assert_frame_equal(network_utils.pivot_edges(edges, nodes), pandas_edgelist(engine, nodes, diag_level),
+                                  check_dtype=False, check_names=False)
+
+def test_aggregate_edges_money(engine):
+    edges = network_utils.aggregate_edges(engine, START, END, network='c2c', diag_level=1, mode='money')
+    edges = edges.set_index(['MUNIC_RES', 'MUNIC_MOV', 'DIAG_CATEG'])['WEIGHT'].to_dict()
+    assert edges == {('230440', '230440', 'A'): 12.5, ('230440', '230730', 'J'): 7.25,
+                     ('230730', '230440', 'J'): 1.0, ('230730', '230440', 'I'): 3.0}
+
+def test_empty_period(engine):
+    edges = network_utils.aggregate_edges(engine, dt.datetime(2020, 1, 1), dt.datetime(2020, 12, 31))
+    assert edges.shape[0] == 0
+    assert list(edges.columns) == ['MUNIC_RES', 'MUNIC_MOV', 'DIAG_CATEG', 'WEIGHT']
+    assert list(perform_query('SELECT N_AIH, CNES FROM aih_reduzida WHERE 0', engine).columns) == ['N_AIH', 'CNES']
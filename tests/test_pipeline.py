@@ -0,0 +1,51 @@
+import pytest
+
+from pyopensus.storage.pipeline import ingest_files
+from pyopensus.storage.warehouse_sus import WarehouseSIH
+from tests.test_warehouse import admissions, stored
+
+@pytest.fixture
+def warehouse(tmp_path):
+    warehouse = WarehouseSIH(f"sqlite:///{tmp_path / 'sih.db'}")
+    warehouse.db_init()
+    return warehouse
+
+def prepare(keys):
+    # -- runs in the worker processes
+    if 'corrupted' in keys:
+        raise ValueError('corrupted file')
+    return keys
+
+def tasks_of(files):
+    return [ {'source': source, 'tables': ['aih_reduzida'], 'checksum': None, 'args': (keys,)} for source, keys in files ]
+
+FILES = [('RDCE2401', ['A', 'B']), ('RDCE2402', ['corrupted']), ('RDCE2403', ['C', 'A']), ('RDCE2404', ['D'])]
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_ingest_files(warehouse, n_workers):
+    def write(keys, task, conn):
+        return warehouse.bulk_insert('aih_reduzida', admissions(warehouse, keys), conn=conn)['inserted']
+
+    summary = ingest_files(warehouse, tasks_of(FILES), prepare, write, n_workers=n_workers)
+    assert summary['SOURCE'].tolist() == ['RDCE2401', 'RDCE2402', 'RDCE2403', 'RDCE2404']
+    assert summary['STATUS'].tolist() == ['completed', 'failed', 'failed', 'completed']
+    assert summary['NROWS'].tolist()[0] == 2
+    assert 'corrupted file' in summary['ERROR'][1]
+    assert 'IntegrityError' in summary['ERROR'][2]
+    # -- the duplicated key rolls back the whole file
+    assert list(stored(warehouse)) == ['A', 'B', 'D']
+    assert warehouse.ledger('RDCE2403')['STATUS'].tolist() == ['failed']
+
+    summary = ingest_files(warehouse, tasks_of(FILES), prepare, write, n_workers=n_workers)
+    assert summary['STATUS'].tolist() == ['skipped', 'failed', 'failed', 'skipped']
+
+def test_results_are_kept_per_task(warehouse):
+    # -- files of different folders with the same name
+    def write(keys, task, conn):
+        return warehouse.bulk_insert('aih_reduzida', admissions(warehouse, keys), on_conflict='ignore', conn=conn)['inserted']
+
+    files = [('RDCE2401', ['A', 'B']), ('RDCE2401', ['B', 'C', 'D'])]
+    summary = ingest_files(warehouse, tasks_of(files), prepare, write, n_workers=1, force=True)
+    assert summary['STATUS'].tolist() == ['completed', 'completed']
+    assert summary['NROWS'].tolist() == [2, 2]
+    assert list(stored(warehouse)) == ['A', 'B', 'C', 'D']
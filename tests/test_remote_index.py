@@ -0,0 +1,86 @@
+import ftplib
+import time
+
+import pytest
+
+import pyopensus.opensus.opensus as opensus
+from pyopensus.opensus.remote_index import RemoteIndex, list_directory
+
+LISTING = {
+    '/dissemin/publicos/SIASUS/200801_/Dados/': [
+        ('.', {'type': 'cdir'}),
+        ('PACE2401a.dbc', {'type': 'file', 'size': '100', 'modify': '20240301120000'}),
+        ('PACE2401b.dbc', {'type': 'file', 'size': '50', 'modify': '20240301120000'}),
+        ('PACE2402.dbc', {'type': 'file', 'size': '70', 'modify': '20240401120000'}),
+        ('ABOCE2401.dbc', {'type': 'file', 'size': '10', 'modify': '20240301120000'}),
+        ('old', {'type': 'dir'}),
+    ],
+}
+
+class StubFTP:
+    '''
+        FTP connection listing the directories of 'LISTING', with or without 'MLSD'.
+    '''
+    mlsd_supported = True
+    listings = 0
+
+    def __init__(self, host=None):
+        pass
+
+    def login(self):
+        pass
+
+    def pwd(self):
+        return '/'
+
+    def mlsd(self, path, facts=None):
+        StubFTP.listings += 1
+        if not StubFTP.mlsd_supported:
+            raise ftplib.error_perm('500 MLSD not understood')
+        return iter(LISTING[path])
+
+    def nlst(self, path):
+        StubFTP.listings += 1
+        return [ f'{path}{name}' for name, facts in LISTING[path] if facts['type'] == 'file' ]
+
+@pytest.fixture
+def stub_ftp(monkeypatch):
+    StubFTP.mlsd_supported, StubFTP.listings = True, 0
+    monkeypatch.setattr(opensus, 'FTP', StubFTP)
+    return StubFTP
+
+def test_list_directory(stub_ftp):
+    entries = list_directory(StubFTP(), '/dissemin/publicos/SIASUS/200801_/Dados/')
+    assert entries['PACE2401a.dbc'] == {'type': 'file', 'size': 100, 'modify': '20240301120000'}
+    assert '.' not in entries
+
+    stub_ftp.mlsd_supported = False
+    entries = list_directory(StubFTP(), '/dissemin/publicos/SIASUS/200801_/Dados/')
+    assert sorted(entries) == ['ABOCE2401.dbc', 'PACE2401a.dbc', 'PACE2401b.dbc', 'PACE2402.dbc']
+    assert entries['PACE2402.dbc']['size'] is None
+
+def test_lookup(stub_ftp, tmp_path):
+    index = RemoteIndex('siasus', str(tmp_path / 'index.json')).build(StubFTP(), '/dissemin/publicos/SIASUS/200801_/Dados/')
+    assert len(index) == 4
+    assert [ entry['name'] for entry in index.lookup('PA', 'CE', 2024, '01') ] == ['PACE2401a.dbc', 'PACE2401b.dbc']
+    assert index.exists('ABO', 'CE', 2024, '01')
+    assert not index.exists('PA', 'CE', 2024, '03')
+    assert 'pace2402.dbc' in index
+    assert index.size('PACE2402') == 70
+    assert index.info('PACE2403') is None
+
+def test_stored_index_is_reused_until_it_expires(stub_ftp, tmp_path):
+    session = opensus.Opensus()
+    index = session.index('siasus', cache_dir=str(tmp_path))
+    assert stub_ftp.listings == 1
+    assert (tmp_path / 'index_siasus.json').exists()
+
+    index = session.index('siasus', cache_dir=str(tmp_path))
+    assert stub_ftp.listings == 1
+    assert [ entry['name'] for entry in index.lookup('PA', 'CE', 2024, '01') ] == ['PACE2401a.dbc', 'PACE2401b.dbc']
+
+    session.index('siasus', cache_dir=str(tmp_path), refresh=True)
+    assert stub_ftp.listings == 2
+    time.sleep(0.01)
+    session.index('siasus', cache_dir=str(tmp_path), ttl=0)
+    assert stub_ftp.listings == 3
@@ -0,0 +1,23 @@
+import pytest
+
+from pyopensus.utils.utils import build_filename, parse_filename
+
+@pytest.mark.parametrize('origin, filename, expected', [
+    ('sihsus', 'RDCE2401.dbc', ('RD', 'CE', 2024, '01')),
+    ('siasus', 'ABOCE2401.dbc', ('ABO', 'CE', 2024, '01')),
+    ('siasus', 'PASP2401b.dbc', ('PA', 'SP', 2024, '01')),
+    ('cnes', 'STCE9912', ('ST', 'CE', 1999, '12')),
+    ('sim', 'DOCE2023.dbc', ('DO', 'CE', 2023, None)),
+    ('sinan', 'DENGBR24.dbc', ('DENG', 'BR', 2024, None)),
+])
+def test_parse_filename(origin, filename, expected):
+    parts = parse_filename(origin, filename)
+    assert (parts['preffix'], parts['uf'], parts['year'], parts['month']) == expected
+
+def test_parse_filename_inverse_of_build_filename():
+    filename = build_filename('siasus', 'ACF', 'MG', 2023, '07')
+    assert parse_filename('siasus', filename)['preffix'] == 'ACF'
+
+def test_parse_filename_outside_convention():
+    with pytest.raises(Exception):
+        parse_filename('sihsus', 'RD2401.dbc')
@@ -0,0 +1,277 @@
+import datetime as dt
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from pyopensus.storage.warehouse_sus import WarehouseSIH
+from pyopensus.utils import db_utils
+
+@pytest.fixture
+def warehouse(tmp_path):
+    warehouse = WarehouseSIH(f"sqlite:///{tmp_path / 'sih.db'}")
+    warehouse.db_init()
+    return warehouse
+
+def admissions(warehouse, keys, **values):
+    '''
+        Records of 'aih_reduzida' with the given N_AIH (one admission per key).
+    '''
+    df = pd.DataFrame({ col: ['1']*len(keys) for col in warehouse.mappings['aih_reduzida'] })
+    df['N_AIH'] = keys
+    df['MUNIC_RES'] = '230440'
+    df['FONTE'] = 'RDCE2401'
+    for col in ['NASC', 'DT_INTER', 'DT_SAIDA']:
+        df[col] = dt.datetime(2024, 1, 15)
+    for col, value in values.items():
+        df[col] = value
+    return df
+
+def stored(warehouse, col='MUNIC_RES'):
+    df = pd.concat(list(warehouse.iter_query('aih_reduzida', columns=['N_AIH', col], order_by='N_AIH')))
+    return dict(zip(df['N_AIH'], df[col]))
+
+# -- conflict modes
+
+def test_bulk_insert_ignore(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']))
+    counts = warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['B', 'C'], MUNIC_RES='230730'), on_conflict='ignore')
+    assert counts == {'inserted': 1, 'skipped': 1, 'updated': 0}
+    assert stored(warehouse) == {'A': '230440', 'B': '230440', 'C': '230730'}
+
+def test_bulk_insert_update(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']))
+    counts = warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['B', 'C'], MUNIC_RES='230730'), on_conflict='update')
+    assert counts == {'inserted': 1, 'skipped': 0, 'updated': 1}
+    assert stored(warehouse) == {'A': '230440', 'B': '230730', 'C': '230730'}
+
+def test_insert_default_mode_ignores_duplicates(warehouse):
+    warehouse.insert('aih_reduzida', admissions(warehouse, ['A', 'B']), verbose=False)
+    counts = warehouse.insert('aih_reduzida', admissions(warehouse, ['B', 'C']), verbose=False)
+    assert counts == {'inserted': 1, 'skipped': 1, 'updated': 0}
+    with pytest.raises(IntegrityError):
+        warehouse.insert('aih_reduzida', admissions(warehouse, ['C']), on_conflict='error', verbose=False)
+
+def test_insert_default_mode_skips_other_integrity_errors(warehouse):
+    counts = warehouse.insert('aih_reduzida', admissions(warehouse, [None, 'A']), verbose=False)
+    assert counts == {'inserted': 0, 'skipped': 2, 'updated': 0}
+    assert warehouse.number_of_records('aih_reduzida') == 0
+
+def test_insert_conflict_modes(warehouse):
+    warehouse.insert('aih_reduzida', admissions(warehouse, ['A', 'B']), verbose=False)
+    counts = warehouse.insert('aih_reduzida', admissions(warehouse, ['B', 'C'], MUNIC_RES='230730'), on_conflict='update', batchsize=1,
+                              verbose=False)
+    assert counts == {'inserted': 1, 'skipped': 0, 'updated': 1}
+    counts = warehouse.insert('aih_reduzida', admissions(warehouse, ['A', 'D']), on_conflict='ignore', verbose=False)
+    assert counts == {'inserted': 1, 'skipped': 1, 'updated': 0}
+    assert stored(warehouse) == {'A': '230440', 'B': '230730', 'C': '230730', 'D': '230440'}
+
+def test_conflict_mode_not_supported(warehouse):
+    with pytest.raises(Exception):
+        warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A']), on_conflict='replace')
+
+# -- bulk insertion
+
+def test_bulk_insert_error_rolls_back(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']))
+    with pytest.raises(IntegrityError):
+        warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['C', 'A']), batchsize=1)
+    assert list(stored(warehouse)) == ['A', 'B']
+
+def test_bulk_insert_missing_values(warehouse):
+    df = admissions(warehouse, ['A', 'B', 'C'], VAL_TOT=[10.5, np.nan, None], CID_MORTE=['I219', None, np.nan])
+    df['DT_SAIDA'] = [dt.datetime(2024, 1, 20), pd.NaT, None]
+    counts = warehouse.bulk_insert('aih_reduzida', df, batchsize=2)
+    assert counts == {'inserted': 3, 'skipped': 0, 'updated': 0}
+
+    df = pd.concat(list(warehouse.iter_query('aih_reduzida', columns=['N_AIH', 'VAL_TOT', 'CID_MORTE', 'DT_SAIDA'], order_by='N_AIH')))
+    assert df['VAL_TOT'].isna().tolist() == [False, True, True]
+    assert df['CID_MORTE'].isna().tolist() == [False, True, True]
+    assert df['DT_SAIDA'].tolist()[0] == pd.Timestamp(2024, 1, 20)
+    assert df['DT_SAIDA'].isna().tolist() == [False, True, True]
+
+def test_bulk_insert_frames_in_one_transaction(warehouse):
+    with pytest.raises(IntegrityError):
+        with warehouse.engine.begin() as conn:
+            warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']), conn=conn)
+            warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['C', 'A']), conn=conn)
+    assert warehouse.number_of_records('aih_reduzida') == 0
+
+    with warehouse.engine.begin() as conn:
+        warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']), conn=conn)
+        warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['C']), conn=conn)
+    assert list(stored(warehouse)) == ['A', 'B', 'C']
+
+# -- connection profiles
+
+def synchronous(warehouse):
+    with warehouse._engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA synchronous").scalar()
+
+def test_profiles_of_warehouses_sharing_the_engine(warehouse, tmp_path):
+    other = WarehouseSIH(f"sqlite:///{tmp_path / 'sih.db'}")
+    assert other._shared_engine is warehouse._shared_engine
+
+    warehouse.set_profile('ingest')
+    assert (warehouse.profile, other.profile) == ('ingest', 'read')
+    assert synchronous(warehouse) == 0 # -- OFF
+    assert synchronous(other) == 1 # -- NORMAL
+    with pytest.raises(Exception):
+        warehouse.set_profile('fast')
+
+def test_use_profile_is_per_thread(warehouse):
+    profiles = []
+    started, done = threading.Event(), threading.Event()
+    def reader():
+        started.wait()
+        profiles.append((warehouse.profile, synchronous(warehouse)))
+        done.set()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    with warehouse.use_profile('ingest'):
+        assert synchronous(warehouse) == 0
+        started.set()
+        done.wait()
+    thread.join()
+    assert profiles == [('read', 1)]
+    assert warehouse.profile == 'read'
+
+# -- ingest ledger
+
+def test_ingest_file_registers_source(warehouse):
+    with warehouse.ingest_file('data/RDCE2401.dbc', ['aih_reduzida'], checksum='abc') as load:
+        warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']), conn=load['conn'])
+        load['nrows'] += 2
+
+    assert warehouse.is_loaded('RDCE2401', 'aih_reduzida')
+    assert warehouse.is_loaded('rdce2401.parquet', ['aih_reduzida'], checksum='abc')
+    assert not warehouse.is_loaded('RDCE2401', 'aih_reduzida', checksum='def')
+    assert not warehouse.is_loaded('RDCE2401', ['aih_reduzida', 'servicos_profissionais'])
+    ledger = warehouse.ledger('RDCE2401.dbc')
+    assert ledger[['SOURCE', 'NROWS', 'STATUS']].values.tolist() == [['RDCE2401', 2, 'completed']]
+
+def test_ingest_file_failure_rolls_back(warehouse):
+    with pytest.raises(ValueError):
+        with warehouse.ingest_file('RDCE2402', 'aih_reduzida') as load:
+            warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A']), conn=load['conn'])
+            raise ValueError('corrupted file')
+
+    assert warehouse.number_of_records('aih_reduzida') == 0
+    assert not warehouse.is_loaded('RDCE2402', 'aih_reduzida')
+    assert warehouse.ledger('RDCE2402')['STATUS'].tolist() == ['failed']
+
+# -- record counts
+
+def test_record_counts(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B', 'C']))
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['C', 'D']), on_conflict='ignore')
+    warehouse.delete_many('aih_reduzida', keys=['A'])
+    assert warehouse.stored_count('aih_reduzida') == 3
+
+    stats = warehouse.statistics(['aih_reduzida'])
+    assert stats[['NROWS', 'PERIOD_COLUMN']].values.tolist() == [[3, 'DT_INTER']]
+    assert stats['MIN_DATE'][0] == dt.datetime(2024, 1, 15)
+
+# -- batched queries
+
+def test_iter_query_batches(warehouse):
+    df = admissions(warehouse, ['A', 'B', 'C', 'D', 'E'], VAL_TOT=10.5, IDADE='30')
+    df['MUNIC_RES'] = ['230440', '230730', '230440', '230440', '231290']
+    df['DT_INTER'] = [ dt.datetime(2024, month, 15) for month in [1, 2, 3, 4, 5] ]
+    warehouse.bulk_insert('aih_reduzida', df)
+
+    batches = list(warehouse.iter_query('aih_reduzida', columns=['N_AIH', 'MUNIC_RES', 'VAL_TOT', 'IDADE', 'DT_INTER'],
+                                        batch_size=2, order_by='N_AIH'))
+    assert [ batch.shape[0] for batch in batches ] == [2, 2, 1]
+    assert batches[0]['N_AIH'].tolist() == ['A', 'B']
+    assert [ str(batches[0][col].dtype) for col in ['VAL_TOT', 'IDADE'] ] == ['float64', 'Int64']
+    assert batches[0]['DT_INTER'].dtype.kind == 'M'
+
+    batches = warehouse.iter_query('aih_reduzida', columns=['N_AIH'], filters=[('MUNIC_RES', '==', '230440')],
+                                   period=[dt.datetime(2024, 2, 1), dt.datetime(2024, 3, 31)])
+    assert pd.concat(list(batches))['N_AIH'].tolist() == ['C']
+
+    batches = list(warehouse.iter_query('aih_reduzida', columns=['N_AIH', 'MUNIC_RES'], batch_size=3, as_arrow=True,
+                                        order_by=['MUNIC_RES', 'N_AIH'], filters=[('N_AIH', 'not in', ['A'])]))
+    assert [ batch.num_rows for batch in batches ] == [3, 1]
+    assert batches[0].column('N_AIH').to_pylist() == ['C', 'D', 'B']
+
+def test_db_utils_iter_query(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B', 'C']))
+    query = "SELECT N_AIH, MUNIC_RES FROM aih_reduzida WHERE N_AIH != :key ORDER BY N_AIH"
+    batches = list(db_utils.iter_query(query, warehouse._engine, batchsize=1, params={'key': 'B'}))
+    assert [ batch['N_AIH'].tolist() for batch in batches ] == [['A'], ['C']]
+    assert db_utils.perform_query(query, warehouse._engine, params={'key': 'A'})['N_AIH'].tolist() == ['B', 'C']
+
+    # -- a query without rows still gives the columns of the result
+    empty = "SELECT N_AIH, MUNIC_RES FROM aih_reduzida WHERE N_AIH = :key"
+    batches = list(db_utils.iter_query(empty, warehouse._engine, params={'key': 'X'}))
+    assert len(batches) == 1
+    assert batches[0].shape == (0, 2) and batches[0].columns.tolist() == ['N_AIH', 'MUNIC_RES']
+    assert list(db_utils.iter_query(empty, warehouse._engine, params={'key': 'X'}, as_arrow=True))[0].schema.names == \
+           ['N_AIH', 'MUNIC_RES']
+
+# -- bulk deletes and updates
+
+def test_delete_many(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B', 'C', 'D']))
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['E'], FONTE='RDCE2402'))
+
+    assert warehouse.delete_many('aih_reduzida', keys=['A', 'C', 'X']) == 2
+    assert warehouse.delete_many('aih_reduzida', keys=pd.DataFrame({'N_AIH': ['B', 'E']}), filters=[('FONTE', '==', 'RDCE2402')]) == 1
+    assert list(stored(warehouse)) == ['B', 'D']
+    with pytest.raises(Exception):
+        warehouse.delete_many('aih_reduzida')
+
+def test_update_many(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B', 'C']))
+
+    new_values = pd.DataFrame({'N_AIH': ['A', 'C', 'X'], 'MUNIC_RES': ['230730', '231290', '230730']})
+    assert warehouse.update_many('aih_reduzida', data_df=new_values) == 2
+    assert stored(warehouse) == {'A': '230730', 'B': '230440', 'C': '231290'}
+
+    assert warehouse.update_many('aih_reduzida', values={'CAR_INT': '02'}, filters=[('MUNIC_RES', '==', '230440')]) == 1
+    assert stored(warehouse, 'CAR_INT') == {'A': '1', 'B': '02', 'C': '1'}
+
+# -- transactions
+
+def test_transaction_commit(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']))
+    with warehouse.transaction():
+        warehouse.delete_many('aih_reduzida', filters=[('FONTE', '==', 'RDCE2401')])
+        warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['C']))
+        assert warehouse.number_of_records('aih_reduzida') == 1
+    assert list(stored(warehouse)) == ['C']
+
+def test_transaction_rollback(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']))
+    with pytest.raises(ValueError):
+        with warehouse.transaction():
+            warehouse.delete_many('aih_reduzida', keys=['A'])
+            with warehouse.transaction():
+                warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['C']))
+            raise ValueError
+    assert list(stored(warehouse)) == ['A', 'B']
+    assert warehouse.stored_count('aih_reduzida') == 2
+
+def test_transaction_with_insert_and_update(warehouse):
+    warehouse.bulk_insert('aih_reduzida', admissions(warehouse, ['A', 'B']))
+    with warehouse.transaction():
+        warehouse.delete_many('aih_reduzida', keys=['A'])
+        warehouse.insert('aih_reduzida', admissions(warehouse, ['C']), verbose=False)
+        warehouse.update('aih_reduzida', 'B', {'MUNIC_RES': '230730'}, verbose=False)
+        warehouse.drop_indexes(['aih_reduzida'])
+        warehouse.create_indexes(['aih_reduzida'])
+    assert stored(warehouse) == {'B': '230730', 'C': '230440'}
+
+    with pytest.raises(ValueError):
+        with warehouse.transaction():
+            warehouse.delete_many('aih_reduzida', keys=['B'])
+            warehouse.insert('aih_reduzida', admissions(warehouse, ['D']), verbose=False)
+            warehouse.update('aih_reduzida', 'C', {'MUNIC_RES': '231290'}, verbose=False)
+            raise ValueError
+    assert stored(warehouse) == {'B': '230730', 'C': '230440'}
+    assert warehouse.stored_count('aih_reduzida') == 2
@@ -7,6 +7,8 @@ import logging
 
 sys.path.append("..")
 from pyopensus.storage.whandler_sus import HandlerSIM
+from pyopensus.opensus.manifest import file_checksum
+from pyopensus.utils.utils import parse_dates
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -64,7 +66,7 @@ def load_SIM_file(parque_filename):
     df = pd.read_parquet(parque_filename, engine="fastparquet")
 
     for col in date_columns:
-        df[col] = pd.to_datetime(df[col], format="%d%m%Y", errors="coerce")
+        df[col] = parse_dates(df[col], format="%d%m%Y")
 
     for col in hour_columns:
         df[col] = df[col].astype(str).str.strip()
@@ -125,9 +127,17 @@ def inject_parque_files(year, uf, injector):
     group = ["CID10"]
     parquet_files = get_files(group, year, uf,local_dir)
     # inject into database
+    warehouse = injector.warehouse
     for filename in parquet_files:
+        # -- files registered in the ingest ledger were completely loaded before
+        checksum = file_checksum(filename)
+        if warehouse.is_loaded(filename.stem, "sim", checksum):
+            logger.info(f"{filename.stem} already loaded, skipped.")
+            continue
         df = load_SIM_file(filename)
-        injector.insert_sim(df,filename.stem)
+        with warehouse.ingest_file(filename.stem, "sim", checksum) as load:
+            injector.insert_sim(df, filename.stem, conn=load["conn"])
+            load["nrows"] = df.shape[0]
 
     logger.info(f"injected in  {injector.warehouse_name.stem}")
     return 1
@@ -16,15 +16,21 @@ if not logger.handlers:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 from pyopensus.storage.whandler_sus import HandlerSIH
+from pyopensus.utils.utils import parse_dates
 
 
-def load_SIH_file(data_filename):
+def load_SIH_file(data_filename, preffix=None):
     """Load a SIH RD/CE parquet file, add metadata columns, and parse date fields.
 
+    Runs in the worker processes of `HandlerSIH.ingest_sih_files` (see `prepare`), so
+    it must stay defined at module level.
+
     Parameters
     ----------
     data_filename : str or pathlib.Path
         Path to the parquet file to load.
+    preffix : str, optional
+        'RD', 'SP' or 'RJ'. If None, taken from the name of the file.
 
     Returns
     -------
@@ -32,7 +38,7 @@ def load_SIH_file(data_filename):
         Loaded data with `FONTE`, `SEQUENCIA`, and parsed date columns.
     """
 
-    prefix = Path(data_filename).stem[:2]
+    prefix = preffix or Path(data_filename).stem[:2]
     uf = Path(data_filename).stem[2:4]
     mes_ano = Path(data_filename).stem
     mes_ano = mes_ano.replace(prefix, "").replace(uf, "")
@@ -49,39 +55,44 @@ def load_SIH_file(data_filename):
     # date columns...
     if prefix != "SP":
         for col in ["NASC", "DT_INTER", "DT_SAIDA"]:
-            df[col] = pd.to_datetime(df[col], format="%Y%m%d", errors="coerce")
+            df[col] = parse_dates(df[col], format="%Y%m%d")
     return df
 
 
-sih = SIH().load()
-# %%
-prefix_list = ["RD", "RJ", "SP"]
-uf_list = ["CE"]
-year_list = [2019]
-month_list = [1]
-
-
-data_folder = Path.home().joinpath("Workspace", "pyopensus", "data")
-base_folder = Path.joinpath(data_folder, "sihsus")
-parquet_location = base_folder
-files = sih.get_files(prefix_list, uf=uf_list, year=year_list, month=month_list)
-filenames = [parquet_location.joinpath(str(f).replace("dbc", "parquet")) for f in files]
-for f in filenames:
-    print(f, f.exists())
-
-warehouse_name = f"SIHSUS_{uf_list[0]}_{year_list[0]}-{year_list[-1]}.db"
-
-logger.info(warehouse_name)
-# %%
-warehouse_location = Path.joinpath(data_folder, "opendatasus")
-warehouse_injector = HandlerSIH(warehouse_location, warehouse_name)
-logger.info(warehouse_location.joinpath(warehouse_name).relative_to(Path.cwd().parent))
-
-for current_file in tqdm(filenames):
-    fname = current_file.stem
-    prefix = fname[:2]
-    cur_df = load_SIH_file(current_file)
-    warehouse_injector.insert_sih(cur_df, fname, prefix)
+# -- the worker processes reading the files may import this script again (spawn/forkserver):
+# -- only the definitions above run on import
+if __name__ == "__main__":
+    sih = SIH().load()
+    # %%
+    prefix_list = ["RD", "RJ", "SP"]
+    uf_list = ["CE"]
+    year_list = [2019]
+    month_list = [1]
+
+
+    data_folder = Path.home().joinpath("Workspace", "pyopensus", "data")
+    base_folder = Path.joinpath(data_folder, "sihsus")
+    parquet_location = base_folder
+    files = sih.get_files(prefix_list, uf=uf_list, year=year_list, month=month_list)
+    filenames = [parquet_location.joinpath(str(f).replace("dbc", "parquet")) for f in files]
+    for f in filenames:
+        print(f, f.exists())
+
+    warehouse_name = f"SIHSUS_{uf_list[0]}_{year_list[0]}-{year_list[-1]}.db"
+
+    logger.info(warehouse_name)
+    # %%
+    warehouse_location = Path.joinpath(data_folder, "opendatasus")
+    warehouse_injector = HandlerSIH(warehouse_location, warehouse_name)
+    logger.info(warehouse_location.joinpath(warehouse_name).relative_to(Path.cwd().parent))
+
+    # -- indexes are rebuilt once, after all files are loaded; files are read in parallel
+    # -- (with the transform of this workflow: 'FONTE' is the month/year of the file),
+    # -- inserted by a single writer and registered in the ingest ledger (loaded files are skipped)
+    warehouse = warehouse_injector.warehouse
+    with warehouse.use_profile("ingest"), warehouse.deferred_indexes():
+        summary = warehouse_injector.ingest_sih_files(filenames, prepare=load_SIH_file, verbose=True)
+    logger.info(summary)
 # %%
 
 # %%